@@ -0,0 +1,100 @@
+"""
+bench_charts.py
+Mide gráficos por segundo de charts.py en un solo proceso: solo la construcción de
+la figura (tema + barras/sectores) y la construcción más el PNG en memoria.
+
+Si seaborn está instalado, compara además con la implementación anterior
+(sns.set_theme + sns.barplot en cada gráfico). seaborn ya no es dependencia del
+proyecto: esa columna solo aparece si se instala aparte.
+
+Uso (desde la carpeta del proyecto):
+    python benchmarks/bench_charts.py --seconds 5 --dpi 100
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lazy_imports import pyplot  # noqa: E402
+
+pyplot()
+
+from charts import bar_chart_exam, exam_theme, figure_bytes, pie_chart_exam  # noqa: E402
+
+CATEGORIAS = ["Correctas", "Incorrectas", "Sin responder", "Parciales", "Anuladas"]
+VALORES = [18, 7, 3, 2, 1]
+
+
+def _charts_per_second(render, seconds):
+    render()  # calentamiento (fuentes, caché de texto)
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        render()
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def _legacy_bar():
+    """Implementación anterior: tema global de seaborn y sns.barplot en cada llamada."""
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    plt = pyplot()
+    sns.set_theme(context="paper", style="whitegrid", font="DejaVu Sans")
+    sns.set_palette(sns.color_palette("colorblind"))
+    plt.rcParams.update({"axes.spines.top": False, "axes.spines.right": False, "grid.linewidth": 0.6,
+                         "grid.alpha": 0.45, "savefig.bbox": "tight", "legend.frameon": False})
+    fig = Figure(figsize=(150 / 25.4, 95 / 25.4))
+    ax = fig.subplots()
+    sns.barplot(x=CATEGORIAS, y=VALORES, ax=ax, edgecolor="black", linewidth=0.7)
+    for p in ax.patches:
+        ax.annotate(f"{p.get_height():g}", (p.get_x() + p.get_width() / 2, p.get_height()),
+                    ha="center", va="bottom", fontsize=9, xytext=(0, 3), textcoords="offset points")
+    return fig
+
+
+def _themed_png(fig, dpi):
+    # Como render_pool: el tema sigue activo mientras se dibuja
+    with exam_theme():
+        return figure_bytes(fig, dpi=dpi)
+
+
+def _png(fig, dpi):
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0, help="duración de cada medición")
+    parser.add_argument("--dpi", type=int, default=100)
+    args = parser.parse_args()
+
+    def bar():
+        return bar_chart_exam(CATEGORIAS, VALORES, titulo="Resultados", salida=None)[0]
+
+    def pie():
+        return pie_chart_exam(CATEGORIAS, VALORES, titulo="Resultados", salida=None)[0]
+
+    cases = [("barras", bar, _themed_png), ("donut", pie, _themed_png)]
+    try:
+        import seaborn  # noqa: F401
+
+        cases.append(("barras (seaborn, anterior)", _legacy_bar, _png))
+    except ImportError:
+        pass
+
+    print(f"{'gráfico':<30}{'figura/s':>10}{'ms':>8}{'figura+PNG/s':>14}{'ms':>8}")
+    for name, build, serialize in cases:
+        built = _charts_per_second(build, args.seconds)
+        full = _charts_per_second(lambda: serialize(build(), dpi=args.dpi), args.seconds)
+        print(f"{name:<30}{built:>10.1f}{1000 / built:>8.1f}{full:>14.1f}{1000 / full:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
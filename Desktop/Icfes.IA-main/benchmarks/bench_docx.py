@@ -0,0 +1,138 @@
+"""
+bench_docx.py
+Mide la extracción de texto de exámenes en Word (.docx) con document_text.extract_docx_text.
+
+Genera un examen sintético: por cada pregunta un enunciado y una tabla de opciones
+con una fila de encabezado combinada horizontalmente (gridSpan) y una columna
+combinada verticalmente (vMerge). Si python-docx está instalado, compara además
+con la implementación anterior (modelo de objetos de python-docx, table.rows/row.cells
+y concatenación con +=). python-docx ya no es dependencia del proyecto: esa fila
+solo aparece si se instala aparte.
+
+Uso (desde la carpeta del proyecto):
+    python benchmarks/bench_docx.py --questions 200 400 800 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_text import extract_docx_text  # noqa: E402
+
+_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def _p(text):
+    return f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(text)}</w:t></w:r></w:p>"
+
+
+def _tc(text, span=1, v_merge=None):
+    props = ""
+    if span > 1:
+        props += f'<w:gridSpan w:val="{span}"/>'
+    if v_merge == "restart":
+        props += '<w:vMerge w:val="restart"/>'
+    elif v_merge == "continue":
+        props += "<w:vMerge/>"
+    return f"<w:tc><w:tcPr>{props}</w:tcPr>{_p(text)}</w:tc>"
+
+
+def build_exam_docx(questions):
+    """Bytes de un .docx con `questions` preguntas de opción múltiple."""
+    body = []
+    for n in range(1, questions + 1):
+        body.append(_p(f"{n}. Un estudiante resuelve el problema {n} sobre funciones lineales y razones de cambio. "
+                       "¿Cuál de las siguientes afirmaciones es correcta?"))
+        body.append(
+            '<w:tbl><w:tblGrid><w:gridCol/><w:gridCol/><w:gridCol/></w:tblGrid>'
+            f'<w:tr>{_tc(f"Opciones de la pregunta {n}", span=3)}</w:tr>'
+            f'<w:tr>{_tc("Competencia: razonamiento", v_merge="restart")}{_tc("A) La pendiente es 2")}'
+            f'{_tc("B) La pendiente es -2")}</w:tr>'
+            f'<w:tr>{_tc("", v_merge="continue")}{_tc("C) La función es constante")}'
+            f'{_tc("D) La intersección es (0, 3)")}</w:tr>'
+            '</w:tbl>'
+        )
+    document = f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {_NS}><w:body>{"".join(body)}</w:body></w:document>'
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _RELS)
+        archive.writestr("word/document.xml", document)
+    return buf.getvalue()
+
+
+def legacy_extract(content):
+    """Implementación anterior de icfes_api.extract_text_from_docx."""
+    from docx import Document
+
+    doc = Document(BytesIO(content))
+    text = ""
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            text += paragraph.text + "\n"
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                if cell.text.strip():
+                    text += cell.text + " "
+            text += "\n"
+    return text.strip()
+
+
+def _best_ms(extract, content, repeat):
+    extract(content)  # calentamiento
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        extract(content)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, nargs="+", default=[200, 400, 800])
+    parser.add_argument("--repeat", type=int, default=5, help="repeticiones por medición (se informa la mejor)")
+    args = parser.parse_args()
+
+    cases = [("iterparse", extract_docx_text)]
+    try:
+        import docx  # noqa: F401
+
+        cases.append(("python-docx (anterior)", legacy_extract))
+    except ImportError:
+        pass
+
+    print(f"{'preguntas':>10}{'KB':>8}  {'implementación':<24}{'ms':>10}{'caracteres':>12}")
+    for questions in args.questions:
+        content = build_exam_docx(questions)
+        for name, extract in cases:
+            ms = _best_ms(extract, content, args.repeat)
+            chars = len(extract(content))
+            print(f"{questions:>10}{len(content) // 1024:>8}  {name:<24}{ms:>10.1f}{chars:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+bench_function_plot.py
+Compara la evaluación de funciones de _draw_geometry: bucle con sympy.subs
+(implementación anterior) frente a lambdify vectorizado y cacheado (math_expr.py).
+
+Uso (desde la carpeta del proyecto):
+    python benchmarks/bench_function_plot.py --samples 500
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from math_expr import X, compile_expression, evaluate_samples, parse_expression  # noqa: E402
+
+EXPRESSIONS = ["sin(x)", "x**2 - 3*x + 1", "tan(x)", "exp(-x/5)*cos(2*x)", "sqrt(abs(x))"]
+
+
+def _subs_loop(expr_sympy, xs):
+    ys = []
+    for val in xs:
+        try:
+            ys.append(float(expr_sympy.subs(X, val)))
+        except (TypeError, ValueError):
+            ys.append(float("nan"))
+    return ys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200, help="repeticiones de la versión vectorizada")
+    args = parser.parse_args()
+
+    xs = np.linspace(-10, 10, args.samples)
+    print(f"{'expresión':<24}{'subs (ms)':>12}{'lambdify (ms)':>16}{'aceleración':>14}")
+    for expr in EXPRESSIONS:
+        started = time.perf_counter()
+        _subs_loop(parse_expression(expr), xs)
+        slow = time.perf_counter() - started
+
+        compile_expression.cache_clear()
+        started = time.perf_counter()
+        evaluate_samples(expr, xs)  # primera llamada: incluye compilar
+        first = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            evaluate_samples(expr, xs)
+        cached = (time.perf_counter() - started) / args.repeat
+
+        print(f"{expr:<24}{slow * 1000:>12.1f}{cached * 1000:>16.3f}{slow / cached:>13.0f}x  (primera llamada {first * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+bench_startup.py
+Mide el tiempo de arranque de icfes_api (lo que paga cada worker de gunicorn al iniciar).
+
+Cada medición se hace en un proceso nuevo. Además del import de la aplicación,
+mide cuánto cuesta cargar las dependencias pesadas (lo que ahora se paga en el
+primer gráfico/documento, o una sola vez en el maestro con PRELOAD_HEAVY_MODULES)
+y el arranque de cada proceso de render o extracción: son 'spawn', no heredan la
+precarga del maestro y lo pagan de nuevo (en segundo plano con PRELOAD_HEAVY_MODULES).
+
+Uso (desde la carpeta del proyecto):
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_APP = """
+import json, sys, time
+started = time.perf_counter()
+import icfes_api
+elapsed = time.perf_counter() - started
+from lazy_imports import HEAVY_MODULES
+print(json.dumps({"seconds": elapsed, "heavy_loaded": [m for m in HEAVY_MODULES if m in sys.modules]}))
+"""
+
+_PRELOAD = """
+import json, time
+started = time.perf_counter()
+from lazy_imports import preload
+timings = preload()
+print(json.dumps({"seconds": time.perf_counter() - started, "modules": timings}))
+"""
+
+_POOL_PROCESS = """
+import json, time
+started = time.perf_counter()
+from {module} import _init_worker
+_init_worker()
+print(json.dumps({{"seconds": time.perf_counter() - started}}))
+"""
+
+
+def _run(code):
+    env = dict(os.environ)
+    # Evitar trabajo de fondo y salida que no forman parte del arranque
+    env.setdefault("GOOGLE_API_KEY", "benchmark")
+    env.update({"QUESTION_BANK_ENABLED": "false", "UPSTREAM_PROBE_INTERVAL": "0", "STARTUP_BANNER": "false"})
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    app_runs = [_run(_IMPORT_APP) for _ in range(args.runs)]
+    preload_runs = [_run(_PRELOAD) for _ in range(args.runs)]
+    pool_runs = {
+        module: [_run(_POOL_PROCESS.format(module=module))["seconds"] for _ in range(args.runs)]
+        for module in ("render_pool", "document_text")
+    }
+
+    app_times = [r["seconds"] for r in app_runs]
+    preload_times = [r["seconds"] for r in preload_runs]
+    print(f"import icfes_api:        mediana {statistics.median(app_times):.3f}s  (min {min(app_times):.3f}s, {args.runs} procesos)")
+    print(f"dependencias pesadas:    mediana {statistics.median(preload_times):.3f}s  (pagado en el primer uso o en el maestro)")
+    for module, times in pool_runs.items():
+        print(f"proceso de {module:<14} mediana {statistics.median(times):.3f}s  (import por proceso 'spawn')")
+    print(f"pesadas cargadas al importar la app: {app_runs[-1]['heavy_loaded'] or 'ninguna'}")
+    for name, seconds in preload_runs[-1]["modules"].items():
+        print(f"   {name:<20} {seconds:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+chart_cache.py
+Caché de gráficos renderizados, indexada por la especificación del gráfico.
+
+La clave es un hash SHA-256 de la especificación canónica (tipo, etiquetas,
+valores, título, estilo, modo porcentaje, dpi...), así el mismo gráfico no se
+vuelve a rasterizar ni a codificar en base64. La memoria se acota por bytes
+con desalojo LRU. El hash sirve también de ETag para If-None-Match.
+
+Opcionalmente las imágenes se escriben en un directorio compartido, de modo que
+la URL /charts/<hash>.<ext> funciona aunque la atienda otro worker de gunicorn.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"image/png": "png", "image/svg+xml": "svg"}
+MIMETYPES = {ext: mimetype for mimetype, ext in EXTENSIONS.items()}
+
+
+def chart_spec_key(spec: Dict[str, Any]) -> str:
+    """Hash estable de una especificación: el orden de claves y el formato no influyen."""
+    canonical = json.dumps(spec, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class CachedChart:
+    """Imagen renderizada; el data URI base64 se calcula una sola vez y solo si se pide."""
+
+    key: str
+    content: bytes
+    mimetype: str = "image/png"
+
+    @cached_property
+    def data_uri(self) -> str:
+        encoded = base64.b64encode(self.content).decode("ascii")
+        return f"data:{self.mimetype};base64,{encoded}"
+
+    @property
+    def etag(self) -> str:
+        """Valor del ETag sin comillas (Werkzeug las añade con set_etag)."""
+        return self.key[:32]
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS.get(self.mimetype, "bin")
+
+    @property
+    def size(self) -> int:
+        # Bytes de la imagen más su versión base64 (se cuenta aunque aún no se haya generado)
+        return len(self.content) + (len(self.content) + 2) // 3 * 4
+
+
+class ChartCache:
+    """LRU acotado por tamaño total en bytes, seguro entre hilos, con copia opcional en disco."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, *, directory: Optional[str] = None, max_files: int = 2000) -> None:
+        self.max_bytes = max(0, int(max_bytes))
+        self.directory = directory
+        self.max_files = max_files
+        self._entries: "OrderedDict[str, CachedChart]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CachedChart]:
+        with self._lock:
+            chart = self._entries.get(key)
+            if chart is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return chart
+        chart = self._read_disk(key)
+        with self._lock:
+            if chart is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(chart)
+        return chart
+
+    def put(self, key: str, content: bytes, mimetype: str = "image/png") -> CachedChart:
+        """Guarda la imagen y devuelve la entrada (si no cabe en memoria, solo va a disco)."""
+        chart = CachedChart(key, content, mimetype)
+        self._remember(chart)
+        self._write_disk(chart)
+        return chart
+
+    def _remember(self, chart: CachedChart) -> None:
+        if chart.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(chart.key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[chart.key] = chart
+            self._bytes += chart.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    # ----------------------------
+    # Copia en disco (compartida entre workers)
+    # ----------------------------
+
+    def _read_disk(self, key: str) -> Optional[CachedChart]:
+        if not self.directory:
+            return None
+        for ext, mimetype in MIMETYPES.items():
+            path = os.path.join(self.directory, f"{key}.{ext}")
+            try:
+                with open(path, "rb") as fh:
+                    return CachedChart(key, fh.read(), mimetype)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"No se pudo leer gráfico en caché {path}: {str(e)}")
+        return None
+
+    def _write_disk(self, chart: CachedChart) -> None:
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"{chart.key}.{chart.extension}")
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(chart.content)
+            os.replace(tmp_path, path)  # atómico: otro worker nunca lee un archivo a medias
+        except OSError as e:
+            logger.warning(f"No se pudo guardar gráfico en caché {path}: {str(e)}")
+            return
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % 50 == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """Borra los archivos más antiguos si se supera max_files."""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.is_file() and not e.name.endswith(".tmp")]
+            if len(entries) <= self.max_files:
+                return
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[: len(entries) - self.max_files]:
+                os.unlink(entry.path)
+        except OSError as e:
+            logger.warning(f"Error limpiando caché de gráficos en disco: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / total, 4) if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "directory": self.directory,
+            }
@@ -0,0 +1,198 @@
+"""
+chart_data.py
+Agregación local de resultados de evaluación para /generate-visual.
+
+Cuando analysis_data ya es estructurado (la lista 'analysis' que devuelve
+/analyze-document, o el objeto con 'analisis_completo'), las distribuciones
+se calculan aquí de forma determinista: correctas/incorrectas, por nivel ICFES
+o por concepto clave. Solo el texto libre necesita a Gemini.
+
+build_resumen() calcula con los mismos criterios el 'resumen' de /analyze-document
+a partir de los ítems ya unidos de todos los fragmentos.
+"""
+from __future__ import annotations
+
+import json
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+GROUPINGS = ("resultado", "nivel", "concepto")
+
+NIVELES_ICFES = ("Básico", "Satisfactorio", "Avanzado")
+SIN_NIVEL = "Sin nivel"
+
+# Categorías máximas por gráfico (pie_chart_exam rechaza más de 6)
+MAX_CATEGORIES = 6
+MAX_LABEL_LENGTH = 40
+
+_CONCEPT_SEPARATORS = re.compile(r"[,;\n•·]|\s+y\s+|\s+-\s+")
+_TRUE_VALUES = {"true", "si", "sí", "correcta", "correcto", "1"}
+_FALSE_VALUES = {"false", "no", "incorrecta", "incorrecto", "0"}
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas y sin tildes, para comparar etiquetas escritas de formas distintas."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+def extract_items(analysis_data: Any) -> Optional[List[Dict[str, Any]]]:
+    """Devuelve los ítems evaluados si analysis_data es estructurado; None si es texto libre.
+
+    Acepta la lista de ítems, el objeto de /analyze-document ('analysis' o
+    'analisis_completo') o ese mismo JSON serializado como texto.
+    """
+    if isinstance(analysis_data, str):
+        text = analysis_data.strip()
+        if not text.startswith(("{", "[")):
+            return None
+        try:
+            analysis_data = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+    if isinstance(analysis_data, dict):
+        analysis_data = analysis_data.get("analysis") or analysis_data.get("analisis_completo")
+    if not isinstance(analysis_data, list):
+        return None
+    items = [item for item in analysis_data if isinstance(item, dict)]
+    return items or None
+
+
+def _is_correct(item: Dict[str, Any]) -> Optional[bool]:
+    value = item.get("es_correcta")
+    if isinstance(value, bool) or value is None:
+        return value
+    text = _normalize(str(value))
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    return None
+
+
+def _nivel(item: Dict[str, Any]) -> str:
+    text = _normalize(str(item.get("nivel_icfes") or ""))
+    # Un solo nivel reconocible; "Básico/Satisfactorio/Avanzado" (plantilla sin rellenar) no cuenta
+    found = [nivel for nivel in NIVELES_ICFES if _normalize(nivel) in text]
+    return found[0] if len(found) == 1 else SIN_NIVEL
+
+
+def _concepts(item: Dict[str, Any]) -> List[str]:
+    raw = item.get("conceptos_clave") or ""
+    if isinstance(raw, list):
+        raw = ",".join(str(c) for c in raw)
+    concepts = []
+    for part in _CONCEPT_SEPARATORS.split(str(raw)):
+        part = part.strip(" .:-\t")
+        if len(part) < 3:
+            continue
+        if len(part) > MAX_LABEL_LENGTH:
+            part = part[: MAX_LABEL_LENGTH - 1].rstrip() + "…"
+        concepts.append(part[0].upper() + part[1:])
+    return concepts
+
+
+def _top(counter: Counter, labels: Dict[str, str]) -> List[tuple]:
+    """Las categorías más frecuentes; el resto se agrupa en 'Otros'."""
+    ranked = counter.most_common()
+    if len(ranked) > MAX_CATEGORIES:
+        rest = sum(count for _, count in ranked[MAX_CATEGORIES - 1:])
+        ranked = ranked[: MAX_CATEGORIES - 1] + [("__otros__", rest)]
+        labels = {**labels, "__otros__": "Otros"}
+    return [(labels[key], count) for key, count in ranked]
+
+
+def aggregate(items: List[Dict[str, Any]], group_by: str = "resultado") -> Dict[str, Any]:
+    """Calcula labels/values (conteos) y textos sugeridos para el gráfico.
+
+    group_by: 'resultado' (correctas/incorrectas), 'nivel' (nivel ICFES) o
+    'concepto' (conceptos clave de las preguntas incorrectas, o de todas si no hay).
+    """
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by no soportado: {group_by}. Use uno de: {', '.join(GROUPINGS)}")
+
+    if group_by == "resultado":
+        counts = Counter(_is_correct(item) for item in items)
+        pairs = [("Correctas", counts[True]), ("Incorrectas", counts[False]), ("Sin evaluar", counts[None])]
+        pairs = [(label, count) for label, count in pairs if count or label != "Sin evaluar"]
+        title, xlabel = "Resultado de las respuestas", "Resultado"
+    elif group_by == "nivel":
+        counts = Counter(_nivel(item) for item in items)
+        pairs = [(nivel, counts[nivel]) for nivel in (*NIVELES_ICFES, SIN_NIVEL) if counts[nivel]]
+        title, xlabel = "Distribución por nivel ICFES", "Nivel ICFES"
+    else:
+        incorrect = [item for item in items if _is_correct(item) is False]
+        source = incorrect or items
+        counter: Counter = Counter()
+        labels: Dict[str, str] = {}
+        for item in source:
+            # Un concepto cuenta una vez por pregunta
+            for key, label in {_normalize(c): c for c in _concepts(item)}.items():
+                counter[key] += 1
+                labels.setdefault(key, label)
+        pairs = _top(counter, labels)
+        title = "Conceptos a reforzar" if incorrect else "Conceptos evaluados"
+        xlabel = "Concepto"
+
+    return {
+        "labels": [label for label, _ in pairs],
+        "values": [count for _, count in pairs],
+        "title": title,
+        "xlabel": xlabel,
+        "ylabel": "Número de preguntas",
+        "grouped_by": group_by,
+    }
+
+
+def _nivel_general(items: List[Dict[str, Any]], accuracy: Optional[float]) -> str:
+    """Nivel más frecuente entre los ítems; si ninguno lo indica, se estima por el porcentaje de aciertos."""
+    counts = Counter(nivel for nivel in (_nivel(item) for item in items) if nivel != SIN_NIVEL)
+    if counts:
+        # En empate gana el nivel más bajo (criterio conservador)
+        return max(NIVELES_ICFES, key=lambda nivel: (counts[nivel], -NIVELES_ICFES.index(nivel)))
+    if accuracy is None:
+        return SIN_NIVEL
+    return "Básico" if accuracy < 50 else "Satisfactorio" if accuracy < 80 else "Avanzado"
+
+
+def build_resumen(items: List[Dict[str, Any]], partial_summaries: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Resumen del documento calculado localmente a partir de los ítems analizados.
+
+    partial_summaries son los 'resumen' devueltos por cada fragmento; de ellos
+    solo se conservan las recomendaciones (sin repetir).
+    """
+    counts = Counter(_is_correct(item) for item in items)
+    evaluated = counts[True] + counts[False]
+    accuracy = round(counts[True] / evaluated * 100, 1) if evaluated else None
+
+    if accuracy is None:
+        observaciones = f"Se analizaron {len(items)} preguntas; no se pudo determinar cuáles son correctas."
+    else:
+        observaciones = (
+            f"{counts[True]} de {evaluated} respuestas correctas ({accuracy}%), "
+            f"{counts[False]} incorrectas."
+        )
+
+    recomendaciones: List[str] = []
+    seen = set()
+    for summary in partial_summaries or []:
+        text = str((summary or {}).get("recomendaciones_icfes") or "").strip()
+        if text and _normalize(text) not in seen:
+            seen.add(_normalize(text))
+            recomendaciones.append(text)
+    reforzar = aggregate(items, "concepto")["labels"] if counts[False] else []
+    if reforzar:
+        recomendaciones.append("Conceptos a reforzar: " + ", ".join(label for label in reforzar if label != "Otros") + ".")
+
+    return {
+        "total_preguntas": len(items),
+        "documento_procesado": True,
+        "correctas": counts[True],
+        "incorrectas": counts[False],
+        "porcentaje_aciertos": accuracy,
+        "observaciones": observaciones,
+        "nivel_dominio_general": _nivel_general(items, accuracy),
+        "recomendaciones_icfes": " ".join(recomendaciones),
+    }
@@ -1,14 +1,25 @@
 """
 charts.py
-Utilidades de gráficos de calidad editorial (tipo examen/ICFES) basadas en Matplotlib/Seaborn.
+Utilidades de gráficos de calidad editorial (tipo examen/ICFES) basadas en Matplotlib.
+
+Las figuras se crean con la API orientada a objetos (matplotlib.figure.Figure),
+no con pyplot: no quedan registradas en el estado global y no hace falta cerrarlas.
+El tema se calcula una sola vez (ExamTheme inmutable) y se aplica a cada figura
+con el context manager exam_theme(), sin modificar rcParams de forma permanente.
 """
 from __future__ import annotations
 
 import math
-from typing import Iterable, List, Optional, Sequence, Tuple, Union
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO
+from types import MappingProxyType
+from typing import Any, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
 import matplotlib.pyplot as plt
-import seaborn as sns
+from matplotlib import cycler
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
 from matplotlib.ticker import PercentFormatter
 
 # ============================
@@ -16,37 +27,112 @@ from matplotlib.ticker import PercentFormatter
 # ============================
 
 _DEFAULT_FONT = "DejaVu Sans"
-_COLOR_PALETTE = sns.color_palette("colorblind")
-_BW_PALETTE = [
+# Paleta "colorblind" de seaborn
+_COLOR_PALETTE = (
+    "#0173b2", "#de8f05", "#029e73", "#d55e00", "#cc78bc",
+    "#ca9161", "#fbafe4", "#949494", "#ece133", "#56b4e9",
+)
+_BW_PALETTE = (
     (0.2, 0.2, 0.2),
     (0.55, 0.55, 0.55),
     (0.75, 0.75, 0.75),
     (0.35, 0.35, 0.35),
     (0.6, 0.6, 0.6),
-]
-
-
-def set_exam_theme(
+)
+
+# Estilo "whitegrid" con contexto "paper" (equivalente a sns.set_theme(context="paper", style="whitegrid"))
+_BASE_RC = {
+    "axes.axisbelow": True,
+    "axes.edgecolor": ".8",
+    "axes.facecolor": "white",
+    "axes.grid": True,
+    "axes.labelcolor": ".15",
+    "axes.linewidth": 1.0,
+    "axes.labelsize": 9.6,
+    "axes.titlesize": 9.6,
+    "figure.facecolor": "white",
+    "font.size": 9.6,
+    "grid.color": ".8",
+    "grid.linestyle": "-",
+    "legend.fontsize": 8.8,
+    "legend.title_fontsize": 9.6,
+    "lines.linewidth": 1.2,
+    "lines.markersize": 4.8,
+    "lines.solid_capstyle": "round",
+    "patch.edgecolor": "w",
+    "patch.force_edgecolor": True,
+    "patch.linewidth": 0.8,
+    "text.color": ".15",
+    "xtick.bottom": False,
+    "xtick.color": ".15",
+    "xtick.direction": "out",
+    "xtick.labelsize": 8.8,
+    "xtick.major.size": 4.8,
+    "xtick.major.width": 1.0,
+    "xtick.minor.size": 3.2,
+    "xtick.minor.width": 0.8,
+    "xtick.top": False,
+    "ytick.color": ".15",
+    "ytick.direction": "out",
+    "ytick.labelsize": 8.8,
+    "ytick.left": False,
+    "ytick.major.size": 4.8,
+    "ytick.major.width": 1.0,
+    "ytick.minor.size": 3.2,
+    "ytick.minor.width": 0.8,
+    "ytick.right": False,
+    # Ajustes propios del tema examen
+    "axes.spines.top": False,
+    "axes.spines.right": False,
+    "savefig.bbox": "tight",
+    "legend.frameon": False,
+}
+
+
+@dataclass(frozen=True)
+class ExamTheme:
+    """Tema precalculado: paleta y parámetros rc de solo lectura."""
+
+    palette: Tuple[Any, ...]
+    rc: Mapping[str, Any]
+
+
+def build_exam_theme(
     *,
     font: str = _DEFAULT_FONT,
-    context: str = "paper",
     use_bw: bool = False,
     grid_alpha: float = 0.45,
     grid_lw: float = 0.6,
-) -> None:
-    """Aplica un tema sobrio y consistente tipo 'examen'."""
-    sns.set_theme(context=context, style="whitegrid", font=font)
-    sns.set_palette(_BW_PALETTE if use_bw else _COLOR_PALETTE)
-    plt.rcParams.update(
+) -> ExamTheme:
+    """Construye un tema sobrio y consistente tipo 'examen' (no aplica nada)."""
+    palette = _BW_PALETTE if use_bw else _COLOR_PALETTE
+    rc = dict(_BASE_RC)
+    rc.update(
         {
-            "axes.spines.top": False,
-            "axes.spines.right": False,
+            "font.family": [font],
+            "axes.prop_cycle": cycler(color=list(palette)),
             "grid.linewidth": grid_lw,
             "grid.alpha": grid_alpha,
-            "savefig.bbox": "tight",
-            "legend.frameon": False,
         }
     )
+    return ExamTheme(palette=palette, rc=MappingProxyType(rc))
+
+
+EXAM_THEME = build_exam_theme()
+EXAM_THEME_BW = build_exam_theme(use_bw=True)
+
+
+@contextmanager
+def exam_theme(use_bw: bool = False) -> Iterator[ExamTheme]:
+    """Aplica el tema solo mientras se crea y guarda una figura; al salir se restauran los rcParams."""
+    theme = EXAM_THEME_BW if use_bw else EXAM_THEME
+    with plt.rc_context(dict(theme.rc)):
+        yield theme
+
+
+def set_exam_theme(*, use_bw: bool = False) -> None:
+    """Aplica el tema de forma global (para scripts o notebooks; los endpoints usan exam_theme())."""
+    plt.rcParams.update(dict((EXAM_THEME_BW if use_bw else EXAM_THEME).rc))
 
 
 def fig_size_mm(width_mm: float, height_mm: float) -> Tuple[float, float]:
@@ -64,6 +150,18 @@ def save_figure(fig: plt.Figure, path: Optional[str], *, dpi: int = 400) -> None
         fig.savefig(path, dpi=dpi)
 
 
+def figure_bytes(fig: Figure, *, fmt: str = "png", dpi: int = 100) -> bytes:
+    """Serializa la figura en memoria: SVG vectorial (sin fecha, reproducible) o PNG al dpi indicado."""
+    buf = BytesIO()
+    if fmt == "svg":
+        # Sin fecha y con ids fijos: el mismo gráfico produce siempre los mismos bytes
+        with plt.rc_context({"svg.hashsalt": "icfes"}):
+            fig.savefig(buf, format="svg", bbox_inches="tight", metadata={"Date": None})
+    else:
+        fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    return buf.getvalue()
+
+
 # ============================
 # Gráfico de barras
 # ============================
@@ -95,53 +193,56 @@ def bar_chart_exam(
         data.sort(key=lambda x: x[1], reverse=True)
     cats, vals = zip(*data) if data else ([], [])
 
-    # Tema
-    set_exam_theme(use_bw=paleta_bw)
-
-    fig, ax = plt.subplots(figsize=fig_size_mm(ancho_mm, alto_mm))
-
-    # Barras
-    sns.barplot(x=list(cats), y=list(vals), ax=ax, edgecolor="black", linewidth=0.7)
-
-    # Eje Y como porcentaje si aplica
-    if valores_como_porcentaje:
-        total = sum(vals) if vals else 1
-        if total <= 0:
-            total = 1
-        ax.yaxis.set_major_formatter(PercentFormatter(xmax=100 if max(vals) <= 1 else total))
-
-    # Valores sobre barras
-    if mostrar_valores:
-        for p in ax.patches:
-            v = p.get_height()
-            if valores_como_porcentaje:
-                # Detecta si los valores ya son 0-1 o 0-100
-                if (max(vals) if vals else 1) <= 1:
-                    label = f"{v*100:.1f}%"
+    with exam_theme(use_bw=paleta_bw) as theme:
+        fig = Figure(figsize=fig_size_mm(ancho_mm, alto_mm))
+        ax = fig.subplots()
+
+        # Barras (un solo color, como sns.barplot sin hue)
+        positions = range(len(cats))
+        ax.bar(positions, vals, width=0.8, color=theme.palette[0], edgecolor="black", linewidth=0.7)
+        ax.set_xticks(list(positions), [str(c) for c in cats])
+        ax.set_xlim(-0.5, len(cats) - 0.5)
+        ax.xaxis.grid(False)
+
+        # Eje Y como porcentaje si aplica
+        if valores_como_porcentaje:
+            total = sum(vals) if vals else 1
+            if total <= 0:
+                total = 1
+            ax.yaxis.set_major_formatter(PercentFormatter(xmax=100 if max(vals) <= 1 else total))
+
+        # Valores sobre barras
+        if mostrar_valores:
+            for p in ax.patches:
+                v = p.get_height()
+                if valores_como_porcentaje:
+                    # Detecta si los valores ya son 0-1 o 0-100
+                    if (max(vals) if vals else 1) <= 1:
+                        label = f"{v*100:.1f}%"
+                    else:
+                        total = sum(vals) if vals else 1
+                        pct = (v / total * 100) if total else 0
+                        label = f"{pct:.1f}%"
                 else:
-                    total = sum(vals) if vals else 1
-                    pct = (v / total * 100) if total else 0
-                    label = f"{pct:.1f}%"
-            else:
-                label = f"{v:g}"
-            ax.annotate(
-                label,
-                (p.get_x() + p.get_width() / 2, v),
-                ha="center",
-                va="bottom",
-                fontsize=9,
-                xytext=(0, 3),
-                textcoords="offset points",
-            )
-
-    # Etiquetas y estilo
-    ax.set_title(titulo, fontsize=12)
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    ax.grid(axis="y")
-    ax.tick_params(axis="x", rotation=rot_x)
-
-    save_figure(fig, salida)
+                    label = f"{v:g}"
+                ax.annotate(
+                    label,
+                    (p.get_x() + p.get_width() / 2, v),
+                    ha="center",
+                    va="bottom",
+                    fontsize=9,
+                    xytext=(0, 3),
+                    textcoords="offset points",
+                )
+
+        # Etiquetas y estilo
+        ax.set_title(titulo, fontsize=12)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        ax.grid(axis="y")
+        ax.tick_params(axis="x", rotation=rot_x)
+
+        save_figure(fig, salida)
     return fig, ax
 
 
@@ -174,42 +275,43 @@ def pie_chart_exam(
             f"Demasiadas categorías ({len(labels)}). Use <= {max_categorias} para legibilidad."
         )
 
-    set_exam_theme(use_bw=paleta_bw)
-
-    fig, ax = plt.subplots(figsize=fig_size_mm(ancho_mm, alto_mm))
-
-    total = sum(valores)
-    if total <= 0:
-        total = 1
+    with exam_theme(use_bw=paleta_bw) as theme:
+        fig = Figure(figsize=fig_size_mm(ancho_mm, alto_mm))
+        ax = fig.subplots()
 
-    def _fmt(pct: float) -> str:
-        return f"{pct:.1f}%" if mostrar_porcentaje else ""
+        total = sum(valores)
+        if total <= 0:
+            total = 1
 
-    wedges, texts, autotexts = ax.pie(
-        valores,
-        labels=None,
-        startangle=90,
-        counterclock=False,
-        autopct=_fmt if mostrar_porcentaje else None,
-        pctdistance=0.75 if donut else 0.62,
-        wedgeprops=dict(linewidth=0.8, edgecolor="black"),
-    )
+        def _fmt(pct: float) -> str:
+            return f"{pct:.1f}%" if mostrar_porcentaje else ""
+
+        wedges, texts, autotexts = ax.pie(
+            valores,
+            labels=None,
+            startangle=90,
+            counterclock=False,
+            autopct=_fmt if mostrar_porcentaje else None,
+            pctdistance=0.75 if donut else 0.62,
+            colors=[theme.palette[i % len(theme.palette)] for i in range(len(valores))],
+            wedgeprops=dict(linewidth=0.8, edgecolor="black"),
+        )
 
-    if donut:
-        centre_circle = plt.Circle((0, 0), 0.55, color="white", fc="white", linewidth=0)
-        fig.gca().add_artist(centre_circle)
-
-    # Leyenda a la derecha con etiquetas limpias
-    ax.legend(
-        wedges,
-        [str(l) for l in labels],
-        loc="center left",
-        bbox_to_anchor=(1, 0.5),
-        title="",
-    )
+        if donut:
+            centre_circle = Circle((0, 0), 0.55, color="white", fc="white", linewidth=0)
+            ax.add_artist(centre_circle)
+
+        # Leyenda a la derecha con etiquetas limpias
+        ax.legend(
+            wedges,
+            [str(l) for l in labels],
+            loc="center left",
+            bbox_to_anchor=(1, 0.5),
+            title="",
+        )
 
-    ax.set_title(titulo, fontsize=12)
-    ax.set_aspect("equal")
+        ax.set_title(titulo, fontsize=12)
+        ax.set_aspect("equal")
 
-    save_figure(fig, salida)
+        save_figure(fig, salida)
     return fig, ax
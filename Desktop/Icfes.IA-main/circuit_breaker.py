@@ -0,0 +1,166 @@
+"""
+circuit_breaker.py
+Circuit breaker (cerrado / abierto / semiabierto) para dependencias externas.
+
+Se abre cuando, en la ventana de las últimas llamadas, la tasa de errores o la
+tasa de llamadas lentas supera el umbral configurado. Mientras está abierto las
+llamadas fallan de inmediato con CircuitOpenError; pasado el tiempo de espera se
+permite un número limitado de llamadas de prueba (semiabierto) que deciden si
+vuelve a cerrarse o se abre de nuevo.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto; reintentar después de `retry_after` segundos."""
+
+    def __init__(self, retry_after: float, message: str = "Servicio de IA no disponible temporalmente"):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        *,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 45.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+    ) -> None:
+        self.window = max(1, int(window))
+        self.min_calls = max(1, int(min_calls))
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, int(half_open_max_calls))
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.last_change = time.time()
+        self.times_opened = 0
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=self.window)  # (falló, lenta)
+        self._half_open_in_flight = 0
+        self._lock = threading.Lock()
+
+    # ----------------------------
+    # API
+    # ----------------------------
+
+    def before_call(self) -> None:
+        """Lanza CircuitOpenError si la llamada no está permitida en el estado actual."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.time()
+                if remaining > 0:
+                    raise CircuitOpenError(remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    raise CircuitOpenError(1)
+                self._half_open_in_flight += 1
+
+    def record_success(self, latency: float) -> None:
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if slow:
+                    self._open()
+                else:
+                    self._transition(CLOSED)
+                return
+            self._outcomes.append((False, slow))
+            self._evaluate()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                self._open()
+                return
+            self._outcomes.append((True, False))
+            self._evaluate()
+
+    def release(self) -> None:
+        """Libera un permiso semiabierto sin registrar resultado (p. ej. error del cliente)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == OPEN and self.opened_at + self.open_seconds > time.time()
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.open_seconds - time.time())
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow = sum(1 for _, is_slow in self._outcomes if is_slow)
+            return {
+                "state": self.state,
+                "calls_in_window": calls,
+                "failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "slow_call_rate": round(slow / calls, 3) if calls else 0.0,
+                "times_opened": self.times_opened,
+                "since": self.last_change,
+            }
+
+    # ----------------------------
+    # Transiciones (con self._lock tomado)
+    # ----------------------------
+
+    def _evaluate(self) -> None:
+        calls = len(self._outcomes)
+        if calls < self.min_calls:
+            return
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, is_slow in self._outcomes if is_slow)
+        if failures / calls >= self.failure_rate or slow / calls >= self.slow_call_rate:
+            self._open()
+
+    def _open(self) -> None:
+        self.opened_at = time.time()
+        self.times_opened += 1
+        self._transition(OPEN)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state and state != OPEN:
+            return
+        self.state = state
+        self.last_change = time.time()
+        if state in (CLOSED, OPEN):
+            self._outcomes.clear()
+            self._half_open_in_flight = 0
+
+
+def create_circuit_breaker_from_env(prefix: str = "GEMINI_BREAKER") -> CircuitBreaker:
+    """Crea el breaker con umbrales tomados de <prefix>_* (ver DEPLOYMENT.md)."""
+    return CircuitBreaker(
+        window=int(os.getenv(f"{prefix}_WINDOW", "20")),
+        min_calls=int(os.getenv(f"{prefix}_MIN_CALLS", "5")),
+        failure_rate=float(os.getenv(f"{prefix}_FAILURE_RATE", "0.5")),
+        slow_call_seconds=float(os.getenv(f"{prefix}_SLOW_CALL_SECONDS", "45")),
+        slow_call_rate=float(os.getenv(f"{prefix}_SLOW_CALL_RATE", "0.8")),
+        open_seconds=float(os.getenv(f"{prefix}_OPEN_SECONDS", "30")),
+    )
@@ -0,0 +1,80 @@
+"""
+document_cache.py
+Caché persistente de /analyze-document indexada por el contenido del archivo.
+
+La clave parte del SHA-256 de los bytes subidos (no del nombre), así el mismo
+examen subido otra vez se reconoce aunque cambie de nombre. Se guardan dos
+entradas por archivo:
+- el texto extraído (clave: hash + presupuesto de caracteres);
+- el análisis ya interpretado (clave: hash + versión del prompt + modelo).
+Si cambia el prompt o el modelo, el análisis se recalcula pero el texto se reutiliza.
+
+Usa los mismos backends que gemini_cache.py (SQLite compartido entre workers o memoria).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+from gemini_cache import MemoryCacheBackend, ResponseCache, SQLiteCacheBackend
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class DocumentCache(ResponseCache):
+    """ResponseCache con valores JSON y claves derivadas del contenido del documento."""
+
+    @staticmethod
+    def content_hash(data: Union[bytes, BinaryIO]) -> str:
+        """SHA-256 de los bytes o de un archivo binario (leído por bloques desde el inicio y rebobinado)."""
+        if isinstance(data, (bytes, bytearray)):
+            return hashlib.sha256(data).hexdigest()
+        digest = hashlib.sha256()
+        data.seek(0)
+        for block in iter(lambda: data.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+        data.seek(0)
+        return digest.hexdigest()
+
+    @staticmethod
+    def text_key(content_hash: str, max_chars: int) -> str:
+        return hashlib.sha256(json.dumps(["text", content_hash, int(max_chars)]).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def analysis_key(content_hash: str, prompt_version: str, model: str) -> str:
+        payload = json.dumps(["analysis", content_hash, prompt_version, model], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_json(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return None
+
+    def set_json(self, key: str, value: Dict[str, Any]) -> None:
+        self.set(key, json.dumps(value, ensure_ascii=False))
+
+
+def create_document_cache_from_env() -> Optional[DocumentCache]:
+    """Crea la caché según DOCUMENT_CACHE_BACKEND (sqlite | memory | none)."""
+    backend_name = os.getenv("DOCUMENT_CACHE_BACKEND", "sqlite").lower()
+    ttl = float(os.getenv("DOCUMENT_CACHE_TTL", str(30 * 86400)))
+    max_entries = int(os.getenv("DOCUMENT_CACHE_MAX_ENTRIES", "500"))
+
+    if backend_name in ("none", "off", "disabled", ""):
+        return None
+    if backend_name == "memory":
+        backend = MemoryCacheBackend(max_entries=max_entries)
+    else:
+        path = os.getenv(
+            "DOCUMENT_CACHE_PATH",
+            os.path.join(tempfile.gettempdir(), "icfes_document_cache.sqlite3"),
+        )
+        backend = SQLiteCacheBackend(path, max_entries=max_entries, table="document_cache")
+    return DocumentCache(backend, ttl=ttl)
@@ -0,0 +1,386 @@
+"""
+document_jobs.py
+Cola persistente de trabajos para /analyze-document en modo asíncrono.
+
+La subida se guarda en disco y el trabajo en SQLite (estado, progreso y
+resultado), así el cliente recibe un id de inmediato y consulta o se suscribe
+al progreso mientras un pool de hilos hace la extracción y el análisis.
+
+- Varios workers de gunicorn comparten la misma base: cada trabajo se reclama
+  con un UPDATE condicionado a status='queued', de modo que solo uno lo procesa.
+- Los trabajos en curso renuevan un latido; si un worker muere o se reinicia,
+  los que se quedan sin latido vuelven a la cola (hasta max_attempts intentos).
+- RetryJob devuelve un trabajo a la cola con un retraso (cuota de Gemini agotada).
+- Los trabajos terminados se borran pasado el tiempo de retención.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Dict, Iterator, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("queued", "running", "done", "error")
+FINISHED = ("done", "error")
+
+# handler(trabajo, progress) -> (cuerpo, código HTTP); progress(**campos) publica el avance
+JobHandler = Callable[[Dict[str, Any], Callable[..., None]], Tuple[Dict[str, Any], int]]
+
+
+class RetryJob(Exception):
+    """El trabajo no puede hacerse ahora: vuelve a la cola tras `delay` segundos."""
+
+    def __init__(self, delay: float, reason: str = ""):
+        super().__init__(reason or f"Reintento en {delay}s")
+        self.delay = max(0.0, float(delay))
+        self.reason = reason
+
+
+class JobStore:
+    """Trabajos en SQLite y archivos subidos en un directorio; seguro entre hilos y procesos."""
+
+    def __init__(self, path: str, uploads_dir: str, *, max_attempts: int = 3):
+        self.path = path
+        self.uploads_dir = uploads_dir
+        self.max_attempts = max(1, int(max_attempts))
+        os.makedirs(uploads_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS document_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    upload_path TEXT,
+                    options TEXT NOT NULL DEFAULT '{}',
+                    progress TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    http_status INTEGER,
+                    owner TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    heartbeat REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_document_jobs_queue ON document_jobs (status, available_at)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Una conexión por operación, como SQLiteCacheBackend
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for column in ("options", "progress", "result"):
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    # ----------------------------
+    # Cliente (endpoints)
+    # ----------------------------
+
+    def create(self, filename: str, content: Union[bytes, BinaryIO], options: Optional[Dict[str, Any]] = None) -> str:
+        """Guarda la subida (bytes o archivo binario, copiado por bloques) y encola el trabajo. Devuelve su id."""
+        job_id = uuid.uuid4().hex
+        upload_path = os.path.join(self.uploads_dir, job_id + os.path.splitext(filename)[1].lower())
+        with open(upload_path, "wb") as fh:
+            if isinstance(content, (bytes, bytearray)):
+                fh.write(content)
+            else:
+                content.seek(0)
+                shutil.copyfileobj(content, fh)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO document_jobs (id, status, filename, upload_path, options, progress, "
+                "available_at, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, filename, upload_path, json.dumps(options or {}),
+                 json.dumps({"stage": "queued"}), now, now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM document_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM document_jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in STATUSES}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    # ----------------------------
+    # Workers
+    # ----------------------------
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """Reclama el trabajo en cola más antiguo que ya esté disponible (atómico entre procesos)."""
+        token = f"{owner}:{uuid.uuid4().hex}"
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE document_jobs
+                SET status = 'running', owner = ?, attempts = attempts + 1, heartbeat = ?, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM document_jobs
+                    WHERE status = 'queued' AND available_at <= ?
+                    ORDER BY available_at, created_at LIMIT 1
+                ) AND status = 'queued'
+                """,
+                (token, now, now, now),
+            )
+            if cursor.rowcount == 0:
+                return None
+            row = conn.execute("SELECT * FROM document_jobs WHERE owner = ?", (token,)).fetchone()
+        return self._decode(row)
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE document_jobs SET progress = ?, heartbeat = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                (json.dumps(progress, ensure_ascii=False), now, now, job_id),
+            )
+
+    def heartbeat(self, job_ids: Set[str]) -> None:
+        if not job_ids:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE document_jobs SET heartbeat = ? WHERE id = ? AND status = 'running'",
+                [(now, job_id) for job_id in job_ids],
+            )
+
+    def finish(self, job_id: str, body: Dict[str, Any], http_status: int) -> None:
+        """Guarda el resultado (éxito o error) y borra la subida."""
+        status = "done" if http_status < 400 else "error"
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT upload_path, progress FROM document_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            progress = {**json.loads(row["progress"]), "stage": status}
+            conn.execute(
+                "UPDATE document_jobs SET status = ?, result = ?, http_status = ?, progress = ?, "
+                "upload_path = NULL, updated_at = ? WHERE id = ?",
+                (status, json.dumps(body, ensure_ascii=False), http_status,
+                 json.dumps(progress, ensure_ascii=False), now, job_id),
+            )
+        self._remove_upload(row["upload_path"])
+
+    def retry(self, job_id: str, delay: float, reason: str = "") -> None:
+        """Devuelve el trabajo a la cola tras `delay` segundos (o lo da por fallido si agotó los intentos)."""
+        job = self.get(job_id)
+        if job is None:
+            return
+        if job["attempts"] >= self.max_attempts:
+            self.finish(job_id, {"error": reason or "El trabajo no pudo completarse", "attempts": job["attempts"]}, 503)
+            return
+        now = time.time()
+        progress = {**job["progress"], "stage": "queued", "retry_after": delay}
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE document_jobs SET status = 'queued', owner = NULL, available_at = ?, progress = ?, "
+                "updated_at = ? WHERE id = ?",
+                (now + delay, json.dumps(progress, ensure_ascii=False), now, job_id),
+            )
+
+    def requeue_stale(self, stale_after: float) -> int:
+        """Trabajos en curso sin latido reciente (worker caído o reiniciado): vuelven a la cola."""
+        cutoff = time.time() - stale_after
+        with self._connect() as conn:
+            stale = [row["id"] for row in conn.execute(
+                "SELECT id FROM document_jobs WHERE status = 'running' AND heartbeat < ?", (cutoff,)
+            )]
+        for job_id in stale:
+            logger.warning(f"Trabajo {job_id} sin latido; se vuelve a encolar")
+            self.retry(job_id, 0, "El trabajo se interrumpió varias veces")
+        return len(stale)
+
+    def purge(self, retention: float) -> int:
+        """Borra los trabajos terminados hace más de `retention` segundos."""
+        cutoff = time.time() - retention
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM document_jobs WHERE status IN ('done', 'error') AND updated_at < ?", (cutoff,)
+            )
+        return cursor.rowcount
+
+    @staticmethod
+    def _remove_upload(path: Optional[str]) -> None:
+        if not path:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"No se pudo borrar la subida {path}: {str(e)}")
+
+
+class JobQueue:
+    """Pool de hilos que procesa los trabajos de un JobStore.
+
+    Un hilo despachador reclama trabajos mientras haya hilos libres, renueva el
+    latido de los que están en curso y hace el mantenimiento (trabajos huérfanos
+    y retención). submit() lo despierta sin esperar al siguiente sondeo.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: JobHandler,
+        *,
+        workers: int = 2,
+        poll_interval: float = 2.0,
+        stale_after: float = 120.0,
+        retention: float = 86400.0,
+        maintenance_interval: float = 60.0,
+    ):
+        self.store = store
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.retention = retention
+        self.maintenance_interval = maintenance_interval
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._active: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Arranca el despachador (idempotente)."""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="document-job"
+            )
+            self._worker = threading.Thread(target=self._run, name="document-jobs-dispatch", daemon=True)
+            self._worker.start()
+
+    def submit(self, filename: str, content: Union[bytes, BinaryIO], options: Optional[Dict[str, Any]] = None) -> str:
+        job_id = self.store.create(filename, content, options)
+        self._wakeup.set()
+        return job_id
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._active)
+        return {"workers": self.workers, "active": active, "jobs": self.store.stats()}
+
+    def _free_slots(self) -> int:
+        with self._lock:
+            return self.workers - len(self._active)
+
+    def dispatch_once(self) -> int:
+        """Reclama trabajos hasta llenar los hilos libres. Devuelve cuántos se lanzaron."""
+        launched = 0
+        while self._free_slots() > 0:
+            job = self.store.claim(self.owner)
+            if job is None:
+                break
+            with self._lock:
+                self._active.add(job["id"])
+            self._executor.submit(self._process, job)
+            launched += 1
+        return launched
+
+    def _process(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        progress: Dict[str, Any] = dict(job["progress"] or {})
+        progress.pop("retry_after", None)
+
+        def report(**fields: Any) -> None:
+            progress.update(fields)
+            self.store.update_progress(job_id, progress)
+
+        started = time.perf_counter()
+        try:
+            report(stage="running", attempt=job["attempts"])
+            body, http_status = self.handler(job, report)
+            self.store.finish(job_id, body, http_status)
+            logger.info(f"Trabajo {job_id} terminado ({http_status}) en {time.perf_counter() - started:.2f}s")
+        except RetryJob as e:
+            logger.info(f"Trabajo {job_id} pospuesto {e.delay}s: {e.reason}")
+            self.store.retry(job_id, e.delay, e.reason)
+        except Exception as e:
+            logger.error(f"Error en trabajo {job_id}: {str(e)}")
+            self.store.finish(job_id, {"error": "Error interno del servidor", "details": str(e),
+                                       "type": type(e).__name__}, 500)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+            self._wakeup.set()
+
+    def _maintenance(self) -> None:
+        self.store.requeue_stale(self.stale_after)
+        purged = self.store.purge(self.retention)
+        if purged:
+            logger.info(f"Trabajos de documentos purgados: {purged}")
+
+    def _run(self) -> None:
+        last_maintenance = 0.0
+        while True:
+            try:
+                with self._lock:
+                    active = set(self._active)
+                self.store.heartbeat(active)
+                if time.monotonic() - last_maintenance >= self.maintenance_interval:
+                    self._maintenance()
+                    last_maintenance = time.monotonic()
+                self.dispatch_once()
+            except Exception as e:  # pragma: no cover - el hilo nunca debe morir
+                logger.error(f"Error en despachador de trabajos: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+def create_job_queue_from_env(handler: JobHandler) -> Optional[JobQueue]:
+    """Crea la cola según DOCUMENT_JOBS_ENABLED, DOCUMENT_JOBS_PATH, DOCUMENT_JOBS_DIR y DOCUMENT_JOB_WORKERS."""
+    if os.getenv("DOCUMENT_JOBS_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    store = JobStore(
+        os.getenv("DOCUMENT_JOBS_PATH", os.path.join(tempfile.gettempdir(), "icfes_document_jobs.sqlite3")),
+        os.getenv("DOCUMENT_JOBS_DIR", os.path.join(tempfile.gettempdir(), "icfes_document_uploads")),
+        max_attempts=int(os.getenv("DOCUMENT_JOB_MAX_ATTEMPTS", "3")),
+    )
+    return JobQueue(
+        store,
+        handler,
+        workers=int(os.getenv("DOCUMENT_JOB_WORKERS", "2")),
+        stale_after=float(os.getenv("DOCUMENT_JOB_STALE_AFTER", "120")),
+        retention=float(os.getenv("DOCUMENT_JOBS_RETENTION", "86400")),
+    )
@@ -0,0 +1,410 @@
+"""
+document_text.py
+Extracción de texto de PDF por páginas, con presupuesto de caracteres, y
+división del texto en fragmentos por límites de pregunta.
+
+El análisis con Gemini solo usa los primeros N caracteres, así que la
+extracción se detiene en cuanto se alcanza ese presupuesto. Los fragmentos se
+acumulan en una lista y se unen una sola vez al final. Los PDF grandes pueden
+repartirse por lotes de páginas entre procesos; cada proceso abre el archivo
+desde disco, así no se copian los bytes del PDF en cada lote. La fuente puede
+ser un archivo abierto (la subida volcada a disco), que se lee sin copiarlo.
+Cada página registra su tiempo de extracción.
+
+extract_docx_text() lee word/document.xml del .docx en streaming (iterparse),
+en orden de documento y sin cargar el modelo de objetos de python-docx.
+
+split_on_questions() corta el texto en fragmentos de tamaño acotado sin partir
+preguntas, para analizarlos por separado (map-reduce en /analyze-document).
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from io import BytesIO
+from xml.etree import ElementTree
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PdfSource = Union[bytes, BinaryIO]
+# on_page(páginas leídas, páginas totales): progreso para los trabajos en segundo plano
+PageCallback = Callable[[int, int], None]
+
+# Páginas por tarea enviada a un proceso
+PAGE_BATCH_SIZE = 8
+
+
+@dataclass
+class PageText:
+    number: int  # 1-based
+    text: str
+    seconds: float
+    error: Optional[str] = None
+
+    def chunk(self) -> str:
+        return f"\n--- Página {self.number} ---\n{self.text}\n"
+
+
+@dataclass
+class PdfExtraction:
+    """Texto extraído y estadísticas por página."""
+
+    text: str
+    total_pages: int
+    pages: List[PageText] = field(default_factory=list)
+    truncated: bool = False
+    parallel: bool = False
+    seconds: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total_pages": self.total_pages,
+            "pages_read": len(self.pages),
+            "truncated": self.truncated,
+            "parallel": self.parallel,
+            "seconds": round(self.seconds, 4),
+            "page_timings": [
+                {"page": p.number, "chars": len(p.text), "ms": round(p.seconds * 1000, 1), **({"error": p.error} if p.error else {})}
+                for p in self.pages
+            ],
+        }
+
+
+def _read_page(reader, index: int) -> PageText:
+    started = time.perf_counter()
+    try:
+        text = reader.pages[index].extract_text() or ""
+        error = None
+    except Exception as e:
+        text, error = "", str(e)
+        logger.warning(f"Error extrayendo página {index + 1}: {error}")
+    return PageText(index + 1, text, time.perf_counter() - started, error)
+
+
+def _extract_pages(path: str, start: int, stop: int) -> List[PageText]:
+    """Tarea de un proceso: extrae las páginas [start, stop) del PDF en disco."""
+    import PyPDF2
+
+    with open(path, "rb") as fh:
+        reader = PyPDF2.PdfReader(fh)
+        return [_read_page(reader, i) for i in range(start, stop)]
+
+
+# ----------------------------
+# Pool de procesos (perezoso, uno por proceso web)
+# ----------------------------
+
+_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker() -> None:
+    """Importa PyPDF2 una sola vez por proceso (los procesos 'spawn' no heredan la precarga del maestro)."""
+    import PyPDF2  # noqa: F401
+
+
+def _executor(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    # 'spawn' y recreación tras fork, igual que render_pool.RenderPool
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def warm_pool(workers: int, timeout: float = 60.0) -> None:
+    """Arranca los `workers` procesos de extracción con PyPDF2 ya importado (bloquea; llamar en segundo plano)."""
+    pool = _executor(workers)
+    for future in [pool.submit(_init_worker) for _ in range(workers)]:
+        future.result(timeout)
+
+
+def _reset_pool(broken: concurrent.futures.ProcessPoolExecutor) -> None:
+    # Un proceso murió (p. ej. por memoria): el siguiente _executor() crea un pool nuevo
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_parallel(
+    path: str, total_pages: int, max_chars: Optional[int], workers: int, on_page: Optional[PageCallback] = None
+) -> Tuple[List[PageText], bool]:
+    """Lotes de páginas en orden, con a lo sumo `workers` lotes en vuelo; se detiene al cubrir el presupuesto."""
+    pool = _executor(workers)
+    starts = deque(range(0, total_pages, PAGE_BATCH_SIZE))
+    in_flight: deque = deque()
+    pages: List[PageText] = []
+    chars = 0
+    try:
+        while starts or in_flight:
+            while starts and len(in_flight) < workers:
+                start = starts.popleft()
+                in_flight.append(pool.submit(_extract_pages, path, start, min(start + PAGE_BATCH_SIZE, total_pages)))
+            for page in in_flight.popleft().result():
+                pages.append(page)
+                if page.text.strip():
+                    chars += len(page.chunk())
+            if on_page:
+                on_page(len(pages), total_pages)
+            if max_chars and chars >= max_chars:
+                for future in in_flight:
+                    future.cancel()
+                return pages, pages[-1].number < total_pages
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+    return pages, False
+
+
+def _extract_serial(
+    reader, total_pages: int, max_chars: Optional[int], on_page: Optional[PageCallback] = None
+) -> Tuple[List[PageText], bool]:
+    """Páginas en orden en este proceso; se detiene al cubrir el presupuesto."""
+    pages: List[PageText] = []
+    chars = 0
+    for index in range(total_pages):
+        page = _read_page(reader, index)
+        pages.append(page)
+        if page.text.strip():
+            chars += len(page.chunk())
+        if on_page:
+            on_page(index + 1, total_pages)
+        if max_chars and chars >= max_chars:
+            return pages, index + 1 < total_pages
+    return pages, False
+
+
+def extract_pdf_text(
+    source: PdfSource,
+    *,
+    max_chars: Optional[int] = None,
+    workers: int = 0,
+    parallel_min_pages: int = 20,
+    on_page: Optional[PageCallback] = None,
+) -> PdfExtraction:
+    """Extrae el texto de un PDF hasta max_chars caracteres (None = todo).
+
+    Con workers > 0 y al menos parallel_min_pages páginas, las páginas se
+    extraen en procesos. on_page se llama tras cada página (o lote) leída.
+    Lanza ValueError si el PDF no tiene páginas o texto.
+    """
+    import PyPDF2
+
+    started = time.perf_counter()
+    stream = BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    reader = PyPDF2.PdfReader(stream)
+    total_pages = len(reader.pages)
+    if total_pages == 0:
+        raise ValueError("El PDF no contiene páginas")
+
+    parallel = workers > 0 and total_pages >= parallel_min_pages
+    if parallel:
+        path = getattr(stream, "name", None)
+        try:
+            if isinstance(path, str) and os.path.isfile(path):
+                # Ya está en disco (archivo de un trabajo): los procesos lo abren directamente
+                pages, truncated = _extract_parallel(path, total_pages, max_chars, workers, on_page)
+            else:
+                stream.seek(0)
+                with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                    shutil.copyfileobj(stream, tmp)
+                try:
+                    pages, truncated = _extract_parallel(tmp.name, total_pages, max_chars, workers, on_page)
+                finally:
+                    os.unlink(tmp.name)
+        except BrokenProcessPool:
+            # El pool ya se descartó; este documento se termina en el proceso web
+            logger.warning("Pool de extracción de PDF roto, extrayendo en secuencial")
+            parallel = False
+    if not parallel:
+        pages, truncated = _extract_serial(reader, total_pages, max_chars, on_page)
+
+    text = "".join(page.chunk() for page in pages if page.text.strip()).strip()
+    if not text:
+        raise ValueError("No se pudo extraer texto legible del PDF")
+    if max_chars and len(text) > max_chars:
+        text, truncated = text[:max_chars], True
+
+    extraction = PdfExtraction(text, total_pages, pages, truncated, parallel, time.perf_counter() - started)
+    slowest = max(pages, key=lambda p: p.seconds)
+    logger.info(
+        f"PDF: {len(pages)}/{total_pages} páginas en {extraction.seconds:.3f}s "
+        f"({'procesos' if parallel else 'secuencial'}{', truncado' if extraction.truncated else ''}); "
+        f"página más lenta: {slowest.number} ({slowest.seconds * 1000:.1f} ms)"
+    )
+    return extraction
+
+
+# ============================
+# Extracción de Word (.docx)
+# ============================
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+_W_VAL = _W + "val"
+# Contenido de un run: texto, tabulación y saltos de línea
+_RUN_TEXT = {_W + "t": None, _W + "tab": "\t", _W + "br": "\n", _W + "cr": "\n", _W + "noBreakHyphen": "-"}
+CELL_SEPARATOR = " | "
+
+
+def _paragraph_text(paragraph) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag in _RUN_TEXT:
+            parts.append((node.text or "") if _RUN_TEXT[node.tag] is None else _RUN_TEXT[node.tag])
+    return "".join(parts)
+
+
+def _is_merge_continuation(cell) -> bool:
+    """Celda que continúa una combinación vertical: su texto ya está en la celda de arriba."""
+    v_merge = cell.find(f"{_W}tcPr/{_W}vMerge")
+    return v_merge is not None and v_merge.get(_W_VAL, "continue") == "continue"
+
+
+def extract_docx_text(source: Union[bytes, BinaryIO], *, max_chars: Optional[int] = None) -> str:
+    """Texto de un .docx en orden de documento: párrafos y tablas intercalados como aparecen.
+
+    Con max_chars la lectura se detiene en cuanto el texto lo supera (como en
+    extract_pdf_text); el resultado se pasa a lo sumo por la última línea, así
+    el llamador sabe si hubo truncado (len(texto) > max_chars) y lo recorta.
+
+    Cada fila de tabla es una línea con sus celdas separadas por CELL_SEPARATOR;
+    las celdas combinadas aparecen una sola vez (un gridSpan ya es una sola
+    celda y las continuaciones de vMerge se omiten). Los cuadros de texto se
+    leen una vez (se ignora la copia VML de mc:Fallback). Los elementos se
+    liberan al procesarlos, así la memoria no crece con el documento.
+    Lanza ValueError si el archivo no es un .docx o no tiene texto.
+    """
+    stream = BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    try:
+        archive = zipfile.ZipFile(stream)
+        xml = archive.open("word/document.xml")
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f"No es un documento Word (.docx) válido: {str(e)}")
+
+    lines: List[str] = []
+    cells: List[List[str]] = []  # párrafos de cada celda abierta (tablas anidadas)
+    rows: List[List[str]] = []  # celdas de cada fila abierta
+    fallback_depth = 0
+    chars = 0
+
+    def emit(text: str) -> None:
+        nonlocal chars
+        if cells:
+            cells[-1].append(text)
+        else:
+            lines.append(text)
+            chars += len(text) + 1
+
+    with archive, xml:
+        for event, elem in ElementTree.iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == _MC_FALLBACK:
+                    fallback_depth += 1
+                elif tag == _W + "tr":
+                    rows.append([])
+                elif tag == _W + "tc":
+                    cells.append([])
+                continue
+
+            if tag == _MC_FALLBACK:
+                fallback_depth -= 1
+                elem.clear()
+            elif tag == _W + "p":
+                if not fallback_depth:
+                    text = _paragraph_text(elem)
+                    if text.strip():
+                        emit(text)
+                elem.clear()
+            elif tag == _W + "tc":
+                paragraphs = cells.pop()
+                if not _is_merge_continuation(elem):
+                    rows[-1].append("\n".join(paragraphs).strip())
+                elem.clear()
+            elif tag == _W + "tr":
+                row = [cell for cell in rows.pop() if cell]
+                if row:
+                    emit(CELL_SEPARATOR.join(row))
+                elem.clear()
+            elif tag == _W + "tbl":
+                elem.clear()
+            if max_chars and chars > max_chars:
+                break
+
+    text = "\n".join(lines).strip()
+    if not text:
+        raise ValueError("No se pudo extraer texto del documento Word")
+    return text
+
+
+# ============================
+# División en fragmentos por pregunta
+# ============================
+
+# Inicio de pregunta: "12.", "12)", "12 -", "Pregunta 12:" al comienzo de línea
+_QUESTION_START = re.compile(r"^[ \t]*(?:pregunta[ \t]*)?\d{1,3}[ \t]*[.):\-](?=\s)", re.IGNORECASE | re.MULTILINE)
+
+
+def _hard_split(segment: str, max_chars: int) -> List[str]:
+    """Parte un segmento demasiado largo por líneas (y, si una línea no cabe, por caracteres)."""
+    if len(segment) <= max_chars:
+        return [segment]
+    pieces: List[str] = []
+    current = ""
+    for line in segment.splitlines(keepends=True):
+        while len(line) > max_chars:
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars and current:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_on_questions(text: str, max_chars: int) -> List[str]:
+    """Agrupa las preguntas del texto en fragmentos de a lo sumo max_chars caracteres.
+
+    Solo se corta dentro de una pregunta si ella sola supera max_chars.
+    """
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    starts = sorted({0, *(m.start() for m in _QUESTION_START.finditer(text))})
+    segments = [text[a:b] for a, b in zip(starts, starts[1:] + [len(text)])]
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for segment in segments:
+        for piece in _hard_split(segment, max_chars):
+            if size + len(piece) > max_chars and current:
+                chunks.append("".join(current).strip())
+                current, size = [], 0
+            current.append(piece)
+            size += len(piece)
+    if current:
+        chunks.append("".join(current).strip())
+    return [chunk for chunk in chunks if chunk]
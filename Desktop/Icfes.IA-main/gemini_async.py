@@ -0,0 +1,174 @@
+"""
+gemini_async.py
+Cliente asíncrono de Gemini compartido por todo el proceso.
+
+Todas las peticiones a Gemini se ejecutan en un único bucle asyncio que vive en
+un hilo dedicado. Así el canal gRPC/HTTP del cliente async de Gemini se crea una
+sola vez y se reutiliza. Un semáforo global y un token bucket opcional limitan
+cuántas generaciones hay en vuelo y cuántas se inician por minuto.
+
+Tanto el código síncrono (vistas Flask normales, hilos) como las vistas
+`async def` pueden usarlo:
+
+    client.run(coro)             # bloquea el hilo que llama hasta el resultado
+    await client.run_async(coro)  # espera sin bloquear el bucle de quien llama
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+
+class TokenBucket:
+    """Limitador de tasa: como máximo `rate_per_minute` adquisiciones por minuto."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncGeminiClient:
+    """Bucle asyncio dedicado con límite global de concurrencia para Gemini."""
+
+    def __init__(self, model_factory: Callable[[], Any], *, max_concurrency: int = 8, rate_per_minute: float = 0):
+        self.model_factory = model_factory
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.rate_per_minute = float(rate_per_minute)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._model = None
+        self.in_flight = 0
+
+    # ----------------------------
+    # Bucle de eventos
+    # ----------------------------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # Tras un fork (workers de gunicorn) el hilo del padre no existe: se recrea
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run() -> None:
+                asyncio.set_event_loop(loop)
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._bucket = TokenBucket(self.rate_per_minute) if self.rate_per_minute > 0 else None
+                # El modelo se crea dentro del bucle para que su canal async quede ligado a él
+                self._model = self.model_factory()
+                ready.set()
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=_run, name="gemini-async-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+            self._pid = os.getpid()
+            return loop
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Programa una corrutina en el bucle compartido y devuelve un Future de hilos."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Ejecuta una corrutina en el bucle compartido y espera el resultado (síncrono)."""
+        return self.submit(coro).result(timeout)
+
+    async def run_async(self, coro: Awaitable) -> Any:
+        """Ejecuta una corrutina en el bucle compartido desde otro bucle (vistas async)."""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    # ----------------------------
+    # Peticiones a Gemini (se ejecutan dentro del bucle compartido)
+    # ----------------------------
+
+    async def generate(
+        self, prompt: str, generation_config: Any, on_latency: Optional[Callable[[float], None]] = None
+    ) -> Any:
+        """Genera una respuesta. `on_latency` recibe la duración de la llamada sin contar la espera en cola."""
+        async with self._semaphore:
+            if self._bucket is not None:
+                await self._bucket.acquire()
+            self.in_flight += 1
+            started = time.monotonic()
+            try:
+                response = await self._model.generate_content_async(prompt, generation_config=generation_config)
+            finally:
+                self.in_flight -= 1
+            if on_latency is not None:
+                on_latency(time.monotonic() - started)
+            return response
+
+    def stream(self, prompt: str, generation_config: Any) -> Iterator[str]:
+        """Streaming síncrono: los fragmentos se producen en el bucle y se consumen desde el hilo."""
+        chunks: "queue.Queue" = queue.Queue()
+        done = object()
+
+        async def _produce() -> None:
+            try:
+                async with self._semaphore:
+                    if self._bucket is not None:
+                        await self._bucket.acquire()
+                    self.in_flight += 1
+                    try:
+                        response = await self._model.generate_content_async(
+                            prompt, generation_config=generation_config, stream=True
+                        )
+                        async for chunk in response:
+                            try:
+                                text = chunk.text
+                            except ValueError:
+                                # Fragmentos sin texto (p. ej. solo metadatos de seguridad)
+                                continue
+                            if text:
+                                chunks.put(text)
+                    finally:
+                        self.in_flight -= 1
+            except BaseException as e:  # se propaga al consumidor
+                chunks.put(e)
+            finally:
+                chunks.put(done)
+
+        future = self.submit(_produce())
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Si el consumidor deja de leer, cancelar la generación en curso
+            future.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rate_per_minute": self.rate_per_minute or None,
+            "in_flight": self.in_flight,
+        }
@@ -0,0 +1,245 @@
+"""
+gemini_cache.py
+Caché de respuestas de Gemini direccionada por contenido (hash del prompt y parámetros).
+
+Incluye dos backends intercambiables:
+- MemoryCacheBackend: LRU en memoria del proceso.
+- SQLiteCacheBackend: archivo SQLite compartido por todos los workers de gunicorn.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# ============================
+# Backends
+# ============================
+
+
+class MemoryCacheBackend:
+    """Caché LRU con TTL en memoria (por proceso)."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max(1, int(max_entries))
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float]) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class SQLiteCacheBackend:
+    """Caché LRU con TTL persistida en SQLite, compartida entre procesos."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 5000, table: str = "gemini_cache"):
+        if not table.isidentifier():
+            raise ValueError(f"Nombre de tabla inválido: {table}")
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.table = table
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table}_access ON {table} (last_access)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Una conexión por operación: seguro entre hilos y procesos
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float]) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?", (now,)
+            )
+            # Evicción LRU: conservar solo las entradas accedidas más recientemente
+            conn.execute(
+                f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def size(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+# ============================
+# Caché de respuestas
+# ============================
+
+
+class ResponseCache:
+    """Envuelve un backend y lleva contadores de aciertos/fallos."""
+
+    def __init__(self, backend, ttl: Optional[float] = 86400):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, temperature: float, max_tokens: int) -> str:
+        """Hash SHA-256 canónico de (modelo, prompt, temperatura, max_tokens)."""
+        payload = json.dumps(
+            [model, prompt, round(float(temperature), 4), int(max_tokens)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception:
+            # La caché nunca debe romper una petición
+            pass
+
+    def delete(self, key: str) -> None:
+        try:
+            self.backend.delete(key)
+        except Exception:
+            pass
+
+    def clear(self) -> None:
+        self.backend.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        try:
+            size = self.backend.size()
+        except Exception:
+            size = None
+        return {
+            "backend": self.backend.name,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": size,
+            "ttl_seconds": self.ttl,
+        }
+
+
+def create_cache_from_env() -> Optional[ResponseCache]:
+    """Crea la caché según GEMINI_CACHE_BACKEND (memory | sqlite | none)."""
+    backend_name = os.getenv("GEMINI_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("GEMINI_CACHE_TTL", "86400"))
+    max_entries = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "1000"))
+
+    if backend_name in ("none", "off", "disabled", ""):
+        return None
+    if backend_name == "sqlite":
+        path = os.getenv(
+            "GEMINI_CACHE_PATH",
+            os.path.join(tempfile.gettempdir(), "icfes_gemini_cache.sqlite3"),
+        )
+        backend = SQLiteCacheBackend(path, max_entries=max_entries)
+    else:
+        backend = MemoryCacheBackend(max_entries=max_entries)
+    return ResponseCache(backend, ttl=ttl)
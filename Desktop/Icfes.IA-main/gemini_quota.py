@@ -0,0 +1,126 @@
+"""
+gemini_quota.py
+Estado de cuota de Gemini compartido entre workers (SQLite).
+
+Cuando Gemini responde 429 se registra hasta cuándo está bloqueada la cuota
+(Retry-After) y el evento en una ventana reciente. Todos los workers consultan
+el mismo archivo antes de llamar a Gemini, de modo que solo el primero en
+chocar con el límite paga la petición fallida y el resto responde rápido.
+"""
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+_RETRY_DELAY_RE = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+_RETRY_AFTER_RE = re.compile(r"retry[-_ ]after\D{0,5}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+class GeminiRateLimited(Exception):
+    """La cuota de Gemini está agotada; reintentar después de `retry_after` segundos."""
+
+    def __init__(self, retry_after: float, message: str = "Rate limit excedido en Gemini"):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+def parse_retry_after(error: BaseException) -> Optional[float]:
+    """Extrae el tiempo de espera sugerido de un error 429 de Gemini, si viene."""
+    for attr in ("retry_after", "retry_delay"):
+        value = getattr(error, attr, None)
+        if isinstance(value, (int, float)):
+            return float(value)
+    text = str(error)
+    m = _RETRY_DELAY_RE.search(text) or _RETRY_AFTER_RE.search(text)
+    return float(m.group(1)) if m else None
+
+
+class QuotaTracker:
+    """Registro de bloqueos por cuota, persistido en SQLite y compartido entre procesos."""
+
+    def __init__(self, path: str, *, window: float = 300.0, base_backoff: float = 10.0, max_backoff: float = 120.0):
+        self.path = path
+        self.window = window
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        # Copia local del bloqueo para no leer SQLite en cada petición
+        self._blocked_until = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS quota_state (id INTEGER PRIMARY KEY CHECK (id = 1), blocked_until REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_events (ts REAL NOT NULL, retry_after REAL)")
+            conn.execute("INSERT OR IGNORE INTO quota_state (id, blocked_until) VALUES (1, 0)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def recent_rate_limits(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM rate_limit_events WHERE ts >= ?", (time.time() - self.window,)
+            ).fetchone()[0]
+
+    def record_rate_limit(self, retry_after: Optional[float] = None) -> float:
+        """Registra un 429 y devuelve cuántos segundos queda bloqueada la cuota.
+
+        Sin Retry-After explícito se usa un backoff exponencial según los 429 recientes.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM rate_limit_events WHERE ts < ?", (now - self.window,))
+            recent = conn.execute("SELECT COUNT(*) FROM rate_limit_events").fetchone()[0]
+            if retry_after is None:
+                retry_after = min(self.base_backoff * (2 ** recent), self.max_backoff)
+            conn.execute("INSERT INTO rate_limit_events (ts, retry_after) VALUES (?, ?)", (now, retry_after))
+            conn.execute(
+                "UPDATE quota_state SET blocked_until = MAX(blocked_until, ?) WHERE id = 1", (now + retry_after,)
+            )
+            blocked_until = conn.execute("SELECT blocked_until FROM quota_state WHERE id = 1").fetchone()[0]
+        with self._lock:
+            self._blocked_until = blocked_until
+            self._checked_at = now
+        return max(0.0, blocked_until - now)
+
+    def retry_after(self) -> float:
+        """Segundos que faltan para que la cuota se libere (0 si no hay bloqueo)."""
+        now = time.time()
+        with self._lock:
+            if now - self._checked_at < 1.0:
+                return max(0.0, self._blocked_until - now)
+        try:
+            with self._connect() as conn:
+                blocked_until = conn.execute("SELECT blocked_until FROM quota_state WHERE id = 1").fetchone()[0]
+        except sqlite3.Error:
+            blocked_until = 0.0
+        with self._lock:
+            self._blocked_until = blocked_until
+            self._checked_at = now
+        return max(0.0, blocked_until - now)
+
+    def stats(self) -> dict:
+        return {
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "recent_rate_limits": self.recent_rate_limits(),
+            "window_seconds": self.window,
+        }
+
+
+def create_quota_tracker_from_env() -> QuotaTracker:
+    path = os.getenv("GEMINI_QUOTA_PATH", os.path.join(tempfile.gettempdir(), "icfes_gemini_quota.sqlite3"))
+    return QuotaTracker(path)
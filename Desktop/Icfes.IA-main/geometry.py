@@ -0,0 +1,138 @@
+"""
+geometry.py
+Dibujo de figuras geométricas (triángulos, polígonos, arcos, ángulos, funciones...)
+a partir del plan JSON de shapes que devuelve la IA.
+
+Usa solo la API orientada a objetos de Matplotlib (recibe el eje); lo ejecutan
+los procesos de render_pool.py.
+"""
+import logging
+
+import matplotlib.patches as patches
+import numpy as np
+
+from math_expr import UnsafeExpressionError, evaluate_samples
+
+logger = logging.getLogger(__name__)
+
+
+def draw_geometry(ax, shapes):
+    """Dibuja figuras en un eje Matplotlib a partir de una lista de shapes JSON."""
+    # Config base
+    ax.set_aspect('equal', adjustable='datalim')
+    ax.grid(True, linestyle='--', alpha=0.3)
+
+    # Colores y estilo
+    color_main = '#667eea'
+    color_aux = '#10b981'
+
+    # Utilidades
+    def as_point(p):
+        return (float(p[0]), float(p[1]))
+
+    for shape in shapes:
+        try:
+            stype = (shape.get('type') or '').lower()
+            if stype == 'triangle':
+                pts = [as_point(p) for p in shape.get('points', [])][:3]
+                if len(pts) == 3:
+                    poly = patches.Polygon(pts, closed=True, fill=False, edgecolor=color_main, linewidth=2)
+                    ax.add_patch(poly)
+            elif stype == 'polygon':
+                pts = [as_point(p) for p in shape.get('points', [])]
+                if len(pts) >= 3:
+                    poly = patches.Polygon(pts, closed=True, fill=False, edgecolor=color_main, linewidth=2)
+                    ax.add_patch(poly)
+            elif stype == 'rectangle':
+                x, y = as_point(shape.get('xy', [0, 0]))
+                w = float(shape.get('width', 1))
+                h = float(shape.get('height', 1))
+                rect = patches.Rectangle((x, y), w, h, fill=False, edgecolor=color_main, linewidth=2)
+                ax.add_patch(rect)
+            elif stype == 'circle':
+                cx, cy = as_point(shape.get('center', [0, 0]))
+                r = float(shape.get('radius', 1))
+                circ = patches.Circle((cx, cy), r, fill=False, edgecolor=color_main, linewidth=2)
+                ax.add_patch(circ)
+            elif stype == 'arc':
+                cx, cy = as_point(shape.get('center', [0, 0]))
+                r = float(shape.get('radius', 1))
+                t1 = float(shape.get('theta1', 0))
+                t2 = float(shape.get('theta2', 90))
+                arc = patches.Arc((cx, cy), 2*r, 2*r, angle=0, theta1=t1, theta2=t2, color=color_main, linewidth=2)
+                ax.add_patch(arc)
+            elif stype == 'angle':
+                atx, aty = as_point(shape.get('at', [0, 0]))
+                radius = float(shape.get('radius', 1))
+                start = float(shape.get('start_deg', 0))
+                end = float(shape.get('end_deg', 60))
+                # arco del ángulo
+                arc = patches.Arc((atx, aty), 2*radius, 2*radius, angle=0, theta1=start, theta2=end, color=color_aux, linewidth=2)
+                ax.add_patch(arc)
+                # rayos del ángulo
+                sx = atx + radius * np.cos(np.deg2rad(start))
+                sy = aty + radius * np.sin(np.deg2rad(start))
+                ex = atx + radius * np.cos(np.deg2rad(end))
+                ey = aty + radius * np.sin(np.deg2rad(end))
+                ax.plot([atx, sx], [aty, sy], color=color_aux, linewidth=2)
+                ax.plot([atx, ex], [aty, ey], color=color_aux, linewidth=2)
+            elif stype == 'segment':
+                p1 = as_point(shape.get('p1', [0, 0]))
+                p2 = as_point(shape.get('p2', [1, 0]))
+                ax.plot([p1[0], p2[0]], [p1[1], p2[1]], color=color_main, linewidth=2)
+            elif stype == 'point':
+                px, py = as_point(shape.get('at', [0, 0]))
+                label = shape.get('label')
+                ax.scatter([px], [py], color=color_aux, s=30)
+                if label:
+                    ax.text(px + 0.05, py + 0.05, str(label), color=color_aux, fontsize=9)
+            elif stype == 'axis' or stype == 'axes':
+                # Ejes cartesianos básicos
+                rng = float(shape.get('range', 5))
+                ax.axhline(0, color='#999', linewidth=1)
+                ax.axvline(0, color='#999', linewidth=1)
+                ax.set_xlim(-rng, rng)
+                ax.set_ylim(-rng, rng)
+                # labels opcionales
+                if shape.get('xlabel'):
+                    ax.set_xlabel(str(shape['xlabel']))
+                if shape.get('ylabel'):
+                    ax.set_ylabel(str(shape['ylabel']))
+            elif stype == 'function':
+                # Plot de función y = f(x), ej: sin(x), x**2
+                expr = str(shape.get('expr', ''))
+                x_range = shape.get('x_range', [-10, 10])
+                # Acotar muestras: el valor viene del plan de la IA
+                samples = min(max(int(shape.get('samples', 500)), 2), 5000)
+                color = shape.get('color', color_main)
+                try:
+                    xs = np.linspace(float(x_range[0]), float(x_range[1]), samples)
+                    # Expresión validada con lista blanca y compilada una vez a NumPy (ver math_expr.py)
+                    ys = evaluate_samples(expr, xs)
+                    ax.plot(xs, ys, color=color, linewidth=2)
+                except UnsafeExpressionError:
+                    logger.warning(f"Unsafe expression blocked: {expr}")
+                    # Add red warning text to the plot
+                    ax.text(0.5, 0.5, 'EXPRESIÓN INSEGURA BLOQUEADA\nUnsafe Expression Blocked',
+                           transform=ax.transAxes, fontsize=14, color='red',
+                           ha='center', va='center', bbox=dict(boxstyle="round,pad=0.3", facecolor="white", edgecolor="red"))
+                    continue
+                except Exception as e:
+                    logger.warning(f"Error evaluating safe expression '{expr}': {str(e)}")
+                    continue
+            elif stype == 'wave':
+                # Onda senoidal: A*sin(2*pi*f*x + phase)
+                A = float(shape.get('amplitude', 1))
+                f = float(shape.get('frequency', 1))
+                phase = float(shape.get('phase', 0))
+                x_range = shape.get('x_range', [0, 2*np.pi])
+                samples = int(shape.get('samples', 800))
+                color = shape.get('color', color_main)
+                xs = np.linspace(float(x_range[0]), float(x_range[1]), samples)
+                ys = A * np.sin(2*np.pi*f*xs + phase)
+                ax.plot(xs, ys, color=color, linewidth=2)
+            # Se pueden añadir más tipos: angle, arc, polygon, altitude, median, etc.
+        except Exception as _:
+            continue
+
+    ax.autoscale(enable=True, tight=True)
@@ -0,0 +1,34 @@
+"""
+gunicorn.conf.py
+Configuración opcional de gunicorn (se carga automáticamente desde el directorio de trabajo).
+
+Con PRELOAD_HEAVY_MODULES=true el proceso maestro importa matplotlib, numpy,
+sympy y PyPDF2 antes de crear los workers; los workers
+heredan esas páginas por copy-on-write y lo que corre en el proceso web (render
+con RENDER_POOL_WORKERS=0, figuras geométricas, PDF sin procesos) no paga el
+import. Los procesos de render y extracción usan 'spawn' y no heredan nada: con
+el mismo flag cada worker los arranca en segundo plano al iniciar (ver
+_warm_worker_pools en icfes_api.py). No se usa preload_app: la aplicación arranca hilos (banco de
+preguntas, bucle de Gemini, sondeo de salud) que deben crearse en cada worker.
+
+Los workers son gthread: cada uno atiende GUNICORN_THREADS peticiones a la vez,
+así que mientras una vista espera a Gemini (en el bucle async del proceso) el
+worker sigue atendiendo otras. Con el worker sync una petición ocupa el worker
+entero hasta que Gemini responde.
+"""
+import logging
+import os
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = max(1, int(os.getenv("GUNICORN_THREADS", "8")))
+
+
+def on_starting(server):
+    if os.getenv("PRELOAD_HEAVY_MODULES", "false").lower() not in ("1", "true", "yes"):
+        return
+    from lazy_imports import preload
+
+    timings = preload()
+    logging.getLogger("gunicorn.error").info(
+        f"Dependencias pesadas precargadas en el maestro ({sum(timings.values()):.2f}s): {timings}"
+    )
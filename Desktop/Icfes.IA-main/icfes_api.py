@@ -1,25 +1,34 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, Response, stream_with_context, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
 import google.generativeai as genai
 import os
+import asyncio
 from dotenv import load_dotenv
 import logging
 from datetime import datetime
 import json
-import PyPDF2
-from docx import Document
-from io import BytesIO
+import hashlib
 import re
 from werkzeug.utils import secure_filename
 import tempfile                                                                                                                          
-import matplotlib
-matplotlib.use('Agg')  # usar backend no interactivo para servidores
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from io import BytesIO
-import base64
-import numpy as np
-from charts import bar_chart_exam, pie_chart_exam
+import threading
+import time
+from circuit_breaker import CircuitOpenError, create_circuit_breaker_from_env
+from gemini_async import AsyncGeminiClient
+from gemini_cache import create_cache_from_env
+from gemini_quota import GeminiRateLimited, create_quota_tracker_from_env, parse_retry_after
+# matplotlib (charts.py), numpy, sympy y PyPDF2 se importan en su
+# primer uso: los gráficos en los procesos de render_pool.py y los documentos en su endpoint
+from render_pool import RenderPool, resolve_output
+from chart_cache import MIMETYPES, ChartCache, chart_spec_key
+from chart_data import GROUPINGS, aggregate, build_resumen, extract_items
+from document_cache import DocumentCache, create_document_cache_from_env
+from document_jobs import FINISHED, RetryJob, create_job_queue_from_env
+from document_text import extract_docx_text, extract_pdf_text, split_on_questions, warm_pool
+from question_bank import QuestionBank
+from question_parser import QuestionStreamParser, iter_streamed_questions, parse_question_block, parse_questions
+from upstream_health import UpstreamHealth
 
 import sys
 if hasattr(sys.stdout, "reconfigure"):
@@ -29,9 +38,6 @@ if hasattr(sys.stdout, "reconfigure"):
     except Exception:
         pass
 
-# Import sympy for safe mathematical evaluation
-import sympy as sp
-
 
 # Cargar variables de entorno
 load_dotenv()
@@ -40,8 +46,24 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Tamaño máximo de un documento subido y umbral a partir del cual la subida se vuelca a disco
+MAX_UPLOAD_BYTES = int(float(os.getenv('MAX_UPLOAD_MB', '10')) * 1024 * 1024)
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', str(512 * 1024)))
+
+
+class SpooledUploadRequest(Request):
+    """Los archivos subidos se guardan en memoria hasta UPLOAD_SPOOL_BYTES y después en un temporal en disco"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode='rb+')
+
+
 app = Flask(__name__, static_folder='static')
 app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key')
+app.request_class = SpooledUploadRequest
+# Werkzeug corta la lectura del cuerpo (413) en cuanto supera el límite, sin leerlo entero;
+# el margen cubre las cabeceras multipart y el resto de campos del formulario
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024
 
 
 # CORS configurado para desarrollo y producción
@@ -55,7 +77,8 @@ CORS(app, resources={
             "http://localhost:5000"
         ],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
+        "expose_headers": ["ETag", "Content-Location"]
     }
 })
 
@@ -78,16 +101,137 @@ genai.configure(api_key=GOOGLE_API_KEY)
 # ============================================================
 # CLASE EVALUADOR CON IA (GEMINI) - MEJORADO
 # ============================================================
+# Solo se cachean peticiones deterministas o casi deterministas
+GEMINI_CACHE_MAX_TEMPERATURE = float(os.getenv('GEMINI_CACHE_MAX_TEMPERATURE', '0.6'))
+
+# Límite global de generaciones simultáneas (por proceso) y de peticiones por minuto
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+GEMINI_RATE_PER_MINUTE = float(os.getenv('GEMINI_RATE_PER_MINUTE', '0'))
+# Si la cuota se libera antes de este tiempo (s) la petición espera; si no, se rechaza con 503
+GEMINI_QUOTA_MAX_QUEUE_WAIT = float(os.getenv('GEMINI_QUOTA_MAX_QUEUE_WAIT', '3'))
+
+# Errores que indican que Gemini no está disponible ahora (cuota agotada o circuito abierto):
+# se propagan tal cual para responder 503 + Retry-After en lugar de un 500 genérico
+GEMINI_UNAVAILABLE_ERRORS = (GeminiRateLimited, CircuitOpenError)
+
+# Sondeo de disponibilidad de Gemini para /ready (s); 0 desactiva el sondeo en segundo plano
+UPSTREAM_PROBE_INTERVAL = float(os.getenv('UPSTREAM_PROBE_INTERVAL', '60'))
+# Fallos consecutivos (tráfico real o sondeo) para considerar a Gemini caído
+UPSTREAM_DOWN_AFTER = int(os.getenv('UPSTREAM_DOWN_AFTER', '3'))
+# Si es true, /ready responde 503 también cuando el servicio está degradado
+READINESS_FAIL_WHEN_DEGRADED = os.getenv('READINESS_FAIL_WHEN_DEGRADED', 'false').lower() in ('1', 'true', 'yes')
+
 class GeminiEvaluator:
-    def __init__(self):
+    def __init__(self, cache=None, quota=None, breaker=None, health=None):
         self.model = genai.GenerativeModel('gemini-2.0-flash')
         self.default_model = "gemini-2.0-flash"
         self.custom_knowledge_base = {}  # Base de conocimiento personalizada
         self.trained_prompts = {}  # Prompts entrenados por competencia
+        self.cache = cache  # Caché de respuestas (ver gemini_cache.py)
+        self.quota = quota  # Estado de cuota compartido entre workers (ver gemini_quota.py)
+        # Circuit breaker por tasa de errores y latencia (ver circuit_breaker.py)
+        self.breaker = breaker if breaker is not None else create_circuit_breaker_from_env()
+        # Último estado conocido de Gemini para /ready (ver upstream_health.py)
+        self.health = health if health is not None else UpstreamHealth(
+            self.probe_upstream, interval=UPSTREAM_PROBE_INTERVAL, down_after=UPSTREAM_DOWN_AFTER
+        )
+        # Cliente async compartido: un bucle, un canal y un semáforo por proceso (ver gemini_async.py)
+        self.async_client = AsyncGeminiClient(
+            lambda: genai.GenerativeModel(self.default_model),
+            max_concurrency=GEMINI_MAX_CONCURRENCY,
+            rate_per_minute=GEMINI_RATE_PER_MINUTE
+        )
+
+    def _make_gemini_request(self, prompt, temperature=0.3, max_tokens=2000, max_retries=3, use_cache=None, validate=None):
+        """Hace una petición a la API de Google Gemini con manejo robusto de errores.
+
+        use_cache=None cachea automáticamente si temperature <= GEMINI_CACHE_MAX_TEMPERATURE.
+        validate(texto) -> bool: solo se cachean (y se sirven desde caché) las respuestas válidas.
+        La petición se ejecuta en el bucle async compartido y respeta el límite global.
+        """
+        return self.async_client.run(
+            self._gemini_request_in_loop(prompt, temperature, max_tokens, max_retries, use_cache, validate)
+        )
 
-    def _make_gemini_request(self, prompt, temperature=0.3, max_tokens=2000, max_retries=3):
-        """Hace una petición a la API de Google Gemini con manejo robusto de errores"""
+    async def _make_gemini_request_async(self, prompt, temperature=0.3, max_tokens=2000, max_retries=3, use_cache=None,
+                                         validate=None):
+        """Versión awaitable de _make_gemini_request para vistas `async def`"""
+        return await self.async_client.run_async(
+            self._gemini_request_in_loop(prompt, temperature, max_tokens, max_retries, use_cache, validate)
+        )
+
+    async def _gemini_request_in_loop(self, prompt, temperature, max_tokens, max_retries, use_cache, validate=None):
+        """Consulta la caché y, si no hay acierto, pide a Gemini (corre en el bucle compartido).
+
+        La caché (SQLite) se consulta en el executor por defecto para no bloquear el bucle.
+        """
+        if use_cache is None:
+            use_cache = temperature <= GEMINI_CACHE_MAX_TEMPERATURE
+        loop = asyncio.get_running_loop()
+        cache_key = None
+        if use_cache and self.cache is not None:
+            cache_key = self.cache.make_key(self.default_model, prompt, temperature, max_tokens)
+            cached = await loop.run_in_executor(None, self.cache.get, cache_key)
+            if cached is not None:
+                if validate is None or validate(cached):
+                    logger.info("Respuesta de Gemini servida desde caché")
+                    return cached
+                # Entrada inválida (p. ej. guardada antes de validar): se descarta y se pide de nuevo
+                await loop.run_in_executor(None, self.cache.delete, cache_key)
+
+        response_text = await self._request_gemini_uncached(prompt, temperature, max_tokens, max_retries)
+        if cache_key is not None and response_text and (validate is None or validate(response_text)):
+            await loop.run_in_executor(None, self.cache.set, cache_key, response_text)
+        return response_text
+
+    async def _wait_for_quota(self):
+        """Espera brevemente si la cuota está bloqueada o lanza GeminiRateLimited de inmediato.
+
+        El estado de cuota (SQLite) se lee en el executor por defecto para no bloquear el bucle.
+        """
+        if self.quota is None:
+            return
+        wait_time = await asyncio.get_running_loop().run_in_executor(None, self.quota.retry_after)
+        if wait_time <= 0:
+            return
+        if wait_time > GEMINI_QUOTA_MAX_QUEUE_WAIT:
+            raise GeminiRateLimited(wait_time)
+        logger.info(f"Cuota de Gemini bloqueada, en cola {wait_time:.1f} segundos")
+        await asyncio.sleep(wait_time)
+
+    def _record_upstream_success(self, latency):
+        """Registra una llamada correcta en el breaker y en el estado de salud"""
+        self.breaker.record_success(latency)
+        self.health.record_success()
+
+    def _record_upstream_failure(self, error):
+        """Registra un fallo del backend en el breaker y en el estado de salud"""
+        self.breaker.record_failure()
+        self.health.record_failure(error)
+
+    def probe_upstream(self):
+        """Sondeo ligero: consulta los metadatos del modelo sin generar (no gasta cuota de generación)"""
+        genai.get_model(f"models/{self.default_model}")
+
+    def _handle_rate_limit(self, error):
+        """Registra un 429 en el estado compartido y devuelve la excepción a lanzar"""
+        retry_after = parse_retry_after(error)
+        if self.quota is not None:
+            retry_after = self.quota.record_rate_limit(retry_after)
+        logger.warning(f"Rate limit alcanzado. Cuota bloqueada {retry_after or 0:.0f} segundos")
+        return GeminiRateLimited(retry_after or 10)
+
+    async def _request_gemini_uncached(self, prompt, temperature, max_tokens, max_retries):
+        """Envía la petición a Gemini con reintentos, sin pasar por la caché.
+
+        Ante un 429 no se duerme: se registra el bloqueo y se lanza GeminiRateLimited.
+        Con el circuito abierto falla de inmediato con CircuitOpenError. Los 429 y los
+        requests inválidos no cuentan como fallos del backend para el breaker.
+        """
         for attempt in range(max_retries):
+            await self._wait_for_quota()
+            self.breaker.before_call()
+            latencies = []
             try:
                 logger.info(f"Enviando petición a Gemini (intento {attempt + 1}/{max_retries})")
 
@@ -96,40 +240,70 @@ class GeminiEvaluator:
                     max_output_tokens=max_tokens
                 )
 
-                response = self.model.generate_content(
-                    prompt,
-                    generation_config=generation_config
-                )
+                response = await self.async_client.generate(prompt, generation_config, on_latency=latencies.append)
 
                 if response and response.text:
+                    self._record_upstream_success(latencies[-1])
                     return response.text
 
                 raise Exception("Respuesta vacía de Gemini")
 
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+
             except Exception as e:
                 error_str = str(e).lower()
 
                 if "rate limit" in error_str or "429" in error_str or "quota" in error_str:
-                    if attempt < max_retries - 1:
-                        wait_time = min((2 ** attempt) * 10, 60)
-                        logger.warning(f"Rate limit alcanzado. Esperando {wait_time} segundos...")
-                        import time
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        raise Exception("Rate limit excedido en Gemini")
+                    self.breaker.release()
+                    # Escritura en SQLite compartida con otros workers: fuera del bucle
+                    raise await asyncio.get_running_loop().run_in_executor(None, self._handle_rate_limit, e)
 
                 elif "invalid" in error_str or "400" in error_str:
+                    self.breaker.release()
                     raise Exception("Request inválido a Gemini")
 
                 elif "api key" in error_str or "403" in error_str:
+                    self._record_upstream_failure(e)
                     raise Exception("API Key de Gemini inválida")
 
                 else:
+                    self._record_upstream_failure(e)
                     logger.error(f"Error en petición a Gemini: {str(e)}")
                     if attempt == max_retries - 1:
                         raise
 
+    def _stream_gemini_request(self, prompt, temperature=0.7, max_tokens=4096):
+        """Hace una petición en streaming a Gemini y va devolviendo los fragmentos de texto"""
+        logger.info("Enviando petición en streaming a Gemini")
+        generation_config = genai.types.GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=max_tokens
+        )
+        if self.quota is not None and self.quota.retry_after() > 0:
+            raise GeminiRateLimited(self.quota.retry_after())
+        self.breaker.before_call()
+        started = time.monotonic()
+        first_chunk = None  # la latencia del streaming se mide hasta el primer fragmento
+        try:
+            for chunk in self.async_client.stream(prompt, generation_config):
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                yield chunk
+        except Exception as e:
+            error_str = str(e).lower()
+            if "rate limit" in error_str or "429" in error_str or "quota" in error_str:
+                self.breaker.release()
+                raise self._handle_rate_limit(e)
+            self._record_upstream_failure(e)
+            raise
+        except GeneratorExit:
+            # El consumidor dejó de leer porque ya tiene lo que necesitaba
+            self._record_upstream_success(first_chunk if first_chunk is not None else time.monotonic() - started)
+            raise
+        self._record_upstream_success(first_chunk if first_chunk is not None else time.monotonic() - started)
+
     def add_custom_knowledge(self, competencia, knowledge_text):
         """Añade conocimiento personalizado para una competencia específica"""
         if competencia not in self.custom_knowledge_base:
@@ -162,9 +336,9 @@ INSTRUCCIONES ADICIONALES:
 
         return enhanced_prompt
 
-    def analyze_document_content(self, text):
-        """Analiza el documento completo y genera retroalimentación detallada"""
-        prompt = f"""
+    def _build_document_prompt(self, text):
+        """Prompt de análisis para un fragmento de documento (a lo sumo DOCUMENT_CHUNK_CHARS caracteres)"""
+        return f"""
 Eres un experto pedagogo y analista educativo especializado en evaluaciones ICFES colombianas. Analiza el siguiente texto que contiene preguntas y respuestas de evaluación.
 
 INSTRUCCIONES ESPECÍFICAS PARA ICFES:
@@ -208,73 +382,125 @@ FORMATO JSON obligatorio (responde con el JSON directamente, sin bloques de cód
 IMPORTANTE: El JSON debe ser válido y parseable. No incluyas comas al final de listas u objetos.
 
 TEXTO A ANALIZAR:
-{text[:7000]}
+{text[:DOCUMENT_CHUNK_CHARS]}
 
 Responde ÚNICAMENTE con el JSON válido.
 """
+
+    def analyze_document_content(self, text, use_cache=None):
+        """Analiza un fragmento del documento y genera retroalimentación detallada.
+
+        use_cache=False ignora la caché de respuestas (force_refresh); solo se cachean respuestas JSON válidas.
+        """
         try:
-            response = self._make_gemini_request(prompt, temperature=0.4, max_tokens=6000)
-            return response
+            return self._make_gemini_request(
+                self._build_document_prompt(text), temperature=0.4, max_tokens=6000,
+                use_cache=use_cache, validate=is_json_response
+            )
+        except GEMINI_UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error analizando documento con Gemini: {str(e)}")
+            raise Exception(f"Error al analizar documento con Gemini: {str(e)}")
+
+    async def analyze_document_content_async(self, text, use_cache=None):
+        """Versión awaitable de analyze_document_content (para analizar fragmentos en paralelo)"""
+        try:
+            return await self._make_gemini_request_async(
+                self._build_document_prompt(text), temperature=0.4, max_tokens=6000,
+                use_cache=use_cache, validate=is_json_response
+            )
+        except GEMINI_UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error analizando documento con Gemini: {str(e)}")
             raise Exception(f"Error al analizar documento con Gemini: {str(e)}")
 
 # Inicializar evaluador
-evaluator = GeminiEvaluator()
+evaluator = GeminiEvaluator(
+    cache=create_cache_from_env(),
+    quota=create_quota_tracker_from_env(),
+    breaker=create_circuit_breaker_from_env()
+)
+evaluator.health.start()
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def handle_request_too_large(e):
+    """Subida que supera MAX_CONTENT_LENGTH: se rechaza sin terminar de leer el cuerpo"""
+    return jsonify({
+        'error': f'El archivo es demasiado grande. Máximo {MAX_UPLOAD_BYTES // (1024 * 1024)}MB.'
+    }), 413
+
+
+@app.errorhandler(GeminiRateLimited)
+def handle_gemini_rate_limited(e):
+    """Responde rápido con 503 + Retry-After cuando la cuota de Gemini está agotada"""
+    response = jsonify({
+        'error': 'El servicio de IA está temporalmente saturado. Intenta de nuevo en unos segundos.',
+        'retry_after': e.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@app.errorhandler(CircuitOpenError)
+def handle_circuit_open(e):
+    """Responde rápido con 503 + Retry-After mientras el circuito hacia Gemini está abierto"""
+    response = jsonify({
+        'error': 'El servicio de IA no está disponible en este momento. Intenta de nuevo en unos segundos.',
+        'retry_after': e.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 # ============================================================
 # UTILIDADES PARA PROCESAMIENTO DE ARCHIVOS
 # ============================================================
-def extract_text_from_pdf(file_content):
-    """Extrae texto de un archivo PDF"""
+# Caracteres del documento que se analizan en total; la extracción se detiene al alcanzarlos
+DOCUMENT_TEXT_BUDGET = int(os.getenv('DOCUMENT_TEXT_BUDGET', '60000'))
+# Tamaño de cada fragmento enviado a Gemini y fragmentos analizados a la vez por documento
+DOCUMENT_CHUNK_CHARS = int(os.getenv('DOCUMENT_CHUNK_CHARS', '7000'))
+DOCUMENT_ANALYSIS_CONCURRENCY = max(1, int(os.getenv('DOCUMENT_ANALYSIS_CONCURRENCY', '4')))
+
+# Caché persistente de análisis por contenido del archivo
+document_cache = create_document_cache_from_env()
+# Versión del análisis: cambia sola al editar el prompt o la división en fragmentos
+DOCUMENT_PROMPT_VERSION = hashlib.sha256(
+    f"{evaluator._build_document_prompt('')}|{DOCUMENT_CHUNK_CHARS}|{DOCUMENT_TEXT_BUDGET}".encode('utf-8')
+).hexdigest()[:16]
+# Procesos para extraer páginas de PDF grandes (0 = secuencial) y páginas mínimas para usarlos
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', '0'))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '20'))
+
+
+def extract_text_from_pdf(document, max_chars=DOCUMENT_TEXT_BUDGET, on_page=None):
+    """Extrae texto de un PDF (bytes o archivo binario abierto) hasta max_chars caracteres.
+
+    Devuelve un PdfExtraction (texto + tiempos por página).
+    """
     try:
-        pdf_file = BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-
-        if len(pdf_reader.pages) == 0:
-            raise Exception("El PDF no contiene páginas")
-
-        for page_num, page in enumerate(pdf_reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text += f"\n--- Página {page_num + 1} ---\n"
-                    text += page_text + "\n"
-            except Exception as e:
-                logger.warning(f"Error extrayendo página {page_num + 1}: {str(e)}")
-                continue
-
-        if not text.strip():
-            raise Exception("No se pudo extraer texto legible del PDF")
-
-        return text.strip()
+        return extract_pdf_text(
+            document,
+            max_chars=max_chars,
+            workers=PDF_EXTRACT_WORKERS,
+            parallel_min_pages=PDF_PARALLEL_MIN_PAGES,
+            on_page=on_page,
+        )
     except Exception as e:
         logger.error(f"Error procesando PDF: {str(e)}")
         raise Exception(f"Error al procesar PDF: {str(e)}")
 
-def extract_text_from_docx(file_content):
-    """Extrae texto de un archivo Word"""
-    try:
-        doc_file = BytesIO(file_content)
-        doc = Document(doc_file)
-        text = ""
-
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text += paragraph.text + "\n"
+def extract_text_from_docx(document, max_chars=DOCUMENT_TEXT_BUDGET):
+    """Extrae texto de un archivo Word (bytes o archivo binario abierto).
 
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    if cell.text.strip():
-                        text += cell.text + " "
-                text += "\n"
-
-        if not text.strip():
-            raise Exception("No se pudo extraer texto del documento Word")
-
-        return text.strip()
+    Lee word/document.xml en streaming, con párrafos y tablas en orden de documento,
+    y deja de leer al superar max_chars (el texto devuelto puede pasarse por una línea).
+    """
+    try:
+        return extract_docx_text(document, max_chars=max_chars)
     except Exception as e:
         logger.error(f"Error procesando Word: {str(e)}")
         raise Exception(f"Error al procesar documento Word: {str(e)}")
@@ -303,6 +529,15 @@ def clean_json_response(text):
         logger.error(f"Error limpiando JSON: {str(e)}")
         return text
 
+
+def is_json_response(text):
+    """True si la respuesta de IA contiene un JSON interpretable (validación antes de cachearla)"""
+    try:
+        json.loads(clean_json_response(text))
+        return True
+    except (TypeError, ValueError):
+        return False
+
 # ============================================================
 # PARSEO ROBUSTO DE RESPUESTA JSON (PLAN DE FIGURAS)
 # ============================================================
@@ -357,6 +592,11 @@ def _safe_parse_shapes_response(raw_text):
     # 5) Fallback vacío
     return []
 
+
+def _has_shapes(raw_text):
+    """Validación para la caché de Gemini: el plan contiene al menos una figura"""
+    return bool(_safe_parse_shapes_response(raw_text))
+
 # ============================================================
 # AUTENTICACIÓN REMOVIDA - SOLO ENDPOINTS DE IA
 # ============================================================
@@ -366,24 +606,8 @@ def _safe_parse_shapes_response(raw_text):
 # ============================================================
 # ENDPOINTS DE GENERACIÓN DE PREGUNTAS
 # ============================================================
-@app.route('/generate-question', methods=['POST'])
-def generate_question():
-    """Generar preguntas ICFES con diferentes niveles de dificultad usando conocimiento personalizado"""
-    data = request.json
-    competencia = data.get('competencia')
-    num_questions = data.get('num_questions', 1)
-    dificultad = data.get('dificultad', 'medio').lower()
-    use_custom_knowledge = data.get('use_custom_knowledge', True)  # Por defecto usa conocimiento personalizado
-
-    if not competencia:
-        return jsonify({'error': 'Competencia es requerida'}), 400
-
-    if num_questions < 1 or num_questions > 20:
-        return jsonify({'error': 'El número de preguntas debe estar entre 1 y 20'}), 400
-
-    if dificultad not in ['facil', 'medio', 'avanzado']:
-        return jsonify({'error': 'Dificultad debe ser: facil, medio o avanzado'}), 400
-
+def _build_question_prompt(competencia, num_questions, dificultad, use_custom_knowledge):
+    """Construye el prompt de generación de preguntas ICFES para una competencia y dificultad"""
     if dificultad == 'facil':
         nivel_texto = "básico/fácil"
         caracteristicas = """
@@ -437,62 +661,400 @@ Genera las preguntas ahora:"""
 
     # Usar conocimiento personalizado si está disponible y solicitado
     if use_custom_knowledge and competencia in evaluator.custom_knowledge_base:
-        prompt = evaluator.get_enhanced_prompt(competencia, base_prompt)
-        logger.info(f"Usando conocimiento personalizado para competencia: {competencia}")
-    else:
-        prompt = base_prompt
-        logger.info(f"Generando preguntas sin conocimiento personalizado para: {competencia}")
+        return evaluator.get_enhanced_prompt(competencia, base_prompt)
+    return base_prompt
+
+
+def _split_question_blocks(questions_text):
+    """Parsea el texto generado y devuelve los bloques válidos en formato canónico.
+
+    Los bloques mal formados se descartan individualmente (ver question_parser.py).
+    """
+    questions, _ = parse_questions(questions_text)
+    return [q.to_text() for q in questions]
+
+
+def _merge_questions(existing, new_questions, limit):
+    """Añade preguntas nuevas sin repetir enunciados, hasta `limit`"""
+    seen = {q.fingerprint_text() for q in existing}
+    merged = list(existing)
+    for question in new_questions:
+        if len(merged) >= limit:
+            break
+        fp = question.fingerprint_text()
+        if fp in seen:
+            continue
+        seen.add(fp)
+        merged.append(question)
+    return merged
+
+
+def _questions_payload(questions):
+    """Representación JSON de las preguntas: texto canónico y objetos estructurados"""
+    return {
+        'questions': '\n\n'.join(q.to_text() for q in questions),
+        'items': [q.to_dict() for q in questions]
+    }
+
+
+# Métricas de completado parcial por (competencia, dificultad, origen): 'user' (peticiones)
+# o 'refill' (recarga del banco en segundo plano), para que el tráfico real no se mezcle
+_generation_metrics = {}
+_generation_metrics_lock = threading.Lock()
+
+
+def _record_generation_metrics(competencia, dificultad, requested, first_pass, topup_requests, topup_questions, delivered,
+                               source='user'):
+    """Acumula cuántas generaciones necesitaron completar preguntas faltantes"""
+    with _generation_metrics_lock:
+        entry = _generation_metrics.setdefault((competencia, dificultad, source), {
+            'generations': 0,
+            'complete_first_try': 0,
+            'partial_topups': 0,
+            'topup_requests': 0,
+            'questions_requested': 0,
+            'questions_topped_up': 0,
+            'incomplete': 0
+        })
+        entry['generations'] += 1
+        entry['questions_requested'] += requested
+        if first_pass >= requested:
+            entry['complete_first_try'] += 1
+        if topup_requests:
+            entry['partial_topups'] += 1
+            entry['topup_requests'] += topup_requests
+            entry['questions_topped_up'] += topup_questions
+        if delivered < requested:
+            entry['incomplete'] += 1
+
+
+def _generate_questions(competencia, dificultad, use_custom_knowledge, num_questions, initial=None, max_attempts=2,
+                        source='user'):
+    """Genera `num_questions` preguntas válidas conservando las ya obtenidas.
+
+    Cada intento adicional pide solo las preguntas que faltan y se fusiona
+    con las anteriores. `initial` permite partir de preguntas ya recibidas
+    (p. ej. en streaming). `source` etiqueta las métricas ('user' o 'refill').
+    Lanza la última excepción si no se obtuvo ninguna.
+    """
+    questions = list(initial or [])
+    first_pass = len(questions) if initial is not None else None
+    topup_requests = 0
+    last_error = None
 
-    max_attempts = 2
     for attempt in range(max_attempts):
+        missing = num_questions - len(questions)
+        if missing <= 0:
+            break
+        prompt = _build_question_prompt(competencia, missing, dificultad, use_custom_knowledge)
+        if first_pass is not None:
+            if questions:
+                topup_requests += 1
+                logger.warning(f"Formato incompleto: {len(questions)} de {num_questions} preguntas válidas, pidiendo solo las {missing} faltantes...")
+            # Reforzar prompt
+            prompt = prompt.replace("Genera las preguntas ahora:", f"Genera las preguntas ahora:\n\nCRÍTICO: Incluye EXACTAMENTE {missing} bloques completos con 'Respuesta correcta:' y 'Explicación:' para cada uno.")
         try:
             questions_text = evaluator._make_gemini_request(
                 prompt,
                 temperature=0.7,
                 max_tokens=4096
             )
+            parsed, rejected = parse_questions(questions_text or '')
+            if rejected:
+                logger.warning(f"Bloques mal formados descartados en intento {attempt + 1}: {rejected}")
+            questions = _merge_questions(questions, parsed, num_questions)
+        except Exception as e:
+            logger.error(f"Error en intento {attempt + 1}: {str(e)}")
+            last_error = e
+            if isinstance(e, GEMINI_UNAVAILABLE_ERRORS):
+                # No insistir mientras la cuota está agotada o el circuito está abierto
+                if first_pass is None:
+                    first_pass = len(questions)
+                break
+        if first_pass is None:
+            first_pass = len(questions)
+
+    _record_generation_metrics(
+        competencia, dificultad, num_questions, first_pass,
+        topup_requests, max(0, len(questions) - first_pass), len(questions), source
+    )
+    if not questions and last_error is not None:
+        raise last_error
+    return questions
+
+
+def _generate_question_blocks(competencia, dificultad, use_custom_knowledge, num_questions):
+    """Genera preguntas con Gemini y devuelve solo los bloques válidos (usado por el banco)"""
+    questions = _generate_questions(competencia, dificultad, use_custom_knowledge, num_questions, source='refill')
+    return [q.to_text() for q in questions]
+
+
+def _knowledge_version(competencia, use_custom_knowledge):
+    """Versión del conocimiento personalizado de una competencia (la base solo crece)"""
+    if not use_custom_knowledge:
+        return 0
+    return len(evaluator.custom_knowledge_base.get(competencia, []))
+
+
+# ============================================================
+# BANCO DE PREGUNTAS PRE-GENERADAS
+# ============================================================
+QUESTION_BANK_ENABLED = os.getenv('QUESTION_BANK_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+question_bank = QuestionBank(
+    _generate_question_blocks,
+    low_water=int(os.getenv('QUESTION_BANK_LOW_WATER', '5')),
+    target=int(os.getenv('QUESTION_BANK_TARGET', '10')),
+    batch_size=int(os.getenv('QUESTION_BANK_BATCH_SIZE', '5')),
+    refill_interval=float(os.getenv('QUESTION_BANK_REFILL_INTERVAL', '5')),
+    bucket_ttl=float(os.getenv('QUESTION_BANK_BUCKET_TTL', '3600')),
+    max_buckets=int(os.getenv('QUESTION_BANK_MAX_BUCKETS', '50')),
+    served_history=int(os.getenv('QUESTION_BANK_SERVED_HISTORY', '100')),
+)
+
+
+def _register_question_bucket(competencia, dificultad, use_custom_knowledge, pinned=False):
+    """Registra el bucket y arranca el hilo de recarga si está habilitado"""
+    key = question_bank.register(
+        competencia, dificultad, _knowledge_version(competencia, use_custom_knowledge), use_custom_knowledge, pinned
+    )
+    question_bank.start()
+    return key
+
 
-            if not questions_text or len(questions_text) < 50:
-                if attempt < max_attempts - 1:
-                    logger.warning(f"Respuesta incompleta en intento {attempt + 1}, reintentando...")
-                    # Hacer prompt más estricto en reintentos
-                    prompt += "\n\nIMPORTANTE: ¡NO omitas NINGÚN elemento! Cada pregunta DEBE incluir Pregunta, 4 opciones (a,b,c,d), Respuesta correcta y Explicación completa."
-                    continue
-                return jsonify({'error': 'No se pudieron generar preguntas válidas'}), 500
-
-            # Validar formato: contar ocurrencias de "Respuesta correcta:"
-            correct_count = questions_text.count("Respuesta correcta:")
-            if correct_count < num_questions:
-                if attempt < max_attempts - 1:
-                    logger.warning(f"Formato incompleto: solo {correct_count} respuestas correctas de {num_questions} requeridas, reintentando...")
-                    # Reforzar prompt
-                    prompt = prompt.replace("Genera las preguntas ahora:", f"Genera las preguntas ahora:\n\nCRÍTICO: Incluye EXACTAMENTE {num_questions} bloques completos con 'Respuesta correcta:' y 'Explicación:' para cada uno.")
-                    continue
-                logger.error(f"Formato incompleto final: {correct_count}/{num_questions}")
-                return jsonify({'error': 'Respuesta incompleta después de reintentos, verifica la API key'}), 500
-
-            logger.info(f"Preguntas generadas exitosamente: {competencia} - {dificultad} - {num_questions} - Custom Knowledge: {use_custom_knowledge} (intento {attempt + 1})")
+def _prewarm_question_bank():
+    """Registra las competencias comunes indicadas en QUESTION_BANK_PREWARM"""
+    competencias = [c.strip() for c in os.getenv('QUESTION_BANK_PREWARM', '').split(',') if c.strip()]
+    dificultades = [d.strip() for d in os.getenv('QUESTION_BANK_PREWARM_DIFICULTADES', 'medio').split(',') if d.strip()]
+    for competencia in competencias:
+        for dificultad in dificultades:
+            _register_question_bucket(competencia, dificultad, True, pinned=True)
 
+
+if QUESTION_BANK_ENABLED:
+    _prewarm_question_bank()
+
+
+@app.route('/generation-metrics', methods=['GET'])
+def generation_metrics():
+    """Métricas de generación: frecuencia de completados parciales por competencia, dificultad y origen
+
+    'source' es 'user' para las peticiones de los estudiantes y 'refill' para la recarga del banco.
+    """
+    with _generation_metrics_lock:
+        metrics = [
+            {'competencia': comp, 'dificultad': dif, 'source': source, **values}
+            for (comp, dif, source), values in _generation_metrics.items()
+        ]
+    return jsonify({'metrics': metrics}), 200
+
+
+@app.route('/question-bank', methods=['GET'])
+def question_bank_status():
+    """Estado del banco de preguntas pre-generadas"""
+    return jsonify({'enabled': QUESTION_BANK_ENABLED, **question_bank.snapshot()}), 200
+
+
+def _validate_question_request(data):
+    """Valida los parámetros de generación de preguntas. Devuelve el mensaje de error o None"""
+    if not data.get('competencia'):
+        return 'Competencia es requerida'
+
+    try:
+        num_questions = int(data.get('num_questions', 1))
+    except (TypeError, ValueError):
+        return 'El número de preguntas debe estar entre 1 y 20'
+    if num_questions < 1 or num_questions > 20:
+        return 'El número de preguntas debe estar entre 1 y 20'
+
+    if str(data.get('dificultad', 'medio')).lower() not in ['facil', 'medio', 'avanzado']:
+        return 'Dificultad debe ser: facil, medio o avanzado'
+    return None
+
+
+def _take_banked_fallback(competencia, dificultad, use_custom_knowledge, num_questions, session_id):
+    """Preguntas del banco cuando Gemini no está disponible o no completó el pedido (pueden ser menos de las pedidas)"""
+    if not QUESTION_BANK_ENABLED:
+        return []
+    bucket_key = _register_question_bucket(competencia, dificultad, use_custom_knowledge)
+    banked = question_bank.take(bucket_key, num_questions, session_id, partial=True) or []
+    return [parse_question_block(block) for block in banked]
+
+
+def _sse_event(event, payload):
+    """Serializa un evento Server-Sent Events con datos JSON"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route('/generate-question', methods=['POST'])
+def generate_question():
+    """Generar preguntas ICFES con diferentes niveles de dificultad usando conocimiento personalizado"""
+    data = request.json
+    error = _validate_question_request(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    competencia = data.get('competencia')
+    num_questions = int(data.get('num_questions', 1))
+    dificultad = data.get('dificultad', 'medio').lower()
+    use_custom_knowledge = data.get('use_custom_knowledge', True)  # Por defecto usa conocimiento personalizado
+
+    # Servir desde el banco de preguntas si hay suficientes preguntas no vistas
+    session_id = data.get('session_id')
+    uses_knowledge = use_custom_knowledge and competencia in evaluator.custom_knowledge_base
+    if QUESTION_BANK_ENABLED:
+        bucket_key = _register_question_bucket(competencia, dificultad, use_custom_knowledge)
+        banked = question_bank.take(bucket_key, num_questions, session_id)
+        if banked:
+            logger.info(f"Preguntas servidas desde el banco: {competencia} - {dificultad} - {num_questions}")
             return jsonify({
-                'questions': questions_text,
-                'custom_knowledge_used': use_custom_knowledge and competencia in evaluator.custom_knowledge_base,
+                **_questions_payload([parse_question_block(block) for block in banked]),
+                'custom_knowledge_used': uses_knowledge,
                 'competencia': competencia,
                 'dificultad': dificultad,
-                'num_questions': num_questions
+                'num_questions': num_questions,
+                'from_bank': True
             }), 200
 
-        except Exception as e:
-            logger.error(f"Error en intento {attempt + 1}: {str(e)}")
-            if attempt == max_attempts - 1:
-                return jsonify({'error': f'Error al generar preguntas: {str(e)}'}), 500
+    if uses_knowledge:
+        logger.info(f"Usando conocimiento personalizado para competencia: {competencia}")
+    else:
+        logger.info(f"Generando preguntas sin conocimiento personalizado para: {competencia}")
+
+    # Se conservan los bloques válidos y en cada reintento solo se piden los que faltan
+    questions, unavailable = [], None
+    try:
+        if evaluator.breaker.is_open():
+            raise CircuitOpenError(evaluator.breaker.retry_after())
+        questions = _generate_questions(competencia, dificultad, use_custom_knowledge, num_questions)
+    except CircuitOpenError as e:
+        unavailable = e
+    except GEMINI_UNAVAILABLE_ERRORS:
+        raise
+    except Exception as e:
+        return jsonify({'error': f'Error al generar preguntas: {str(e)}'}), 500
+
+    generated = len(questions)
+    if QUESTION_BANK_ENABLED and questions:
+        question_bank.mark_served([q.to_text() for q in questions], session_id)
+    if generated < num_questions:
+        # Circuito abierto o generación incompleta: se completa con el banco, aunque no alcance
+        fallback = _take_banked_fallback(competencia, dificultad, use_custom_knowledge, num_questions - generated, session_id)
+        questions = _merge_questions(questions, fallback, num_questions)
+        if not questions:
+            if unavailable is not None:
+                raise unavailable
+            return jsonify({'error': 'No se pudieron generar preguntas válidas'}), 500
+        logger.warning(
+            f"Generación degradada: {generated} generadas + {len(questions) - generated} del banco "
+            f"de {num_questions} pedidas{' (circuito abierto)' if unavailable is not None else ''}"
+        )
+    else:
+        logger.info(f"Preguntas generadas exitosamente: {competencia} - {dificultad} - {num_questions} - Custom Knowledge: {use_custom_knowledge}")
+
+    return jsonify({
+        **_questions_payload(questions),
+        'custom_knowledge_used': uses_knowledge,
+        'competencia': competencia,
+        'dificultad': dificultad,
+        'num_questions': num_questions,
+        'from_bank': len(questions) > generated,
+        **({'degraded': True} if len(questions) < num_questions or unavailable is not None else {})
+    }), 200
+
+@app.route('/generate-question/stream', methods=['GET', 'POST'])
+def generate_question_stream():
+    """Genera preguntas ICFES y las envía por SSE a medida que cada bloque está completo.
+
+    Eventos: 'question' ({index, question}), 'error' ({error}) y 'done' (resumen final).
+    """
+    data = request.get_json(silent=True) or request.args.to_dict()
+    error = _validate_question_request(data)
+    if error:
+        return jsonify({'error': error}), 400
 
-    return jsonify({'error': 'Falló después de todos los reintentos'}), 500
+    competencia = data.get('competencia')
+    num_questions = int(data.get('num_questions', 1))
+    dificultad = str(data.get('dificultad', 'medio')).lower()
+    use_custom_knowledge = str(data.get('use_custom_knowledge', True)).lower() not in ('false', '0', 'no')
+    session_id = data.get('session_id')
+    uses_knowledge = use_custom_knowledge and competencia in evaluator.custom_knowledge_base
+
+    banked = None
+    if QUESTION_BANK_ENABLED:
+        bucket_key = _register_question_bucket(competencia, dificultad, use_custom_knowledge)
+        banked = question_bank.take(bucket_key, num_questions, session_id)
+    if not banked and evaluator.quota is not None and evaluator.quota.retry_after() > 0:
+        raise GeminiRateLimited(evaluator.quota.retry_after())
+    degraded = False
+    if not banked and evaluator.breaker.is_open():
+        degraded = True
+        banked = [q.to_text() for q in _take_banked_fallback(competencia, dificultad, use_custom_knowledge, num_questions, session_id)]
+        if not banked:
+            raise CircuitOpenError(evaluator.breaker.retry_after())
+
+    def event_stream():
+        emitted = []
+        parser = QuestionStreamParser()
+        if banked:
+            emitted.extend(parse_question_block(block) for block in banked)
+            for i, question in enumerate(emitted):
+                yield _sse_event('question', {'index': i, 'question': question.to_text(), 'item': question.to_dict()})
+        else:
+            prompt = _build_question_prompt(competencia, num_questions, dificultad, use_custom_knowledge)
+            try:
+                chunks = evaluator._stream_gemini_request(prompt, temperature=0.7, max_tokens=4096)
+                for question in iter_streamed_questions(chunks, parser):
+                    emitted.append(question)
+                    yield _sse_event('question', {'index': len(emitted) - 1, 'question': question.to_text(), 'item': question.to_dict()})
+                    if len(emitted) >= num_questions:
+                        break
+            except Exception as e:
+                logger.error(f"Error en generación en streaming: {str(e)}")
+                yield _sse_event('error', {'error': f'Error al generar preguntas: {str(e)}'})
+
+            # Completar solo las preguntas faltantes con una petición adicional
+            if len(emitted) < num_questions:
+                try:
+                    completed = _generate_questions(
+                        competencia, dificultad, use_custom_knowledge, num_questions,
+                        initial=emitted, max_attempts=1
+                    )
+                except Exception as e:
+                    logger.error(f"Error completando preguntas en streaming: {str(e)}")
+                    completed = emitted
+                for question in completed[len(emitted):]:
+                    emitted.append(question)
+                    yield _sse_event('question', {'index': len(emitted) - 1, 'question': question.to_text(), 'item': question.to_dict()})
+            else:
+                _record_generation_metrics(competencia, dificultad, num_questions, len(emitted), 0, 0, len(emitted))
+            if QUESTION_BANK_ENABLED:
+                question_bank.mark_served([q.to_text() for q in emitted], session_id)
+
+        logger.info(f"Preguntas enviadas en streaming: {competencia} - {dificultad} - {len(emitted)}/{num_questions}")
+        yield _sse_event('done', {
+            'count': len(emitted),
+            'num_questions': num_questions,
+            'complete': len(emitted) >= num_questions,
+            'rejected': parser.rejected,
+            'custom_knowledge_used': uses_knowledge,
+            'competencia': competencia,
+            'dificultad': dificultad,
+            'from_bank': bool(banked),
+            'degraded': degraded
+        })
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 # ============================================================
 # ENDPOINTS DE RETROALIMENTACIÓN
 # ============================================================
 @app.route('/evaluate-order', methods=['POST'])
-def evaluate_order():
+async def evaluate_order():
     """Evalúa el orden de elementos reordenados por el estudiante"""
     data = request.json
     question = data.get('question', '')
@@ -554,7 +1116,7 @@ Proporciona retroalimentación siguiendo EXACTAMENTE este formato:
 Sé claro, constructivo y motivador en tu retroalimentación."""
 
     try:
-        feedback_text = evaluator._make_gemini_request(
+        feedback_text = await evaluator._make_gemini_request_async(
             prompt,
             temperature=0.6,
             max_tokens=2048
@@ -572,12 +1134,14 @@ Sé claro, constructivo y motivador en tu retroalimentación."""
             'user_order': user_order
         }), 200
         
+    except GEMINI_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error evaluando orden: {str(e)}")
         return jsonify({'error': f'Error al evaluar el orden: {str(e)}'}), 500
 
 @app.route('/get-feedback', methods=['POST'])
-def get_feedback():
+async def get_feedback():
     """Obtener retroalimentación detallada de la respuesta del estudiante"""
     data = request.json
     question = data.get('question')
@@ -618,7 +1182,7 @@ Proporciona retroalimentación siguiendo EXACTAMENTE este formato:
 Sé claro, constructivo y motivador en tu retroalimentación."""
 
     try:
-        feedback_text = evaluator._make_gemini_request(
+        feedback_text = await evaluator._make_gemini_request_async(
             prompt,
             temperature=0.6,
             max_tokens=2048
@@ -631,6 +1195,8 @@ Sé claro, constructivo y motivador en tu retroalimentación."""
         
         return jsonify({'feedback': feedback_text}), 200
         
+    except GEMINI_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error generando retroalimentación: {str(e)}")
         return jsonify({'error': f'Error al generar retroalimentación: {str(e)}'}), 500
@@ -638,9 +1204,226 @@ Sé claro, constructivo y motivador en tu retroalimentación."""
 # ============================================================
 # ENDPOINTS DE ANÁLISIS DE DOCUMENTOS
 # ============================================================
+def _no_progress(**fields):
+    pass
+
+
+def _extract_document_text(filename, document, content_hash, force_refresh=False, progress=_no_progress):
+    """Extrae el texto del PDF/Word, reutilizando el de una subida anterior del mismo archivo"""
+    text_key = DocumentCache.text_key(content_hash, DOCUMENT_TEXT_BUDGET)
+    if document_cache is not None and not force_refresh:
+        cached = document_cache.get_json(text_key)
+        if cached is not None:
+            return cached
+
+    progress(stage='extracting')
+    if filename.endswith('.pdf'):
+        extraction = extract_text_from_pdf(
+            document, on_page=lambda read, total: progress(pages_extracted=read, total_pages=total)
+        )
+        extracted = {'text': extraction.text, 'truncated': extraction.truncated, 'extraction': extraction.summary()}
+    else:
+        text = extract_text_from_docx(document)
+        extracted = {'text': text[:DOCUMENT_TEXT_BUDGET], 'truncated': len(text) > DOCUMENT_TEXT_BUDGET, 'extraction': None}
+
+    if document_cache is not None:
+        document_cache.set_json(text_key, extracted)
+    return extracted
+
+
+def _document_analysis_response(result, filename, file_size, content_hash, cache_hit):
+    """Cuerpo de respuesta de /analyze-document; el resumen se recalcula desde los ítems"""
+    return {
+        "success": True,
+        "cache_hit": cache_hit,
+        "analysis": result['analysis'],
+        "summary": build_resumen(result['analysis'], result['partial_summaries']),
+        "metadata": {
+            "file_processed": filename,
+            "file_size": file_size,
+            "content_sha256": content_hash,
+            "text_length": result['text_length'],
+            "total_items": len(result['analysis']),
+            "truncated": result['truncated'],
+            "chunks": result['chunks'],
+            "chunks_failed": result['chunks_failed'],
+            "extraction": result['extraction'],
+            "processed_at": result['processed_at']
+        }
+    }
+
+
+async def _analyze_document_chunk(index, chunk, semaphore, use_cache=None):
+    """Analiza un fragmento con Gemini y devuelve su JSON ya interpretado"""
+    async with semaphore:
+        ai_response = await evaluator.analyze_document_content_async(chunk, use_cache=use_cache)
+    clean_response = clean_json_response(ai_response)
+    logger.info(f"Fragmento {index + 1}, respuesta IA (primeros 300 chars): {clean_response[:300]}...")
+    try:
+        return json.loads(clean_response)
+    except json.JSONDecodeError:
+        logger.error(f"Fragmento {index + 1}, respuesta problemática: {clean_response[:500]}...")
+        raise
+
+
+async def _analyze_document_chunks(chunks, progress=_no_progress, use_cache=None):
+    """Map-reduce: analiza los fragmentos en paralelo acotado y une sus 'analisis_completo' renumerados.
+
+    use_cache=False vuelve a pedir cada fragmento a Gemini aunque su respuesta esté en caché.
+    Devuelve (ítems, resúmenes parciales, números de fragmentos fallidos).
+    Si fallan todos los fragmentos se relanza el error del primero.
+    """
+    semaphore = asyncio.Semaphore(min(DOCUMENT_ANALYSIS_CONCURRENCY, len(chunks)))
+    done = 0
+    progress(stage='analyzing', chunks_analyzed=0, total_chunks=len(chunks))
+
+    async def analyze(index, chunk):
+        nonlocal done
+        try:
+            return await _analyze_document_chunk(index, chunk, semaphore, use_cache)
+        finally:
+            done += 1
+            progress(chunks_analyzed=done)
+
+    # gather conserva el orden de los fragmentos, así la numeración sigue el documento
+    results = await asyncio.gather(
+        *[analyze(i, chunk) for i, chunk in enumerate(chunks)],
+        return_exceptions=True
+    )
+    items, summaries, failed = [], [], []
+    for i, result in enumerate(results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Fragmento {i + 1}/{len(chunks)} sin analizar: {str(result)}")
+            failed.append(i + 1)
+            continue
+        summaries.append(result.get('resumen') or {})
+        for item in result.get('analisis_completo') or []:
+            if isinstance(item, dict):
+                items.append({**item, 'numero': len(items) + 1})
+    if chunks and len(failed) == len(chunks):
+        raise results[0]
+    return items, summaries, failed
+
+
+async def _process_document(filename, document, file_size, force_refresh=False, progress=_no_progress):
+    """Extracción y análisis de un documento ya validado. Devuelve (cuerpo, código HTTP).
+
+    document es el archivo binario abierto (la subida volcada a disco o el
+    archivo de un trabajo); se lee por partes y nunca se copia entero en memoria.
+    Lo usan tanto la petición síncrona como los trabajos en segundo plano;
+    progress(**campos) recibe el avance (páginas extraídas, fragmentos analizados).
+    Los errores de disponibilidad de Gemini y los inesperados se propagan.
+    """
+    content_hash = DocumentCache.content_hash(document)
+    analysis_key = None
+    if document_cache is not None:
+        analysis_key = DocumentCache.analysis_key(content_hash, DOCUMENT_PROMPT_VERSION, evaluator.default_model)
+        cached = None if force_refresh else document_cache.get_json(analysis_key)
+        if cached is not None:
+            logger.info(f"Análisis servido desde caché: {filename} ({content_hash[:12]})")
+            return _document_analysis_response(cached, filename, file_size, content_hash, cache_hit=True), 200
+
+    extracted = _extract_document_text(filename.lower(), document, content_hash, force_refresh, progress)
+    text = extracted['text']
+
+    if len(text.strip()) < 50:
+        return {"error": "El archivo no contiene suficiente texto para procesar"}, 400
+
+    truncated = len(text) > DOCUMENT_TEXT_BUDGET or extracted['truncated']
+    chunks = split_on_questions(text[:DOCUMENT_TEXT_BUDGET], DOCUMENT_CHUNK_CHARS)
+    logger.info(f"Texto extraído: {len(text)} caracteres, {len(chunks)} fragmentos{' (truncado)' if truncated else ''}")
+
+    try:
+        # force_refresh también salta la caché de respuestas de Gemini de cada fragmento
+        analysis_results, partial_summaries, failed_chunks = await _analyze_document_chunks(
+            chunks, progress, use_cache=False if force_refresh else None
+        )
+    except json.JSONDecodeError as e:
+        logger.error(f"Error JSON: {str(e)}")
+        return {
+            "error": "Error procesando la respuesta de IA",
+            "details": f"Respuesta inválida: {str(e)}",
+            "suggestion": "Intenta con un documento más claro o reformateado"
+        }, 500
+
+    if not analysis_results:
+        return {
+            "error": "No se encontraron preguntas para analizar en el documento",
+            "suggestion": "Verifica que el documento contenga preguntas de evaluación claras"
+        }, 404
+
+    logger.info(f"Análisis completado: {len(analysis_results)} elementos de {len(chunks)} fragmentos")
+
+    result = {
+        "analysis": analysis_results,
+        "partial_summaries": partial_summaries,
+        "text_length": len(text),
+        "truncated": truncated,
+        "chunks": len(chunks),
+        "chunks_failed": failed_chunks,
+        "extraction": extracted['extraction'],
+        "processed_at": datetime.now().isoformat()
+    }
+    # Solo se cachean análisis completos: si falló un fragmento, la próxima subida lo reintenta
+    # (las respuestas que no son JSON tampoco quedan en la caché de Gemini)
+    if analysis_key is not None and not failed_chunks:
+        document_cache.set_json(analysis_key, result)
+
+    return _document_analysis_response(result, filename, file_size, content_hash, cache_hit=False), 200
+
+
+def _run_document_job(job, progress):
+    """Trabajo en segundo plano de /analyze-document (hilo de la cola, con su propio bucle asyncio)"""
+    try:
+        with open(job['upload_path'], 'rb') as document:
+            return asyncio.run(_process_document(
+                job['filename'], document, os.fstat(document.fileno()).st_size,
+                job['options'].get('force_refresh', False), progress
+            ))
+    except GEMINI_UNAVAILABLE_ERRORS as e:
+        # Cuota agotada o circuito abierto: el trabajo espera en la cola en lugar de fallar
+        raise RetryJob(e.retry_after, 'El servicio de IA no está disponible en este momento')
+
+
+# Cola persistente de trabajos de análisis (modo 'job' de /analyze-document)
+document_jobs = create_job_queue_from_env(_run_document_job)
+if document_jobs is not None:
+    document_jobs.start()
+# Intervalo (s) con que el flujo SSE de un trabajo consulta su estado; cada 15 s sin cambios se envía un keep-alive
+DOCUMENT_JOB_EVENTS_INTERVAL = float(os.getenv('DOCUMENT_JOB_EVENTS_INTERVAL', '0.5'))
+DOCUMENT_JOB_KEEPALIVE = 15.0
+
+
+def _document_job_snapshot(job):
+    """Vista pública de un trabajo: estado, progreso y, si terminó, el resultado"""
+    snapshot = {
+        "job_id": job['id'],
+        "status": job['status'],
+        "filename": job['filename'],
+        "progress": job['progress'],
+        "attempts": job['attempts'],
+        "created_at": datetime.fromtimestamp(job['created_at']).isoformat(),
+        "updated_at": datetime.fromtimestamp(job['updated_at']).isoformat(),
+        "status_url": url_for('document_job_status', job_id=job['id']),
+        "events_url": url_for('document_job_events', job_id=job['id'])
+    }
+    if job['status'] in FINISHED:
+        snapshot['http_status'] = job['http_status']
+        snapshot['result'] = job['result']
+    return snapshot
+
+
 @app.route('/analyze-document', methods=['POST'])
-def analyze_document():
-    """Analiza un documento completo (PDF o Word) con validación robusta"""
+async def analyze_document():
+    """Analiza un documento completo (PDF o Word) con validación robusta.
+
+    El texto se divide en fragmentos por pregunta que se analizan en paralelo
+    (map-reduce); el resumen se calcula localmente con todos los ítems.
+    Texto y análisis se cachean por el SHA-256 del archivo; 'force_refresh'
+    (campo del formulario o parámetro de la URL) ignora la caché.
+    Con mode=job responde 202 con el id de un trabajo en segundo plano;
+    su estado se consulta en /analyze-document/jobs/<id> (o /events por SSE).
+    """
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No se proporcionó ningún archivo"}), 400
@@ -657,69 +1440,43 @@ def analyze_document():
                 "received_type": file.content_type
             }), 400
 
-        file_content = file.read()
+        # La subida ya está volcada (memoria o disco según su tamaño); se trabaja sobre ese archivo
+        document = file.stream
+        document.seek(0, os.SEEK_END)
+        file_size = document.tell()
+        document.seek(0)
 
-        if len(file_content) > 10 * 1024 * 1024:
-            return jsonify({"error": "El archivo es demasiado grande. Máximo 10MB."}), 400
+        if file_size > MAX_UPLOAD_BYTES:
+            return jsonify({"error": f"El archivo es demasiado grande. Máximo {MAX_UPLOAD_BYTES // (1024 * 1024)}MB."}), 400
 
-        if len(file_content) < 100:
+        if file_size < 100:
             return jsonify({"error": "El archivo está vacío o es demasiado pequeño"}), 400
 
-        logger.info(f"Procesando archivo: {file.filename}, tamaño: {len(file_content)} bytes")
+        logger.info(f"Procesando archivo: {file.filename}, tamaño: {file_size} bytes")
 
-        filename = file.filename.lower()
-        if filename.endswith('.pdf'):
-            text = extract_text_from_pdf(file_content)
-        elif filename.endswith(('.docx', '.doc')):
-            text = extract_text_from_docx(file_content)
-        else:
+        if not file.filename.lower().endswith(('.pdf', '.docx', '.doc')):
             return jsonify({"error": "Extensión de archivo no reconocida"}), 400
 
-        if len(text.strip()) < 50:
-            return jsonify({"error": "El archivo no contiene suficiente texto para procesar"}), 400
-
-        logger.info(f"Texto extraído: {len(text)} caracteres")
-
-        try:
-            ai_response = evaluator.analyze_document_content(text)
-            clean_response = clean_json_response(ai_response)
-
-            logger.info(f"Respuesta IA (primeros 300 chars): {clean_response[:300]}...")
-
-            analysis_data = json.loads(clean_response)
-            analysis_results = analysis_data.get('analisis_completo', [])
-            resumen = analysis_data.get('resumen', {})
-
-            if not analysis_results:
-                return jsonify({
-                    "error": "No se encontraron preguntas para analizar en el documento",
-                    "suggestion": "Verifica que el documento contenga preguntas de evaluación claras"
-                }), 404
-
-            logger.info(f"Análisis completado: {len(analysis_results)} elementos")
+        force_refresh = str(request.values.get('force_refresh', '')).lower() in ('1', 'true', 'yes')
+
+        mode = request.values.get('mode', 'sync')
+        if mode not in ('sync', 'job'):
+            return jsonify({"error": "mode no soportado. Use 'sync' o 'job'"}), 400
+        if mode == 'job':
+            if document_jobs is None:
+                return jsonify({"error": "Los trabajos en segundo plano están desactivados (DOCUMENT_JOBS_ENABLED)"}), 400
+            job_id = document_jobs.submit(file.filename, document, {'force_refresh': force_refresh})
+            logger.info(f"Trabajo {job_id} encolado: {file.filename}")
+            response = jsonify(_document_job_snapshot(document_jobs.store.get(job_id)))
+            response.status_code = 202
+            response.headers['Location'] = url_for('document_job_status', job_id=job_id)
+            return response
 
-            return jsonify({
-                "success": True,
-                "analysis": analysis_results,
-                "summary": resumen,
-                "metadata": {
-                    "file_processed": file.filename,
-                    "file_size": len(file_content),
-                    "text_length": len(text),
-                    "total_items": len(analysis_results),
-                    "processed_at": datetime.now().isoformat()
-                }
-            })
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Error JSON: {str(e)}")
-            logger.error(f"Respuesta problemática: {clean_response[:500]}...")
-            return jsonify({
-                "error": "Error procesando la respuesta de IA",
-                "details": f"Respuesta inválida: {str(e)}",
-                "suggestion": "Intenta con un documento más claro o reformateado"
-            }), 500
+        body, status = await _process_document(file.filename, document, file_size, force_refresh)
+        return jsonify(body), status
 
+    except (RequestEntityTooLarge, *GEMINI_UNAVAILABLE_ERRORS):
+        raise
     except Exception as e:
         logger.error(f"Error general en analyze_document: {str(e)}")
         return jsonify({
@@ -728,6 +1485,56 @@ def analyze_document():
             "type": type(e).__name__
         }), 500
 
+
+@app.route('/analyze-document/jobs/<job_id>', methods=['GET'])
+def document_job_status(job_id):
+    """Estado de un trabajo de análisis; incluye el resultado cuando termina"""
+    job = document_jobs.store.get(job_id) if document_jobs is not None else None
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(_document_job_snapshot(job)), 200
+
+
+@app.route('/analyze-document/jobs/<job_id>/events', methods=['GET'])
+def document_job_events(job_id):
+    """Progreso de un trabajo por Server-Sent Events.
+
+    Emite 'progress' cada vez que cambia el estado y, al final, 'done' o 'error'
+    con la misma vista que /analyze-document/jobs/<id>. Si la conexión se corta
+    basta con volver a suscribirse: el estado vive en la cola, no en el flujo.
+    """
+    job = document_jobs.store.get(job_id) if document_jobs is not None else None
+    if job is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+
+    def generate():
+        current = job
+        last_update = None
+        last_sent = time.monotonic()
+        while True:
+            if current['status'] in FINISHED:
+                yield _sse_event(current['status'], _document_job_snapshot(current))
+                return
+            if current['updated_at'] != last_update:
+                last_update = current['updated_at']
+                last_sent = time.monotonic()
+                yield _sse_event('progress', _document_job_snapshot(current))
+            elif time.monotonic() - last_sent >= DOCUMENT_JOB_KEEPALIVE:
+                # Comentario SSE: mantiene viva la conexión detrás de proxies con timeout de inactividad
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(DOCUMENT_JOB_EVENTS_INTERVAL)
+            current = document_jobs.store.get(job_id)
+            if current is None:
+                yield _sse_event('error', {"error": "Trabajo no encontrado", "job_id": job_id})
+                return
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # ============================================================
 # ENDPOINTS DE CONOCIMIENTO PERSONALIZADO
 # ============================================================
@@ -843,9 +1650,132 @@ def save_model():
         logger.error(f"Error guardando modelo: {str(e)}")
         return jsonify({'error': f'Error al guardar el modelo: {str(e)}'}), 500
 
+# ============================================================
+# RENDERIZADO DE GRÁFICOS (POOL DE PROCESOS)
+# ============================================================
+# Procesos de render por worker web; 0 renderiza en el propio proceso (serializado)
+RENDER_POOL_WORKERS = int(os.getenv('RENDER_POOL_WORKERS', '2'))
+RENDER_TIMEOUT = float(os.getenv('RENDER_TIMEOUT', '30'))
+
+render_pool = RenderPool(max_workers=RENDER_POOL_WORKERS, timeout=RENDER_TIMEOUT)
+
+
+def _warm_worker_pools():
+    """Arranca los procesos de render y de extracción de PDF con sus librerías ya importadas"""
+    try:
+        render_pool.warm()
+        if PDF_EXTRACT_WORKERS > 0:
+            warm_pool(PDF_EXTRACT_WORKERS)
+        logger.info("Procesos de render y extracción precalentados")
+    except Exception as e:
+        logger.warning(f"No se pudieron precalentar los procesos: {str(e)}")
+
+
+# La precarga del maestro (gunicorn.conf.py) no llega a los procesos 'spawn' de los pools:
+# con PRELOAD_HEAVY_MODULES cada worker los arranca en segundo plano al iniciar
+if os.getenv('PRELOAD_HEAVY_MODULES', 'false').lower() in ('1', 'true', 'yes'):
+    threading.Thread(target=_warm_worker_pools, name='pool-warmup', daemon=True).start()
+
+# Caché de gráficos renderizados por especificación (LRU acotado en bytes + copia en disco
+# compartida entre workers para que /charts/<hash> funcione en cualquiera de ellos)
+CHART_CACHE_MAX_BYTES = int(os.getenv('CHART_CACHE_MAX_MB', '64')) * 1024 * 1024
+CHART_CACHE_DIR = os.getenv('CHART_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'icfes_charts'))
+chart_cache = ChartCache(max_bytes=CHART_CACHE_MAX_BYTES, directory=CHART_CACHE_DIR or None)
+
+# Formas de devolver un gráfico: data URI en JSON, URL en JSON o la imagen binaria
+CHART_RESPONSE_MODES = ('base64', 'url', 'binary')
+
+# Perfil de salida si el cliente no pide otro: 'preview' (PNG ligero), 'print' (PNG 300 dpi) o 'svg'
+CHART_DEFAULT_PROFILE = os.getenv('CHART_DEFAULT_PROFILE', 'preview')
+
+
+def _chart_output(data, kind):
+    """Formato y dpi pedidos por el cliente ('profile', 'format', 'dpi', 'width_px'). Lanza ValueError si no son válidos"""
+    fmt, dpi = resolve_output(
+        kind,
+        profile=data.get('profile') or CHART_DEFAULT_PROFILE,
+        fmt=data.get('format'),
+        dpi=data.get('dpi'),
+        width_px=data.get('width_px'),
+    )
+    return {'format': fmt, 'dpi': dpi}
+
+
+def _render_chart_cached(spec):
+    """Renderiza la especificación en el pool, reutilizando la imagen si ya se generó"""
+    key = chart_spec_key(spec)
+    chart = chart_cache.get(key)
+    if chart is None:
+        chart = chart_cache.put(key, render_pool.render(spec), MIMETYPES[spec['format']])
+    return chart
+
+
+def _chart_response_mode(data):
+    """Modo de respuesta pedido: 'response_mode' en el cuerpo o, si no viene, el header Accept"""
+    mode = (data.get('response_mode') or '').lower()
+    if not mode:
+        best = request.accept_mimetypes.best_match(['application/json', *MIMETYPES.values()])
+        mode = 'binary' if best and best.startswith('image/') else 'base64'
+    return mode if mode in CHART_RESPONSE_MODES else None
+
+
+def _chart_url(chart):
+    return url_for('get_chart_image', key=chart.key, ext=chart.extension)
+
+
+def _chart_etag(chart, payload, mode):
+    """ETag de la representación: los bytes de la imagen en 'binary'; en JSON también el modo y el payload"""
+    if mode == 'binary':
+        return chart.etag
+    body = json.dumps([mode, chart.key, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()[:32]
+
+
+def _chart_response(chart, payload, mode='base64'):
+    """Respuesta con el gráfico según el modo, con ETag; 304 si el cliente ya tiene esta representación.
+
+    'base64' incluye el data URI (compatibilidad), 'url' solo la URL cacheable de la
+    imagen y 'binary' devuelve directamente los bytes de la imagen. En los modos JSON
+    el ETag cubre también el payload (análisis, plan de la figura...), no solo la imagen.
+    """
+    etag = _chart_etag(chart, payload, mode)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    elif mode == 'binary':
+        response = Response(chart.content, mimetype=chart.mimetype)
+        response.headers['Content-Location'] = _chart_url(chart)
+    elif mode == 'url':
+        response = jsonify({'success': True, 'image_url': _chart_url(chart), **payload})
+    else:
+        response = jsonify({'success': True, 'image': chart.data_uri, 'image_url': _chart_url(chart), **payload})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@app.route('/charts/<key>.<ext>', methods=['GET'])
+def get_chart_image(key, ext):
+    """Sirve un gráfico ya renderizado. La URL es el hash de la especificación, así que es inmutable"""
+    chart = chart_cache.get(key) if re.fullmatch(r'[0-9a-f]{64}', key) else None
+    if chart is None or chart.extension != ext:
+        return jsonify({'error': 'Gráfico no encontrado o expirado, vuelve a generarlo'}), 404
+
+    if chart.etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(chart.content, mimetype=chart.mimetype)
+    response.set_etag(chart.etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 @app.route('/generate-visual', methods=['POST'])
 def generate_visual():
-    """Genera gráficos visuales (bar/pie) para análisis de preguntas ICFES usando Gemini para datos"""
+    """Genera gráficos visuales (bar/pie) para análisis de preguntas ICFES.
+
+    Si analysis_data es estructurado (ítems de /analyze-document) los datos se agregan
+    localmente según 'group_by' (resultado, nivel o concepto); Gemini solo interpreta texto libre.
+    """
     data = request.json
     chart_type = data.get('chart_type', 'bar').lower()
     analysis_data = data.get('analysis_data', '')
@@ -859,22 +1789,50 @@ def generate_visual():
     donut = bool(data.get('donut', True))
     ordenar_desc = bool(data.get('ordenar_desc', True))
     force_percentage = data.get('porcentaje')  # None (auto) o bool
+    group_by = (data.get('group_by') or 'resultado').lower()
+    response_mode = _chart_response_mode(data)
 
     if chart_type not in ['bar', 'pie']:
         return jsonify({'error': 'Tipo de gráfico no soportado. Use "bar" o "pie"'}), 400
+    if group_by not in GROUPINGS:
+        return jsonify({'error': f'group_by no soportado. Use uno de: {", ".join(GROUPINGS)}'}), 400
+    if response_mode is None:
+        return jsonify({'error': f'response_mode no soportado. Use uno de: {", ".join(CHART_RESPONSE_MODES)}'}), 400
+    try:
+        chart_output = _chart_output(data, chart_type)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
-        # Si no se proporcionan datos personalizados, usar Gemini para generarlos
-        if not custom_labels or not custom_values:
+        items = extract_items(analysis_data) if not custom_labels or not custom_values else None
+        generated_by = 'custom' if custom_labels and custom_values else 'local' if items else 'ai'
+        chart_data = aggregate(items, group_by) if generated_by == 'local' else None
+        if chart_data is not None and not chart_data['labels']:
+            # La agregación no dio datos (p. ej. 'concepto' sin conceptos): Gemini interpreta el análisis
+            logger.info(f"Agregación local sin datos para group_by={group_by}, usando Gemini")
+            generated_by = 'ai'
+
+        if generated_by == 'local':
+            # Datos estructurados: agregación determinista, sin llamar a Gemini
+            labels = chart_data['labels']
+            values = chart_data['values']
+            if 'title' not in data:
+                title = chart_data['title']
+            if 'xlabel' not in data:
+                xlabel = chart_data['xlabel']
+            if 'ylabel' not in data:
+                ylabel = chart_data['ylabel']
+        elif generated_by == 'ai':
             if not analysis_data:
                 return jsonify({'error': 'Se requiere analysis_data o labels/values personalizados'}), 400
 
+            # Texto libre: pedir a Gemini las categorías del gráfico
             # Prompt para Gemini para generar datos de visualización
             prompt = f"""
 Eres un analista educativo experto. Analiza los siguientes datos de evaluación ICFES y genera datos para un gráfico de {chart_type}.
 
 DATOS DE ANÁLISIS:
-{analysis_data}
+{analysis_data if isinstance(analysis_data, str) else json.dumps(analysis_data, ensure_ascii=False)}
 
 INSTRUCCIONES:
 1. Identifica categorías relevantes para el gráfico (ej. tipos de errores, competencias, niveles de dificultad)
@@ -893,7 +1851,7 @@ FORMATO JSON obligatorio (responda con el JSON directamente, sin bloques de cód
 IMPORTANTE: El JSON debe ser válido y parseable. Los valores deben ser números enteros.
 """
 
-            ai_response = evaluator._make_gemini_request(prompt, temperature=0.3, max_tokens=1000)
+            ai_response = evaluator._make_gemini_request(prompt, temperature=0.3, max_tokens=1000, validate=is_json_response)
             clean_response = clean_json_response(ai_response)
 
             try:
@@ -919,6 +1877,9 @@ IMPORTANTE: El JSON debe ser válido y parseable. Los valores deben ser números
         # Detección automática de porcentaje, a menos que el usuario lo fuerce
         if isinstance(force_percentage, bool):
             is_percentage = force_percentage
+        elif generated_by == 'local':
+            # La agregación local siempre devuelve conteos (1 y 1, o 60 y 40, no son porcentajes)
+            is_percentage = False
         else:
             is_percentage = False
             try:
@@ -929,49 +1890,44 @@ IMPORTANTE: El JSON debe ser válido y parseable. Los valores deben ser números
                 is_percentage = False
 
         if chart_type == 'bar':
-            fig, ax = bar_chart_exam(
-                categorias=labels,
-                valores=values,
-                titulo=title,
-                xlabel=xlabel,
-                ylabel=ylabel if not is_percentage else 'Porcentaje',
-                ordenar_desc=ordenar_desc,
-                mostrar_valores=True,
-                valores_como_porcentaje=is_percentage,
-                paleta_bw=paleta_bw,
-                salida=None,
-            )
+            spec = {'kind': 'bar', **chart_output, 'params': {
+                'categorias': labels,
+                'valores': values,
+                'titulo': title,
+                'xlabel': xlabel,
+                'ylabel': ylabel if not is_percentage else 'Porcentaje',
+                'ordenar_desc': ordenar_desc,
+                'mostrar_valores': True,
+                'valores_como_porcentaje': is_percentage,
+                'paleta_bw': paleta_bw,
+            }}
         else:
-            fig, ax = pie_chart_exam(
-                labels=labels,
-                valores=values,
-                titulo=title,
-                donut=donut,
-                paleta_bw=paleta_bw,
-                salida=None,
-            )
+            spec = {'kind': 'pie', **chart_output, 'params': {
+                'labels': labels,
+                'valores': values,
+                'titulo': title,
+                'donut': donut,
+                'paleta_bw': paleta_bw,
+            }}
 
-        img_buffer = BytesIO()
-        fig.savefig(img_buffer, format='png', bbox_inches='tight', dpi=300)
-        img_buffer.seek(0)
-        img_base64 = base64.b64encode(img_buffer.read()).decode('utf-8')
-        plt.close(fig)
+        chart = _render_chart_cached(spec)
 
-        logger.info(f"Gráfico generado con Gemini: {chart_type} con {len(labels)} elementos")
+        logger.info(f"Gráfico generado ({generated_by}): {chart_type} con {len(labels)} elementos")
 
-        return jsonify({
-            'success': True,
-            'image': f'data:image/png;base64,{img_base64}',
+        return _chart_response(chart, {
             'chart_type': chart_type,
             'title': title,
             'labels': labels,
             'values': values,
-            'generated_by_ai': True if not custom_labels else False
-        }), 200
+            'generated_by_ai': generated_by == 'ai',
+            'data_source': generated_by,
+            **({'grouped_by': group_by} if generated_by == 'local' else {})
+        }, response_mode)
 
+    except GEMINI_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error generando gráfico: {str(e)}")
-        plt.close('all')
         return jsonify({'error': f'Error al generar el gráfico: {str(e)}'}), 500
 
 # ============================================================
@@ -995,7 +1951,8 @@ def generate_visual_by_competencia():
     "ordenar_desc" controla orden.
     "xlabel" y "ylabel" opcionales.
     "ancho_mm" y "alto_mm" opcionales.
-    "salida" se ignora y siempre se retorna PNG base64.
+    "salida" se ignora; "response_mode" elige 'base64' (por defecto), 'url' o 'binary'.
+    "profile" ('preview', 'print', 'svg'), "format", "dpi" y "width_px" controlan la salida.
     """
     try:
         data = request.json or {}
@@ -1006,6 +1963,14 @@ def generate_visual_by_competencia():
         paleta_bw = bool(data.get('paleta_bw', True))
         ordenar_desc = bool(data.get('ordenar_desc', True))
         force_percentage = data.get('porcentaje')  # None auto, o bool
+        response_mode = _chart_response_mode(data)
+
+        if response_mode is None:
+            return jsonify({'error': f'response_mode no soportado. Use uno de: {", ".join(CHART_RESPONSE_MODES)}'}), 400
+        try:
+            chart_output = _chart_output(data, 'bar')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         if not isinstance(items, list) or len(items) == 0:
             return jsonify({'error': 'Se requiere un arreglo "items" con objetos que tengan "competencia" y opcionalmente "valor"'}), 400
@@ -1042,208 +2007,32 @@ def generate_visual_by_competencia():
                 is_percentage = False
 
         # Generar gráfico
-        fig, ax = bar_chart_exam(
-            categorias=labels,
-            valores=values,
-            titulo=title,
-            xlabel=xlabel,
-            ylabel=ylabel if not is_percentage else 'Porcentaje',
-            ordenar_desc=ordenar_desc,
-            mostrar_valores=True,
-            valores_como_porcentaje=is_percentage,
-            paleta_bw=paleta_bw,
-            salida=None,
-        )
-
-        buf = BytesIO()
-        fig.savefig(buf, format='png', bbox_inches='tight', dpi=300)
-        buf.seek(0)
-        img_b64 = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close(fig)
-
-        return jsonify({
-            'success': True,
-            'image': f'data:image/png;base64,{img_b64}',
+        chart = _render_chart_cached({'kind': 'bar', **chart_output, 'params': {
+            'categorias': labels,
+            'valores': values,
+            'titulo': title,
+            'xlabel': xlabel,
+            'ylabel': ylabel if not is_percentage else 'Porcentaje',
+            'ordenar_desc': ordenar_desc,
+            'mostrar_valores': True,
+            'valores_como_porcentaje': is_percentage,
+            'paleta_bw': paleta_bw,
+        }})
+
+        return _chart_response(chart, {
             'labels': labels,
             'values': values,
             'title': title,
             'grouped_by': 'competencia'
-        }), 200
+        }, response_mode)
 
     except Exception as e:
         logger.error(f"Error en generate-visual-by-competencia: {str(e)}")
-        plt.close('all')
         return jsonify({'error': f'Error al generar el gráfico por competencia: {str(e)}'}), 500
 
 # ============================================================
 # ENDPOINT DE FIGURAS GEOMÉTRICAS POR PREGUNTA
 # ============================================================
-def _draw_geometry(ax, shapes):
-    """Dibuja figuras en un eje Matplotlib a partir de una lista de shapes JSON."""
-    # Config base
-    ax.set_aspect('equal', adjustable='datalim')
-    ax.grid(True, linestyle='--', alpha=0.3)
-
-    # Colores y estilo
-    color_main = '#667eea'
-    color_aux = '#10b981'
-
-    # Utilidades
-    def as_point(p):
-        return (float(p[0]), float(p[1]))
-
-    for shape in shapes:
-        try:
-            stype = (shape.get('type') or '').lower()
-            if stype == 'triangle':
-                pts = [as_point(p) for p in shape.get('points', [])][:3]
-                if len(pts) == 3:
-                    poly = patches.Polygon(pts, closed=True, fill=False, edgecolor=color_main, linewidth=2)
-                    ax.add_patch(poly)
-            elif stype == 'polygon':
-                pts = [as_point(p) for p in shape.get('points', [])]
-                if len(pts) >= 3:
-                    poly = patches.Polygon(pts, closed=True, fill=False, edgecolor=color_main, linewidth=2)
-                    ax.add_patch(poly)
-            elif stype == 'rectangle':
-                x, y = as_point(shape.get('xy', [0, 0]))
-                w = float(shape.get('width', 1))
-                h = float(shape.get('height', 1))
-                rect = patches.Rectangle((x, y), w, h, fill=False, edgecolor=color_main, linewidth=2)
-                ax.add_patch(rect)
-            elif stype == 'circle':
-                cx, cy = as_point(shape.get('center', [0, 0]))
-                r = float(shape.get('radius', 1))
-                circ = patches.Circle((cx, cy), r, fill=False, edgecolor=color_main, linewidth=2)
-                ax.add_patch(circ)
-            elif stype == 'arc':
-                cx, cy = as_point(shape.get('center', [0, 0]))
-                r = float(shape.get('radius', 1))
-                t1 = float(shape.get('theta1', 0))
-                t2 = float(shape.get('theta2', 90))
-                arc = patches.Arc((cx, cy), 2*r, 2*r, angle=0, theta1=t1, theta2=t2, color=color_main, linewidth=2)
-                ax.add_patch(arc)
-            elif stype == 'angle':
-                atx, aty = as_point(shape.get('at', [0, 0]))
-                radius = float(shape.get('radius', 1))
-                start = float(shape.get('start_deg', 0))
-                end = float(shape.get('end_deg', 60))
-                # arco del ángulo
-                arc = patches.Arc((atx, aty), 2*radius, 2*radius, angle=0, theta1=start, theta2=end, color=color_aux, linewidth=2)
-                ax.add_patch(arc)
-                # rayos del ángulo
-                sx = atx + radius * np.cos(np.deg2rad(start))
-                sy = aty + radius * np.sin(np.deg2rad(start))
-                ex = atx + radius * np.cos(np.deg2rad(end))
-                ey = aty + radius * np.sin(np.deg2rad(end))
-                ax.plot([atx, sx], [aty, sy], color=color_aux, linewidth=2)
-                ax.plot([atx, ex], [aty, ey], color=color_aux, linewidth=2)
-            elif stype == 'segment':
-                p1 = as_point(shape.get('p1', [0, 0]))
-                p2 = as_point(shape.get('p2', [1, 0]))
-                ax.plot([p1[0], p2[0]], [p1[1], p2[1]], color=color_main, linewidth=2)
-            elif stype == 'point':
-                px, py = as_point(shape.get('at', [0, 0]))
-                label = shape.get('label')
-                ax.scatter([px], [py], color=color_aux, s=30)
-                if label:
-                    ax.text(px + 0.05, py + 0.05, str(label), color=color_aux, fontsize=9)
-            elif stype == 'axis' or stype == 'axes':
-                # Ejes cartesianos básicos
-                rng = float(shape.get('range', 5))
-                ax.axhline(0, color='#999', linewidth=1)
-                ax.axvline(0, color='#999', linewidth=1)
-                ax.set_xlim(-rng, rng)
-                ax.set_ylim(-rng, rng)
-                # labels opcionales
-                if shape.get('xlabel'):
-                    ax.set_xlabel(str(shape['xlabel']))
-                if shape.get('ylabel'):
-                    ax.set_ylabel(str(shape['ylabel']))
-            elif stype == 'function':
-                # Plot de función y = f(x), ej: sin(x), x**2
-                expr = str(shape.get('expr', ''))
-                x_range = shape.get('x_range', [-10, 10])
-                samples = int(shape.get('samples', 500))
-                color = shape.get('color', color_main)
-                try:
-                    xs = np.linspace(float(x_range[0]), float(x_range[1]), samples)
-                    # Usar evaluación segura de expresiones matemáticas con whitelist
-                    x = sp.Symbol('x')
-
-                    # Definir funciones matemáticas seguras permitidas
-                    safe_functions = {
-                        'sin': sp.sin,
-                        'cos': sp.cos,
-                        'tan': sp.tan,
-                        'exp': sp.exp,
-                        'log': sp.log,
-                        'ln': sp.log,
-                        'sqrt': sp.sqrt,
-                        'abs': sp.Abs,
-                        'pi': sp.pi,
-                        'e': sp.E,
-                        'sinh': sp.sinh,
-                        'cosh': sp.cosh,
-                        'tanh': sp.tanh,
-                        'arcsin': sp.asin,
-                        'arccos': sp.acos,
-                        'arctan': sp.atan,
-                        'floor': sp.floor,
-                        'ceil': sp.ceil,
-                        'sign': sp.sign
-                    }
-
-                    # Definir símbolos permitidos
-                    safe_symbols = {'x': x, 'pi': sp.pi, 'e': sp.E}
-
-                    # Parsear expresión de forma segura
-                    expr_sympy = sp.parse_expr(expr, local_dict=safe_symbols, transformations=sp.transforms, evaluate=False)
-
-                    # Verificar que solo use funciones y símbolos seguros
-                    def check_safe(expr):
-                        if isinstance(expr, sp.Symbol):
-                            return expr in safe_symbols.values()
-                        elif isinstance(expr, sp.Function):
-                            return expr.func in safe_functions.values()
-                        elif isinstance(expr, (sp.Add, sp.Mul, sp.Pow, sp.Sub, sp.Div)):
-                            return all(check_safe(arg) for arg in expr.args)
-                        elif isinstance(expr, (sp.Integer, sp.Float, sp.Rational)):
-                            return True
-                        else:
-                            return False
-
-                    if not check_safe(expr_sympy):
-                        logger.warning(f"Unsafe expression blocked: {expr}")
-                        # Add red warning text to the plot
-                        ax.text(0.5, 0.5, 'EXPRESIÓN INSEGURA BLOQUEADA\nUnsafe Expression Blocked',
-                               transform=ax.transAxes, fontsize=14, color='red',
-                               ha='center', va='center', bbox=dict(boxstyle="round,pad=0.3", facecolor="white", edgecolor="red"))
-                        continue
-
-                    ys = [float(expr_sympy.subs(x, val)) for val in xs]
-                    ax.plot(xs, ys, color=color, linewidth=2)
-                except Exception as e:
-                    logger.warning(f"Error evaluating safe expression '{expr}': {str(e)}")
-                    continue
-            elif stype == 'wave':
-                # Onda senoidal: A*sin(2*pi*f*x + phase)
-                A = float(shape.get('amplitude', 1))
-                f = float(shape.get('frequency', 1))
-                phase = float(shape.get('phase', 0))
-                x_range = shape.get('x_range', [0, 2*np.pi])
-                samples = int(shape.get('samples', 800))
-                color = shape.get('color', color_main)
-                xs = np.linspace(float(x_range[0]), float(x_range[1]), samples)
-                ys = A * np.sin(2*np.pi*f*xs + phase)
-                ax.plot(xs, ys, color=color, linewidth=2)
-            # Se pueden añadir más tipos: angle, arc, polygon, altitude, median, etc.
-        except Exception as _:
-            continue
-
-    ax.autoscale(enable=True, tight=True)
-
-
 @app.route('/generate-geometry-visual', methods=['POST'])
 def generate_geometry_visual():
     """Genera una figura geométrica basada en el texto de la pregunta usando un plan JSON devuelto por IA."""
@@ -1252,9 +2041,16 @@ def generate_geometry_visual():
     title = data.get('title', 'Figura Geométrica')
     competencia = (data.get('competencia') or '').strip()
     tema = (data.get('tema') or '').strip()
+    response_mode = _chart_response_mode(data)
 
     if not question_text:
         return jsonify({'error': 'question_text es requerido'}), 400
+    if response_mode is None:
+        return jsonify({'error': f'response_mode no soportado. Use uno de: {", ".join(CHART_RESPONSE_MODES)}'}), 400
+    try:
+        chart_output = _chart_output(data, 'geometry')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
         # Pedir a Gemini un plan de dibujo en JSON
@@ -1288,7 +2084,7 @@ Competencia: {competencia}
 Tema: {tema}
 """
 
-        ai_resp = evaluator._make_gemini_request(prompt, temperature=0.2, max_tokens=800)
+        ai_resp = evaluator._make_gemini_request(prompt, temperature=0.2, max_tokens=800, validate=_has_shapes)
         shapes = _safe_parse_shapes_response(ai_resp)
 
         # Si no se pudo interpretar, reintentar una vez con prompt ultra estricto
@@ -1300,71 +2096,67 @@ Ajusta coordenadas a enteros dentro de [-10,10].
 Enunciado:
 {question_text}
 """
-            ai_resp2 = evaluator._make_gemini_request(strict_prompt, temperature=0.0, max_tokens=500)
+            ai_resp2 = evaluator._make_gemini_request(strict_prompt, temperature=0.0, max_tokens=500, validate=_has_shapes)
             shapes = _safe_parse_shapes_response(ai_resp2)
 
-        # Renderizar figura
-        fig, ax = plt.subplots(figsize=(6, 6))
-        if shapes:
-            _draw_geometry(ax, shapes)
-        else:
-            # Fallback seguro: solo ejes para no dejar vacío
-            _draw_geometry(ax, [{"type": "axis", "range": 5, "xlabel": "x", "ylabel": "y"}])
-        ax.set_title(title)
-
-        buf = BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=120)
-        buf.seek(0)
-        img_b64 = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close(fig)
+        # Renderizar figura (fallback seguro: solo ejes para no dejar vacío)
+        chart = _render_chart_cached({'kind': 'geometry', **chart_output, 'params': {
+            'shapes': shapes or [{"type": "axis", "range": 5, "xlabel": "x", "ylabel": "y"}],
+            'title': title,
+            'figsize': [6, 6],
+        }})
 
         logger.info("Figura geométrica generada correctamente")
-        return jsonify({
-            'success': True,
-            'image': f'data:image/png;base64,{img_b64}',
+        return _chart_response(chart, {
             'shapes_count': len(shapes)
-        })
+        }, response_mode)
 
     except json.JSONDecodeError:
         return jsonify({'error': 'No se pudo interpretar el plan JSON devuelto por IA'}), 500
+    except GEMINI_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error generando figura geométrica: {str(e)}")
-        plt.close('all')
         return jsonify({'error': f'Error generando figura: {str(e)}'}), 500
 
 # ============================================================
 # NUEVO ENDPOINT: SUBMIT ALL ANSWERS - VERIFICACIÓN BATCH
 # ============================================================
-@app.route('/submit-all-answers', methods=['POST'])
-def submit_all_answers():
-    """
-    Recibe todas las respuestas del estudiante de una vez,
-    las evalúa y genera retroalimentación para cada una.
-    """
-    try:
-        data = request.json
-        questions = data.get('questions', [])
+FEEDBACK_MODES = ('parallel', 'sequential', 'batch')
 
-        if not questions or len(questions) == 0:
-            return jsonify({'error': 'No se proporcionaron preguntas'}), 400
+# Máximo de peticiones simultáneas a Gemini por envío (respeta la cuota)
+FEEDBACK_MAX_CONCURRENCY = max(1, int(os.getenv('FEEDBACK_MAX_CONCURRENCY', '4')))
 
-        # Validar que cada pregunta tenga los campos necesarios
-        for i, q in enumerate(questions):
-            if not all(k in q for k in ['question', 'options', 'correctAnswer', 'userAnswer']):
-                return jsonify({'error': f'Pregunta {i+1} con formato inválido'}), 400
+# Modo batch: tokens de salida por pregunta y tope por petición; un envío grande se
+# reparte en lotes que caben en el tope (20 preguntas = 2 lotes de 10)
+FEEDBACK_TOKENS_PER_QUESTION = 700
+FEEDBACK_BATCH_MAX_TOKENS = 8192
+FEEDBACK_BATCH_SIZE = (FEEDBACK_BATCH_MAX_TOKENS - 500) // FEEDBACK_TOKENS_PER_QUESTION
+# Inicio de cada elemento del arreglo 'feedback' (para rescatar los completos de un JSON truncado)
+_FEEDBACK_ITEM_START = re.compile(r'\{\s*"questionIndex"')
 
-        results = []
-        total_questions = len(questions)
 
-        # Procesar cada pregunta
-        for i, q in enumerate(questions):
-            user_answer = q.get('userAnswer', '').lower()
-            correct_answer = q.get('correctAnswer', '').lower()
-            is_correct = user_answer == correct_answer
+def _resolve_feedback_concurrency(requested, total_questions):
+    """Calcula el número de hilos a usar, sin superar el límite configurado"""
+    limit = FEEDBACK_MAX_CONCURRENCY
+    try:
+        if requested is not None:
+            limit = min(limit, max(1, int(requested)))
+    except (TypeError, ValueError):
+        pass
+    return max(1, min(limit, total_questions))
 
-            # Generar retroalimentación individual con Gemini
-            try:
-                prompt = f"""Eres un tutor experto especializado en ICFES colombiano.
+
+def _clean_feedback_markdown(text):
+    """Limpia bloques de código markdown del feedback"""
+    if not text:
+        return ''
+    return re.sub(r'^```json|```', '', text.strip(), flags=re.MULTILINE)
+
+
+def _build_answer_feedback_prompt(q, user_answer, correct_answer, is_correct):
+    """Construye el prompt de retroalimentación para una pregunta del simulacro"""
+    return f"""Eres un tutor experto especializado en ICFES colombiano.
 Dado el siguiente ejercicio y la respuesta del estudiante, genera una retroalimentación clara y constructiva.
 
 PREGUNTA:
@@ -1395,33 +2187,225 @@ Proporciona la retroalimentación siguiendo EXACTAMENTE este formato:
 
 Sé claro, motivador y educativo. Responda en español."""
 
-                feedback_text = evaluator._make_gemini_request(
-                    prompt,
-                    temperature=0.5,
-                    max_tokens=1500
-                )
 
-                if not feedback_text:
-                    feedback_text = q.get('explanation', 'Sin explicación disponible.')
+def _build_batch_feedback_prompt(questions, start=0):
+    """Construye un único prompt con las preguntas de un lote del simulacro.
 
-            except Exception as e:
-                logger.error(f"Error generando feedback para pregunta {i+1}: {str(e)}")
-                feedback_text = q.get('explanation', f'Error al generar feedback: {str(e)}')
+    Gemini debe devolver un JSON con un arreglo de retroalimentaciones
+    identificadas por 'questionIndex' (posición en el envío, desde `start`).
+    """
+    blocks = []
+    for i, q in enumerate(questions, start):
+        user_answer = q.get('userAnswer', '').lower()
+        correct_answer = q.get('correctAnswer', '').lower()
+        blocks.append(f"""### questionIndex: {i}
+PREGUNTA:
+{q['question']}
+
+OPCIONES:
+{chr(10).join(q['options'])}
+
+RESPUESTA DEL ESTUDIANTE: {user_answer.upper()}
+RESPUESTA CORRECTA: {correct_answer.upper()}
+RESULTADO: {'CORRECTA' if user_answer == correct_answer else 'INCORRECTA'}""")
+
+    return f"""Eres un tutor experto especializado en ICFES colombiano.
+Para CADA uno de los siguientes ejercicios, dada la respuesta del estudiante, genera una retroalimentación clara y constructiva.
+
+Cada retroalimentación debe seguir EXACTAMENTE este formato markdown:
+
+**Estado de la respuesta:** [Indica si es Correcta o Incorrecta]
+
+**Análisis de tu respuesta:**
+[Explica brevemente qué hizo bien o mal el estudiante]
+
+**Respuesta correcta:**
+[Letra y texto de la opción correcta]
+
+**Explicación detallada:**
+[Explica por qué es correcta y por qué las demás son incorrectas, con referencia al contenido]
+
+**Conceptos clave a repasar:**
+[2-3 conceptos específicos para reforzar]
+
+Sé claro, motivador y educativo. Responda en español.
+
+FORMATO JSON obligatorio (responde con el JSON directamente, sin bloques de código markdown):
+{{
+    "feedback": [
+        {{"questionIndex": 0, "feedback": "Retroalimentación en el formato indicado"}}
+    ]
+}}
+
+IMPORTANTE: Incluye un elemento por cada questionIndex. El JSON debe ser válido y parseable; escapa los saltos de línea como \\n.
+
+EJERCICIOS:
+
+{(chr(10) * 2).join(blocks)}
+"""
+
+
+def _salvage_feedback_items(text):
+    """Elementos {"questionIndex": ..., "feedback": ...} completos de una respuesta truncada o inválida"""
+    decoder = json.JSONDecoder()
+    items = []
+    for match in _FEEDBACK_ITEM_START.finditer(text):
+        try:
+            item, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        items.append(item)
+    return items
+
+
+async def _request_batch_feedback_chunk(start, questions):
+    """Pide la retroalimentación de un lote (preguntas start..start+len-1) en una sola petición.
+
+    Si el JSON llega truncado se conservan los elementos que sí estén completos.
+    """
+    prompt = _build_batch_feedback_prompt(questions, start)
+    max_tokens = min(FEEDBACK_TOKENS_PER_QUESTION * len(questions) + 500, FEEDBACK_BATCH_MAX_TOKENS)
+    try:
+        ai_response = await evaluator._make_gemini_request_async(
+            prompt, temperature=0.5, max_tokens=max_tokens, validate=is_json_response
+        ) or ''
+    except Exception as e:
+        logger.error(f"Error en retroalimentación por lote ({start + 1}-{start + len(questions)}): {str(e)}")
+        return {}
+
+    try:
+        batch_data = json.loads(clean_json_response(ai_response))
+        items = batch_data.get('feedback', []) if isinstance(batch_data, dict) else []
+    except json.JSONDecodeError:
+        items = _salvage_feedback_items(ai_response)
+        logger.warning(f"JSON del lote {start + 1}-{start + len(questions)} inválido; rescatados {len(items)} elementos")
+
+    feedback_by_index = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            idx = int(item.get('questionIndex'))
+        except (TypeError, ValueError):
+            continue
+        text = item.get('feedback')
+        if start <= idx < start + len(questions) and isinstance(text, str) and text.strip():
+            feedback_by_index[idx] = text
+    return feedback_by_index
+
+
+async def _request_batch_feedback(questions):
+    """Pide la retroalimentación de todas las preguntas en lotes de FEEDBACK_BATCH_SIZE (en paralelo).
+
+    Devuelve un diccionario {questionIndex: feedback}. Los elementos ausentes o
+    inválidos simplemente no aparecen en el diccionario.
+    """
+    chunks = await asyncio.gather(*[
+        _request_batch_feedback_chunk(start, questions[start:start + FEEDBACK_BATCH_SIZE])
+        for start in range(0, len(questions), FEEDBACK_BATCH_SIZE)
+    ])
+    feedback_by_index = {}
+    for chunk in chunks:
+        feedback_by_index.update(chunk)
+    return feedback_by_index
+
+
+async def _build_answer_result(i, q, feedback_text=None, semaphore=None):
+    """Evalúa una pregunta y genera su retroalimentación individual con Gemini.
+
+    Si ya se tiene la retroalimentación (modo batch) no se llama a Gemini.
+    Si Gemini falla, se usa la explicación almacenada en la pregunta.
+    `semaphore` limita cuántas preguntas del mismo envío están en vuelo.
+    """
+    user_answer = q.get('userAnswer', '').lower()
+    correct_answer = q.get('correctAnswer', '').lower()
+    is_correct = user_answer == correct_answer
+
+    if feedback_text:
+        return {
+            'questionIndex': i,
+            'isCorrect': is_correct,
+            'userAnswer': user_answer,
+            'correctAnswer': correct_answer,
+            'feedback': _clean_feedback_markdown(feedback_text)
+        }
+
+    try:
+        prompt = _build_answer_feedback_prompt(q, user_answer, correct_answer, is_correct)
+        if semaphore is not None:
+            async with semaphore:
+                feedback_text = await evaluator._make_gemini_request_async(prompt, temperature=0.5, max_tokens=1500)
+        else:
+            feedback_text = await evaluator._make_gemini_request_async(prompt, temperature=0.5, max_tokens=1500)
 
-            # Limpiar markdown del feedback
-            def clean_markdown(text):
-                if not text: return ''
-                return re.sub(r'^```json|```', '', text.strip(), flags=re.MULTILINE)
+        if not feedback_text:
+            feedback_text = q.get('explanation', 'Sin explicación disponible.')
+
+    except Exception as e:
+        logger.error(f"Error generando feedback para pregunta {i+1}: {str(e)}")
+        feedback_text = q.get('explanation', f'Error al generar feedback: {str(e)}')
+
+    return {
+        'questionIndex': i,
+        'isCorrect': is_correct,
+        'userAnswer': user_answer,
+        'correctAnswer': correct_answer,
+        'feedback': _clean_feedback_markdown(feedback_text)
+    }
 
-            feedback_text = clean_markdown(feedback_text)
 
-            results.append({
-                'questionIndex': i,
-                'isCorrect': is_correct,
-                'userAnswer': user_answer,
-                'correctAnswer': correct_answer,
-                'feedback': feedback_text
-            })
+@app.route('/submit-all-answers', methods=['POST'])
+async def submit_all_answers():
+    """
+    Recibe todas las respuestas del estudiante de una vez,
+    las evalúa y genera retroalimentación para cada una.
+    """
+    try:
+        data = request.json
+        questions = data.get('questions', [])
+
+        if not questions or len(questions) == 0:
+            return jsonify({'error': 'No se proporcionaron preguntas'}), 400
+
+        # Validar que cada pregunta tenga los campos necesarios
+        for i, q in enumerate(questions):
+            if not all(k in q for k in ['question', 'options', 'correctAnswer', 'userAnswer']):
+                return jsonify({'error': f'Pregunta {i+1} con formato inválido'}), 400
+
+        total_questions = len(questions)
+        feedback_mode = (data.get('feedback_mode') or 'parallel').lower()
+        if feedback_mode not in FEEDBACK_MODES:
+            return jsonify({'error': f'feedback_mode debe ser: {", ".join(FEEDBACK_MODES)}'}), 400
+
+        # En modo batch se pide todo en una sola petición; las preguntas que
+        # falten en la respuesta se completan con peticiones individuales
+        batch_feedback = {}
+        degraded = evaluator.breaker.is_open()
+        if degraded:
+            # Circuito abierto: se usa la explicación almacenada sin llamar a Gemini
+            logger.warning("Circuito abierto: retroalimentación con explicaciones almacenadas")
+            batch_feedback = {
+                i: q.get('explanation') or 'Sin explicación disponible.'
+                for i, q in enumerate(questions)
+            }
+        elif feedback_mode == 'batch':
+            batch_feedback = await _request_batch_feedback(questions)
+            missing = total_questions - len(batch_feedback)
+            if missing:
+                logger.warning(f"Retroalimentación por lote incompleta: faltan {missing}/{total_questions}, completando individualmente")
+        feedback_texts = [batch_feedback.get(i) for i in range(total_questions)]
+        pending = sum(1 for text in feedback_texts if not text)
+
+        # Procesar cada pregunta (en paralelo acotado o secuencialmente)
+        if feedback_mode != 'sequential' and pending > 1:
+            semaphore = asyncio.Semaphore(_resolve_feedback_concurrency(data.get('max_concurrency'), pending))
+            # gather conserva el orden de entrada, por lo que questionIndex queda ordenado
+            results = await asyncio.gather(*[
+                _build_answer_result(i, q, feedback_texts[i], semaphore)
+                for i, q in enumerate(questions)
+            ])
+        else:
+            results = [await _build_answer_result(i, q, feedback_texts[i]) for i, q in enumerate(questions)]
 
         # Calcular estadísticas globales
         correct_count = sum(1 for r in results if r['isCorrect'])
@@ -1439,7 +2423,9 @@ Sé claro, motivador y educativo. Responda en español."""
         return jsonify({
             'success': True,
             'results': results,
-            'summary': summary
+            'summary': summary,
+            'feedback_mode': feedback_mode,
+            'degraded': degraded
         }), 200
 
     except Exception as e:
@@ -1450,7 +2436,7 @@ Sé claro, motivador y educativo. Responda en español."""
 # ENDPOINT PARA CHAT CON TUTOR IA
 # ============================================================
 @app.route('/api/chat', methods=['POST'])
-def chat_with_ai():
+async def chat_with_ai():
     """Endpoint para chatear con el tutor IA especializado en ICFES"""
     try:
         data = request.json
@@ -1485,7 +2471,7 @@ MENSAJE DEL ESTUDIANTE:
 Responde como un tutor experto, proporcionando la ayuda más útil posible."""
 
         try:
-            ai_response = evaluator._make_gemini_request(
+            ai_response = await evaluator._make_gemini_request_async(
                 prompt,
                 temperature=0.7,
                 max_tokens=1500
@@ -1505,6 +2491,8 @@ Responde como un tutor experto, proporcionando la ayuda más útil posible."""
                 'timestamp': datetime.now().isoformat()
             }), 200
 
+        except GEMINI_UNAVAILABLE_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Error en chat IA: {str(e)}")
             return jsonify({
@@ -1512,6 +2500,8 @@ Responde como un tutor experto, proporcionando la ayuda más útil posible."""
                 'details': str(e)
             }), 500
 
+    except GEMINI_UNAVAILABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"Error general en chat: {str(e)}")
         return jsonify({'error': f'Error procesando mensaje: {str(e)}'}), 500
@@ -1525,37 +2515,68 @@ def get_users():
     # Autenticación removida - retornar lista vacía
     return jsonify({'users': [], 'total': 0, 'message': 'Autenticación manejada en frontend con Supabase'}), 200
 
+@app.route('/quota-status', methods=['GET'])
+def quota_status():
+    """Estado compartido de la cuota de Gemini (bloqueo actual, 429 recientes y circuit breaker)"""
+    if evaluator.quota is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify({
+        'enabled': True,
+        **evaluator.quota.stats(),
+        **evaluator.async_client.stats(),
+        'circuit': evaluator.breaker.snapshot()
+    }), 200
+
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Estadísticas de la caché de respuestas de Gemini, de gráficos y de documentos, y de la cola de trabajos"""
+    extra = {
+        'chart_cache': chart_cache.stats(),
+        'document_cache': document_cache.stats() if document_cache is not None else None,
+        'document_jobs': document_jobs.snapshot() if document_jobs is not None else None
+    }
+    if evaluator.cache is None:
+        return jsonify({'enabled': False, **extra}), 200
+    return jsonify({'enabled': True, **evaluator.cache.stats(), **extra}), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Endpoint para verificar el estado del sistema"""
-    try:
-        test_response = evaluator._make_gemini_request(
-            "Responda solo 'OK' para confirmar conexión.",
-            max_tokens=10
-        )
-        ai_status = "OK" in test_response.upper()
-
-        return jsonify({
-            "status": "healthy",
-            "timestamp": datetime.now().isoformat(),
-            "server": "Flask running",
-            "ai_api": "connected" if ai_status else "error",
-            "ai_provider": "Gemini",
-            "model": evaluator.default_model,
-            "users_registered": 0,
-            "version": "ICFES Pro Backend Unificado v1.0",
-            "auth_note": "Autenticación manejada en frontend con Supabase"
-        })
-    except Exception as e:
-        return jsonify({
-            "status": "partial",
-            "server": "Flask running",
-            "ai_api": "error",
-            "ai_provider": "Gemini",
-            "error": str(e),
-            "users_registered": 0,
-            "auth_note": "Autenticación manejada en frontend con Supabase"
-        }), 200
+    """Liveness: solo confirma que el proceso responde (no llama a Gemini)"""
+    return jsonify({
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "server": "Flask running",
+        "ai_provider": "Gemini",
+        "model": evaluator.default_model,
+        "users_registered": 0,
+        "version": "ICFES Pro Backend Unificado v1.0",
+        "auth_note": "Autenticación manejada en frontend con Supabase"
+    }), 200
+
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: estado en caché de Gemini (tráfico real + sondeo en segundo plano), cuota y circuito.
+
+    'ready' si Gemini responde; 'degraded' si está caído, sin cuota o con el circuito
+    abierto (se sirven respuestas de respaldo). Solo devuelve 503 en modo estricto.
+    """
+    upstream = evaluator.health.snapshot()
+    circuit = evaluator.breaker.snapshot()
+    quota_wait = evaluator.quota.retry_after() if evaluator.quota is not None else 0.0
+
+    degraded = upstream['state'] == 'down' or evaluator.breaker.is_open() or quota_wait > 0
+    status = 'degraded' if degraded else 'ready'
+    code = 503 if degraded and READINESS_FAIL_WHEN_DEGRADED else 200
+    return jsonify({
+        "status": status,
+        "timestamp": datetime.now().isoformat(),
+        "ai_api": "connected" if upstream['state'] == 'up' else upstream['state'],
+        "upstream": upstream,
+        "circuit_state": circuit['state'],
+        "quota_retry_after": round(quota_wait, 1)
+    }), code
 
 # ============================================================
 # INICIO DE LA APLICACIÓN
@@ -1584,25 +2605,34 @@ def print_startup_banner():
     print("   - POST /login                 - Login con roles")
     print("\n📝 Generación de Preguntas:")
     print("   - POST /generate-question     - Generar preguntas ICFES")
+    print("   - POST /generate-question/stream - Generar preguntas por SSE")
+    print("   - GET  /question-bank         - Estado del banco de preguntas")
+    print("   - GET  /generation-metrics    - Métricas de completado parcial")
     print("   - POST /get-feedback          - Retroalimentación individual")
     print("   - POST /evaluate-order         - Evaluar ordenamiento de elementos")
     print("   - POST /submit-all-answers    - Verificar todas las respuestas (NUEVO)")
     print("\n📄 Análisis de Documentos:")
-    print("   - POST /analyze-document      - Análisis PDF/Word completo")
+    print("   - POST /analyze-document      - Análisis PDF/Word completo (mode=job: en segundo plano)")
+    print("   - GET  /analyze-document/jobs/<id>[/events] - Estado o progreso SSE de un trabajo")
     print("\n📊 Visualización de Datos:")
     print("   - POST /generate-visual       - Generar gráficos (bar/pie)")
     print("   - POST /generate-visual-by-competencia - Gráfico por competencia")
     print("   - POST /generate-geometry-visual - Figuras geométricas")
+    print("   - GET  /charts/<hash>.png|svg - Imagen de un gráfico ya generado")
     print("\n💾 Modelos de IA:")
     print("   - POST /save-model            - Guardar modelo entrenado")
     print("\n⚙️  Administrativo:")
     print("   - GET  /users                 - Lista de usuarios")
-    print("   - GET  /health                - Estado del sistema")
+    print("   - GET  /cache-stats           - Estadísticas de caché de Gemini")
+    print("   - GET  /quota-status          - Estado de cuota de Gemini")
+    print("   - GET  /health                - Liveness (no llama a Gemini)")
+    print("   - GET  /ready                 - Readiness con estado en caché de Gemini")
     print("=" * 60)
     print("")
 
-# Imprimir banner al importar el módulo
-print_startup_banner()
+# Imprimir banner al importar el módulo (STARTUP_BANNER=false lo omite, p. ej. en scripts o pruebas)
+if os.getenv('STARTUP_BANNER', 'true').lower() in ('1', 'true', 'yes'):
+    print_startup_banner()
 
 if __name__ == '__main__':
     print("🌐 Servidor: http://127.0.0.1:5000 ")
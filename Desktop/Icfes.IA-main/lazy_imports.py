@@ -0,0 +1,51 @@
+"""
+lazy_imports.py
+Carga diferida de dependencias pesadas (matplotlib, numpy, sympy, PyPDF2).
+
+icfes_api.py no importa estas librerías al cargar el módulo: cada endpoint de
+gráficos, geometría o documentos las importa en su primer uso. Para que los
+workers de gunicorn las compartan (copy-on-write) se pueden precargar en el
+proceso maestro con preload() (ver gunicorn.conf.py). Este módulo no importa
+icfes_api, así que precargar no arranca hilos ni clientes de Gemini.
+"""
+from __future__ import annotations
+
+import importlib
+import sys
+import time
+from typing import Dict
+
+# Orden de precarga: pyplot (con backend Agg) antes que charts
+HEAVY_MODULES = (
+    "numpy",
+    "matplotlib.pyplot",
+    "matplotlib.patches",
+    "charts",
+    "sympy",
+    "math_expr",
+    "geometry",
+    "PyPDF2",
+)
+
+
+def pyplot():
+    """Devuelve matplotlib.pyplot configurado con el backend no interactivo Agg."""
+    plt = sys.modules.get("matplotlib.pyplot")
+    if plt is None:
+        import matplotlib
+        matplotlib.use("Agg")  # usar backend no interactivo para servidores
+        import matplotlib.pyplot as plt
+    return plt
+
+
+def preload() -> Dict[str, float]:
+    """Importa todas las dependencias pesadas. Devuelve el tiempo (s) de cada import."""
+    timings: Dict[str, float] = {}
+    for name in HEAVY_MODULES:
+        started = time.perf_counter()
+        if name == "matplotlib.pyplot":
+            pyplot()  # fija el backend Agg antes del import
+        else:
+            importlib.import_module(name)
+        timings[name] = round(time.perf_counter() - started, 4)
+    return timings
@@ -0,0 +1,283 @@
+"""
+question_bank.py
+Banco de preguntas pre-generadas con recarga en segundo plano.
+
+Las preguntas se agrupan en "buckets" indexados por
+(competencia, dificultad, versión del conocimiento personalizado). Un hilo
+en segundo plano mantiene cada bucket por encima de una marca mínima
+(low-water) llamando a la función generadora que recibe el banco.
+
+Los buckets que nadie pide durante bucket_ttl segundos se eliminan (y, si hay
+más de max_buckets, los menos usados), para no gastar cuota de Gemini en
+competencias pedidas una sola vez. Los buckets de precarga (pinned) se conservan.
+
+Un bloque repetido se descarta si ya está en el bucket o entre las últimas
+served_history preguntas entregadas del bucket; el historial es acotado, así
+los buckets de precarga no acumulan huellas durante toda la vida del proceso.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BucketKey = Tuple[str, str, Hashable]
+# generate_fn(competencia, dificultad, use_custom_knowledge, cantidad) -> lista de bloques
+GenerateFn = Callable[[str, str, bool, int], List[str]]
+
+
+def question_fingerprint(block: str) -> str:
+    """Huella de una pregunta, insensible a espacios y mayúsculas."""
+    normalized = re.sub(r"\s+", " ", block).strip().lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class _Bucket:
+    def __init__(self) -> None:
+        self.questions: Deque[Tuple[str, str]] = deque()  # (huella, bloque)
+        self.served: "OrderedDict[str, None]" = OrderedDict()  # huellas entregadas recientemente (LRU)
+        self.last_requested = time.time()
+        self.refilling = False  # True desde que baja de low-water hasta llegar a target
+        self.pinned = False  # Precarga: no se elimina por inactividad
+
+
+class QuestionBank:
+    """Pool de preguntas validadas, seguro entre hilos."""
+
+    def __init__(
+        self,
+        generate_fn: GenerateFn,
+        *,
+        low_water: int = 5,
+        target: int = 10,
+        batch_size: int = 5,
+        refill_interval: float = 5.0,
+        max_sessions: int = 5000,
+        session_ttl: float = 6 * 3600,
+        bucket_ttl: float = 3600,
+        max_buckets: int = 50,
+        served_history: int = 100,
+    ) -> None:
+        self.generate_fn = generate_fn
+        self.low_water = max(0, int(low_water))
+        self.target = max(self.low_water + 1, int(target))
+        self.batch_size = max(1, int(batch_size))
+        self.refill_interval = refill_interval
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.bucket_ttl = bucket_ttl
+        self.max_buckets = max(1, int(max_buckets))
+        self.served_history = max(0, int(served_history))
+
+        self._buckets: Dict[BucketKey, _Bucket] = {}
+        self._bucket_params: Dict[BucketKey, Tuple[str, str, bool]] = {}
+        self._sessions: "OrderedDict[str, Tuple[float, Set[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "duplicates_dropped": 0, "buckets_evicted": 0}
+
+    # ----------------------------
+    # Registro y consulta
+    # ----------------------------
+
+    def register(
+        self,
+        competencia: str,
+        dificultad: str,
+        knowledge_version: Hashable,
+        use_custom_knowledge: bool,
+        pinned: bool = False,
+    ) -> BucketKey:
+        """Registra un bucket para que el hilo de fondo lo mantenga lleno (pinned: no caduca)."""
+        key = (competencia, dificultad, knowledge_version)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # Al cambiar la versión del conocimiento, los buckets viejos quedan obsoletos
+                for old_key in [k for k in self._buckets if k[:2] == key[:2] and k[2] != knowledge_version]:
+                    del self._buckets[old_key]
+                    self._bucket_params.pop(old_key, None)
+                bucket = self._buckets[key] = _Bucket()
+                self._bucket_params[key] = (competencia, dificultad, use_custom_knowledge)
+            bucket.last_requested = time.time()
+            bucket.pinned = bucket.pinned or pinned
+        self._wakeup.set()
+        return key
+
+    def take(self, key: BucketKey, count: int, session_id: Optional[str] = None, partial: bool = False) -> Optional[List[str]]:
+        """Entrega `count` preguntas no vistas por la sesión, o None si no hay suficientes.
+
+        Con partial=True entrega las que haya (hasta `count`) si hay al menos una.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            seen = self._session_seen(session_id)
+            if bucket is None:
+                self.stats["misses"] += 1
+                return None
+
+            available = [item for item in bucket.questions if item[0] not in seen]
+            if len(available) < count and not (partial and available):
+                self.stats["misses"] += 1
+                self._wakeup.set()
+                return None
+
+            chosen = available[:count]
+            chosen_fps = {fp for fp, _ in chosen}
+            bucket.questions = deque(item for item in bucket.questions if item[0] not in chosen_fps)
+            for fp in chosen_fps:
+                bucket.served[fp] = None
+                bucket.served.move_to_end(fp)
+            while len(bucket.served) > self.served_history:
+                bucket.served.popitem(last=False)
+            seen.update(chosen_fps)
+            self.stats["hits"] += 1
+            remaining = len(bucket.questions)
+
+        if remaining < self.low_water:
+            self._wakeup.set()
+        return [block for _, block in chosen]
+
+    def mark_served(self, blocks: List[str], session_id: Optional[str]) -> None:
+        """Registra preguntas generadas en vivo como vistas por la sesión."""
+        if not session_id:
+            return
+        with self._lock:
+            self._session_seen(session_id).update(question_fingerprint(b) for b in blocks)
+
+    def add(self, key: BucketKey, blocks: List[str]) -> int:
+        """Añade preguntas a un bucket descartando duplicados. Devuelve cuántas se añadieron."""
+        added = 0
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                return 0
+            queued = {fp for fp, _ in bucket.questions}
+            for block in blocks:
+                fp = question_fingerprint(block)
+                if fp in queued or fp in bucket.served:
+                    self.stats["duplicates_dropped"] += 1
+                    continue
+                queued.add(fp)
+                bucket.questions.append((fp, block))
+                added += 1
+            self.stats["generated"] += added
+        return added
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            buckets = [
+                {
+                    "competencia": key[0],
+                    "dificultad": key[1],
+                    "knowledge_version": key[2],
+                    "available": len(bucket.questions),
+                }
+                for key, bucket in self._buckets.items()
+            ]
+            return {
+                "low_water": self.low_water,
+                "target": self.target,
+                "buckets": buckets,
+                "sessions": len(self._sessions),
+                **self.stats,
+            }
+
+    def _session_seen(self, session_id: Optional[str]) -> Set[str]:
+        # Debe llamarse con self._lock tomado
+        if not session_id:
+            return set()
+        now = time.time()
+        entry = self._sessions.pop(session_id, None)
+        seen = entry[1] if entry and now - entry[0] < self.session_ttl else set()
+        self._sessions[session_id] = (now, seen)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return seen
+
+    # ----------------------------
+    # Recarga en segundo plano
+    # ----------------------------
+
+    def start(self) -> None:
+        """Arranca el hilo de recarga (idempotente)."""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name="question-bank-refill", daemon=True)
+            self._worker.start()
+
+    def _evict_idle(self) -> None:
+        """Elimina buckets sin pedidos en bucket_ttl y, sobre max_buckets, los menos usados."""
+        # Debe llamarse con self._lock tomado
+        now = time.time()
+        evictable = sorted(
+            (bucket.last_requested, key) for key, bucket in self._buckets.items() if not bucket.pinned
+        )
+        overflow = len(self._buckets) - self.max_buckets
+        for index, (last_requested, key) in enumerate(evictable):
+            if now - last_requested < self.bucket_ttl and index >= overflow:
+                break
+            del self._buckets[key]
+            self._bucket_params.pop(key, None)
+            self.stats["buckets_evicted"] += 1
+            logger.info(f"Bucket del banco de preguntas eliminado por inactividad: {key[0]}/{key[1]}")
+
+    def _next_refill(self) -> Optional[Tuple[BucketKey, int]]:
+        with self._lock:
+            self._evict_idle()
+            candidates = []
+            for key, bucket in self._buckets.items():
+                size = len(bucket.questions)
+                if size < self.low_water:
+                    bucket.refilling = True
+                elif size >= self.target:
+                    bucket.refilling = False
+                if bucket.refilling:
+                    candidates.append((size, key))
+            if not candidates:
+                return None
+            size, key = min(candidates, key=lambda c: c[0])
+            return key, min(self.batch_size, self.target - size)
+
+    def refill_once(self) -> bool:
+        """Recarga el bucket más vacío que bajó de low-water (hasta llegar a target).
+
+        Devuelve True si se añadieron preguntas.
+        """
+        job = self._next_refill()
+        if job is None:
+            return False
+        key, count = job
+        with self._lock:
+            params = self._bucket_params.get(key)
+        if params is None:
+            return False
+        competencia, dificultad, use_custom_knowledge = params
+        try:
+            blocks = self.generate_fn(competencia, dificultad, use_custom_knowledge, count)
+            added = self.add(key, blocks)
+            logger.info(f"Banco de preguntas recargado: {competencia}/{dificultad} +{added}")
+        except Exception as e:
+            logger.warning(f"Error recargando banco de preguntas {competencia}/{dificultad}: {str(e)}")
+            return False
+        # Si todo fueron duplicados, esperar al siguiente ciclo en lugar de insistir
+        return added > 0
+
+    def _run(self) -> None:
+        while True:
+            try:
+                worked = self.refill_once()
+            except Exception as e:  # pragma: no cover - el hilo nunca debe morir
+                logger.error(f"Error en hilo del banco de preguntas: {str(e)}")
+                worked = False
+            if not worked:
+                self._wakeup.wait(self.refill_interval)
+                self._wakeup.clear()
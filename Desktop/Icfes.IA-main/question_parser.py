@@ -0,0 +1,200 @@
+"""
+question_parser.py
+Parser de preguntas ICFES de opción múltiple generadas por IA.
+
+Convierte el texto de Gemini (formato "Pregunta: / a) b) c) d) / Respuesta correcta: /
+Explicación:") en objetos tipados y compactos. Cada bloque se valida por separado,
+así un bloque mal formado no invalida al resto. Incluye un parser incremental para
+respuestas en streaming.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+OPTION_LETTERS = ("a", "b", "c", "d")
+
+_HEADER_RE = re.compile(r"^[ \t*#]*Pregunta\s*\d*\s*:", re.MULTILINE)
+_STEM_RE = re.compile(r"^Pregunta\s*\d*\s*:\s*(.*)$", re.IGNORECASE)
+_OPTION_RE = re.compile(r"^\(?([a-dA-D])[\)\.]\s*(.+)$")
+_ANSWER_RE = re.compile(r"^Respuesta\s+correcta\s*:\s*\(?([a-dA-D])\b", re.IGNORECASE)
+_EXPLANATION_RE = re.compile(r"^Explicaci[oó]n\s*:\s*(.*)$", re.IGNORECASE)
+
+
+@dataclass(frozen=True, slots=True)
+class ICFESQuestion:
+    """Pregunta ICFES validada: enunciado, cuatro opciones, letra correcta y explicación."""
+
+    stem: str
+    options: Tuple[str, str, str, str]
+    answer: str
+    explanation: str
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "stem": self.stem,
+            "options": dict(zip(OPTION_LETTERS, self.options)),
+            "answer": self.answer,
+            "explanation": self.explanation,
+        }
+
+    def to_text(self) -> str:
+        """Serializa al formato de texto canónico que consume el frontend."""
+        lines = [f"Pregunta: {self.stem}"]
+        lines.extend(f"{letter}) {text}" for letter, text in zip(OPTION_LETTERS, self.options))
+        lines.append(f"Respuesta correcta: {self.answer}")
+        lines.append(f"Explicación: {self.explanation}")
+        return "\n".join(lines)
+
+    def fingerprint_text(self) -> str:
+        """Texto normalizado para detectar preguntas repetidas."""
+        return re.sub(r"\s+", " ", self.stem).strip().lower()
+
+
+def _clean_line(line: str) -> str:
+    # Quitar viñetas y negritas de markdown que a veces añade el modelo
+    return line.replace("**", "").strip().lstrip("#").strip()
+
+
+def parse_question_block(block: str) -> Optional[ICFESQuestion]:
+    """Parsea un bloque de pregunta. Devuelve None si el bloque está mal formado."""
+    stem_parts: List[str] = []
+    options: Dict[str, List[str]] = {}
+    answer: Optional[str] = None
+    explanation_parts: List[str] = []
+    section = None
+
+    for raw_line in block.splitlines():
+        line = _clean_line(raw_line)
+        if not line:
+            continue
+
+        m = _STEM_RE.match(line)
+        if m and section is None:
+            section = "stem"
+            if m.group(1):
+                stem_parts.append(m.group(1).strip())
+            continue
+
+        m = _ANSWER_RE.match(line)
+        if m:
+            answer = m.group(1).lower()
+            section = "answer"
+            continue
+
+        m = _EXPLANATION_RE.match(line)
+        if m:
+            section = "explanation"
+            if m.group(1):
+                explanation_parts.append(m.group(1).strip())
+            continue
+
+        m = _OPTION_RE.match(line)
+        if m and section in ("stem", "options"):
+            letter = m.group(1).lower()
+            if letter in options:
+                return None  # opción repetida
+            options[letter] = [m.group(2).strip()]
+            section = "options"
+            continue
+
+        if section == "stem":
+            stem_parts.append(line)
+        elif section == "options":
+            options[list(options)[-1]].append(line)
+        elif section == "explanation":
+            explanation_parts.append(line)
+        elif section is None:
+            continue  # texto previo a la pregunta
+        else:
+            return None  # texto inesperado entre la respuesta y la explicación
+
+    if not stem_parts or answer is None or not explanation_parts:
+        return None
+    if tuple(options) != OPTION_LETTERS:
+        return None
+
+    return ICFESQuestion(
+        stem=" ".join(stem_parts),
+        options=tuple(" ".join(options[letter]) for letter in OPTION_LETTERS),
+        answer=answer,
+        explanation=" ".join(explanation_parts),
+    )
+
+
+def _iter_raw_blocks(text: str) -> Iterator[str]:
+    starts = [m.start() for m in _HEADER_RE.finditer(text)]
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(text)
+        yield text[start:end]
+
+
+def parse_questions(text: str) -> Tuple[List[ICFESQuestion], int]:
+    """Parsea todo el texto. Devuelve (preguntas válidas, número de bloques rechazados)."""
+    questions: List[ICFESQuestion] = []
+    rejected = 0
+    for raw in _iter_raw_blocks(text or ""):
+        question = parse_question_block(raw)
+        if question is None:
+            rejected += 1
+        else:
+            questions.append(question)
+    return questions, rejected
+
+
+class QuestionStreamParser:
+    """Parser incremental: recibe fragmentos de texto y entrega preguntas completas.
+
+    Un bloque se considera completo cuando empieza la siguiente pregunta o
+    cuando su 'Explicación:' termina en una línea en blanco.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self.rejected = 0
+
+    def feed(self, chunk: str) -> List[ICFESQuestion]:
+        self._buffer += chunk
+        ready: List[ICFESQuestion] = []
+        while True:
+            starts = [m.start() for m in _HEADER_RE.finditer(self._buffer)]
+            if not starts:
+                break
+            start = starts[0]
+            if len(starts) > 1:
+                end = starts[1]
+            else:
+                m = re.search(r"Explicaci[oó]n\s*:", self._buffer[start:], re.IGNORECASE)
+                if not m:
+                    break
+                explanation_pos = start + m.end()
+                gap = re.search(r"\n\s*\n", self._buffer[explanation_pos:])
+                if not gap:
+                    break
+                end = explanation_pos + gap.end()
+            ready.extend(self._parse(self._buffer[start:end]))
+            self._buffer = self._buffer[end:]
+        return ready
+
+    def close(self) -> List[ICFESQuestion]:
+        remaining, self._buffer = self._buffer, ""
+        questions = []
+        for raw in _iter_raw_blocks(remaining):
+            questions.extend(self._parse(raw))
+        return questions
+
+    def _parse(self, raw: str) -> List[ICFESQuestion]:
+        question = parse_question_block(raw)
+        if question is None:
+            self.rejected += 1
+            return []
+        return [question]
+
+
+def iter_streamed_questions(chunks: Iterable[str], parser: Optional[QuestionStreamParser] = None) -> Iterator[ICFESQuestion]:
+    """Itera preguntas completas a partir de fragmentos de texto en streaming."""
+    parser = parser or QuestionStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
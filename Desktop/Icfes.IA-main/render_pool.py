@@ -0,0 +1,210 @@
+"""
+render_pool.py
+Pool de procesos para renderizar gráficos fuera del hilo de la petición.
+
+Los endpoints describen el gráfico con una especificación declarativa (un dict
+serializable) y reciben los bytes de la imagen. Cada proceso dibuja con la API
+orientada a objetos de Matplotlib (Figure + Agg), así que el renderizado escala
+entre núcleos y una petición no puede tocar la figura de otra.
+
+Especificación:
+    {"kind": "bar",      "format": "png", "dpi": 100, "params": {kwargs de charts.bar_chart_exam}}
+    {"kind": "pie",      "format": "svg", "dpi": 72,  "params": {kwargs de charts.pie_chart_exam}}
+    {"kind": "geometry", "format": "png", "dpi": 300, "params": {"shapes": [...], "title": "...", "figsize": [6, 6]}}
+
+El formato y el dpi salen de resolve_output(): perfil 'preview' (PNG barato para
+pantalla), 'print' (PNG a alta resolución para exportar) o 'svg', ajustables con
+un dpi o un ancho objetivo en píxeles.
+"""
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+from contextlib import nullcontext
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ChartSpec = Dict[str, Any]
+CHART_KINDS = ("bar", "pie", "geometry")
+
+# ----------------------------
+# Perfiles de salida
+# ----------------------------
+
+OUTPUT_FORMATS = ("png", "svg")
+OUTPUT_PROFILES = {
+    "preview": {"format": "png", "dpi": 100},
+    "print": {"format": "png", "dpi": 300},
+    "svg": {"format": "svg", "dpi": 72},
+}
+MIN_DPI = 50
+MAX_DPI = 600
+
+# Ancho por defecto de cada figura en pulgadas (ver charts.py y geometry)
+_DEFAULT_WIDTH_IN = {"bar": 150 / 25.4, "pie": 120 / 25.4, "geometry": 6.0}
+
+
+def figure_width_in(kind: str, params: Optional[Dict[str, Any]] = None) -> float:
+    params = params or {}
+    if kind == "geometry" and params.get("figsize"):
+        return float(params["figsize"][0])
+    if params.get("ancho_mm"):
+        return float(params["ancho_mm"]) / 25.4
+    return _DEFAULT_WIDTH_IN.get(kind, 6.0)
+
+
+def resolve_output(
+    kind: str,
+    params: Optional[Dict[str, Any]] = None,
+    *,
+    profile: str = "preview",
+    fmt: Optional[str] = None,
+    dpi: Optional[Any] = None,
+    width_px: Optional[Any] = None,
+) -> Tuple[str, int]:
+    """Formato y dpi de salida a partir del perfil, un dpi explícito o un ancho objetivo en píxeles.
+
+    Lanza ValueError si el perfil, el formato o los números no son válidos.
+    """
+    settings = OUTPUT_PROFILES.get((profile or "preview").lower())
+    if settings is None:
+        raise ValueError(f"Perfil no soportado: {profile}. Use uno de: {', '.join(OUTPUT_PROFILES)}")
+    fmt = (fmt or settings["format"]).lower()
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt}. Use uno de: {', '.join(OUTPUT_FORMATS)}")
+    if fmt == "svg":
+        # Vectorial: el dpi no cambia el resultado, se fija para no duplicar entradas de caché
+        return fmt, 72
+    try:
+        if width_px:
+            dpi = float(width_px) / figure_width_in(kind, params)
+        dpi = float(dpi or settings["dpi"])
+    except (TypeError, ValueError):
+        raise ValueError("'dpi' y 'width_px' deben ser numéricos")
+    return fmt, int(min(max(round(dpi), MIN_DPI), MAX_DPI))
+
+
+def _init_worker() -> None:
+    """Carga Matplotlib (Agg), charts y geometry una sola vez por proceso."""
+    from lazy_imports import pyplot
+
+    pyplot()
+    import charts  # noqa: F401
+    import geometry  # noqa: F401
+
+
+def render_chart(spec: ChartSpec) -> bytes:
+    """Renderiza una especificación de gráfico y devuelve los bytes en el formato pedido (PNG o SVG)."""
+    kind = spec.get("kind")
+    params = dict(spec.get("params") or {})
+    fmt = spec.get("format", "png")
+    dpi = int(spec.get("dpi", OUTPUT_PROFILES["preview"]["dpi"]))
+
+    _init_worker()
+    from charts import exam_theme, figure_bytes
+
+    if kind not in CHART_KINDS:
+        raise ValueError(f"Tipo de gráfico no soportado: {kind}")
+
+    # El tema sigue activo al serializar: Matplotlib crea ticks y textos al dibujar
+    theme = exam_theme(use_bw=bool(params.get("paleta_bw"))) if kind in ("bar", "pie") else nullcontext()
+    with theme:
+        if kind == "bar":
+            from charts import bar_chart_exam
+
+            fig, _ = bar_chart_exam(**params, salida=None)
+        elif kind == "pie":
+            from charts import pie_chart_exam
+
+            fig, _ = pie_chart_exam(**params, salida=None)
+        else:
+            from matplotlib.figure import Figure
+
+            from geometry import draw_geometry
+
+            fig = Figure(figsize=tuple(params.get("figsize") or (6, 6)))
+            ax = fig.subplots()
+            draw_geometry(ax, params.get("shapes") or [])
+            ax.set_title(params.get("title", ""))
+        return figure_bytes(fig, fmt=fmt, dpi=dpi)
+
+
+class RenderPool:
+    """ProcessPoolExecutor perezoso (uno por proceso web) para render_chart.
+
+    Con max_workers=0 se renderiza en el propio proceso, serializado con un lock
+    porque exam_theme() cambia rcParams (de forma temporal) mientras dibuja.
+    """
+
+    def __init__(self, *, max_workers: int = 2, timeout: float = 30.0) -> None:
+        self.max_workers = max(0, int(max_workers))
+        self.timeout = timeout
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._inline_lock = threading.Lock()
+        self.rendered = 0
+        self.restarts = 0
+
+    def _executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        # Tras un fork (workers de gunicorn) el pool del padre no sirve: se recrea.
+        # 'spawn' evita heredar los hilos (bucle de Gemini, banco de preguntas) del proceso web.
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def _reset(self, broken: concurrent.futures.ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+                self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def warm(self) -> None:
+        """Arranca los procesos del pool y espera a que importen Matplotlib (bloquea; llamar en segundo plano).
+
+        Los procesos 'spawn' no heredan la precarga del maestro: sin esto el primer
+        render de cada proceso paga el import.
+        """
+        if self.max_workers == 0:
+            _init_worker()
+            return
+        pool = self._executor()
+        for future in [pool.submit(_init_worker) for _ in range(self.max_workers)]:
+            future.result(self.timeout)
+
+    def render(self, spec: ChartSpec) -> bytes:
+        """Renderiza la especificación en el pool y devuelve los bytes de la imagen (bloquea hasta el resultado)."""
+        if self.max_workers == 0:
+            with self._inline_lock:
+                image = render_chart(spec)
+        else:
+            pool = self._executor()
+            try:
+                image = pool.submit(render_chart, spec).result(self.timeout)
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. por memoria): recrear el pool y reintentar una vez
+                logger.warning("Pool de render roto, recreando procesos")
+                self._reset(pool)
+                image = self._executor().submit(render_chart, spec).result(self.timeout)
+        self.rendered += 1
+        return image
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "mode": "inline" if self.max_workers == 0 else "process",
+            "rendered": self.rendered,
+            "restarts": self.restarts,
+        }
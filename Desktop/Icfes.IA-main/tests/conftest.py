@@ -0,0 +1,39 @@
+"""
+Configuración común de las pruebas: importa icfes_api una sola vez con
+cachés y colas en un directorio temporal y sin hilos que llamen a Gemini.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_TMP = tempfile.mkdtemp(prefix="icfes_tests_")
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ.update({
+    "GEMINI_CACHE_BACKEND": "memory",
+    "DOCUMENT_CACHE_BACKEND": "memory",
+    "DOCUMENT_JOBS_ENABLED": "false",
+    "GEMINI_QUOTA_PATH": os.path.join(_TMP, "quota.sqlite3"),
+    "CHART_CACHE_DIR": os.path.join(_TMP, "charts"),
+    "QUESTION_BANK_ENABLED": "false",
+    "QUESTION_BANK_PREWARM": "false",
+    "UPSTREAM_PROBE_INTERVAL": "0",
+    "STARTUP_BANNER": "false",
+})
+
+
+@pytest.fixture(scope="session")
+def api():
+    pytest.importorskip("google.generativeai")
+    import icfes_api
+
+    icfes_api.app.config["TESTING"] = True
+    return icfes_api
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
@@ -0,0 +1,115 @@
+"""/analyze-document: caché por contenido, force_refresh y respuestas inválidas de Gemini."""
+import io
+import json
+import zipfile
+
+import pytest
+
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+CHUNK_REPLY = json.dumps({
+    "analisis_completo": [{"numero": 1, "pregunta": "1. ¿Cuánto es 2 + 2?", "es_correcta": True}],
+    "resumen": {"recomendaciones_icfes": "Repasar aritmética."},
+})
+
+
+def _docx(text):
+    document = (
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+        f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:body></w:document>"
+    )
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr("word/document.xml", document)
+    return buf.getvalue()
+
+
+@pytest.fixture
+def gemini(api, monkeypatch):
+    replies, calls = [], []
+
+    async def fake_request(prompt, temperature, max_tokens, max_retries):
+        calls.append(prompt)
+        return replies.pop(0)
+
+    monkeypatch.setattr(api.evaluator, "_request_gemini_uncached", fake_request)
+    api.evaluator.cache.clear()
+    api.document_cache.clear()
+    return replies, calls
+
+
+def _upload(client, content, **fields):
+    data = {"file": (io.BytesIO(content), "examen.docx", DOCX_MIMETYPE), **fields}
+    return client.post("/analyze-document", data=data, content_type="multipart/form-data")
+
+
+def test_force_refresh_asks_gemini_again(client, gemini):
+    replies, calls = gemini
+    content = _docx("1. ¿Cuánto es 2 + 2? Respuesta del estudiante: 4. " * 3)
+    replies.extend([CHUNK_REPLY, CHUNK_REPLY])
+
+    first = _upload(client, content)
+    cached = _upload(client, content)
+    refreshed = _upload(client, content, force_refresh="true")
+
+    assert first.status_code == cached.status_code == refreshed.status_code == 200
+    assert cached.get_json()["cache_hit"] is True
+    assert refreshed.get_json()["cache_hit"] is False
+    assert len(calls) == 2
+
+
+def test_invalid_chunk_reply_is_retried_on_next_upload(client, gemini):
+    replies, calls = gemini
+    content = _docx("1. ¿Cuál es la capital de Colombia? Respuesta del estudiante: Bogotá. " * 3)
+    replies.extend(["esto no es JSON", CHUNK_REPLY])
+
+    failed = _upload(client, content)
+    retried = _upload(client, content)
+
+    assert failed.status_code == 500
+    assert retried.status_code == 200
+    assert retried.get_json()["metadata"]["total_items"] == 1
+    assert len(calls) == 2
+
+
+def test_body_over_max_content_length_is_rejected_with_json_413(api, client, gemini, monkeypatch):
+    replies, calls = gemini
+    monkeypatch.setitem(api.app.config, "MAX_CONTENT_LENGTH", 4096)
+
+    response = _upload(client, b"\0" * 16 * 1024)
+
+    assert response.status_code == 413
+    assert "demasiado grande" in response.get_json()["error"]
+    assert calls == []
+
+
+def test_file_over_upload_limit_within_form_margin_is_rejected(api, client, gemini, monkeypatch):
+    replies, calls = gemini
+    monkeypatch.setattr(api, "MAX_UPLOAD_BYTES", 1024)
+
+    response = _upload(client, _docx("1. ¿Cuánto es 2 + 2? " * 200))
+
+    assert response.status_code == 400
+    assert "demasiado grande" in response.get_json()["error"]
+    assert calls == []
+
+
+def test_upload_spooled_to_disk_is_still_analyzed(api, client, gemini, monkeypatch):
+    replies, calls = gemini
+    replies.append(CHUNK_REPLY)
+    rolled = []
+    original = api.tempfile.SpooledTemporaryFile
+
+    def spooled(*args, **kwargs):
+        stream = original(*args, **kwargs)
+        rolled.append(stream)
+        return stream
+
+    monkeypatch.setattr(api, "UPLOAD_SPOOL_BYTES", 256)
+    monkeypatch.setattr(api.tempfile, "SpooledTemporaryFile", spooled)
+
+    response = _upload(client, _docx("1. ¿Cuánto es 2 + 2? Respuesta del estudiante: 4. " * 20))
+
+    assert response.status_code == 200
+    assert rolled and all(stream._rolled for stream in rolled)
+    assert len(calls) == 1
@@ -0,0 +1,55 @@
+"""Retroalimentación por lote: envíos grandes repartidos en lotes y JSON truncado."""
+import asyncio
+import json
+import re
+
+
+def _questions(n):
+    return [
+        {"question": f"Pregunta {i}", "options": {"A": "1", "B": "2"}, "selectedAnswer": "A",
+         "correctAnswer": "B", "explanation": "Porque sí."}
+        for i in range(n)
+    ]
+
+
+def _reply(indices):
+    return json.dumps({"feedback": [{"questionIndex": i, "feedback": f"Retro {i}"} for i in indices]})
+
+
+def _fake_requests(api, monkeypatch, reply_for):
+    calls = []
+
+    async def fake_request(prompt, temperature=0.7, max_tokens=1000, **kwargs):
+        indices = [int(n) for n in re.findall(r'### questionIndex: (\d+)', prompt)]
+        calls.append((indices, max_tokens))
+        return reply_for(indices)
+
+    monkeypatch.setattr(api.evaluator, "_make_gemini_request_async", fake_request)
+    return calls
+
+
+def test_large_batch_is_split_under_token_cap(api, monkeypatch):
+    calls = _fake_requests(api, monkeypatch, lambda indices: _reply(sorted(set(indices))))
+
+    feedback = asyncio.run(api._request_batch_feedback(_questions(20)))
+
+    assert sorted(feedback) == list(range(20))
+    assert len(calls) == 2
+    assert all(max_tokens <= api.FEEDBACK_BATCH_MAX_TOKENS for _, max_tokens in calls)
+
+
+def test_truncated_reply_keeps_complete_items(api, monkeypatch):
+    truncated = _reply([0, 1, 2])[:-40]
+    _fake_requests(api, monkeypatch, lambda indices: truncated)
+
+    feedback = asyncio.run(api._request_batch_feedback(_questions(3)))
+
+    assert sorted(feedback) == [0, 1]
+
+
+def test_items_outside_chunk_are_ignored(api, monkeypatch):
+    _fake_requests(api, monkeypatch, lambda indices: _reply([0, 15]))
+
+    feedback = asyncio.run(api._request_batch_feedback(_questions(12)))
+
+    assert sorted(feedback) == [0]
@@ -0,0 +1,52 @@
+"""ChartCache: LRU acotado por bytes (imagen + base64) y copia compartida en disco."""
+from chart_cache import CachedChart, ChartCache
+
+IMAGE = b"\x89PNG" + b"0" * 296  # 300 bytes -> 300 + 400 de base64 = 700 contados
+
+
+def _key(n):
+    return f"{n:064x}"
+
+
+def test_size_counts_image_and_base64():
+    assert CachedChart(_key(1), IMAGE).size == 700
+
+
+def test_evicts_least_recently_used_to_stay_under_byte_budget():
+    cache = ChartCache(max_bytes=2000)
+    for n in range(3):
+        cache.put(_key(n), IMAGE)
+    assert cache.stats()["bytes"] == 1400  # el tercero desalojó al primero
+    assert cache.get(_key(0)) is None and cache.stats()["evictions"] == 1
+
+    cache.get(_key(1))  # ahora el menos usado es el 2
+    cache.put(_key(3), IMAGE)
+
+    assert cache.get(_key(2)) is None
+    assert cache.get(_key(1)) is not None and cache.get(_key(3)) is not None
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_replacing_an_entry_does_not_double_count():
+    cache = ChartCache(max_bytes=2000)
+    cache.put(_key(1), IMAGE)
+    cache.put(_key(1), IMAGE)
+    assert cache.stats()["bytes"] == 700 and cache.stats()["entries"] == 1
+
+
+def test_chart_larger_than_budget_only_goes_to_disk(tmp_path):
+    cache = ChartCache(max_bytes=500, directory=str(tmp_path))
+    cache.put(_key(1), IMAGE)
+
+    assert cache.stats()["entries"] == 0
+    chart = cache.get(_key(1))
+    assert chart is not None and chart.content == IMAGE
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_copy_is_shared_between_workers(tmp_path):
+    ChartCache(directory=str(tmp_path)).put(_key(7), b"<svg/>", "image/svg+xml")
+
+    chart = ChartCache(directory=str(tmp_path)).get(_key(7))
+
+    assert chart.mimetype == "image/svg+xml" and chart.extension == "svg"
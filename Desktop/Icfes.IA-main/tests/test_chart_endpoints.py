@@ -0,0 +1,133 @@
+"""Los tres endpoints de gráficos responden en cada response_mode."""
+import json
+
+import pytest
+
+MODES = ("base64", "url", "binary")
+
+GEOMETRY_PLAN = json.dumps({"shapes": [
+    {"type": "triangle", "points": [[0, 0], [4, 0], [2, 3]]},
+    {"type": "axis", "range": 5},
+]})
+
+
+def _requests():
+    return {
+        "generate-visual": {
+            "chart_type": "bar",
+            "labels": ["Correctas", "Incorrectas"],
+            "values": [7, 3],
+            "title": "Resultados",
+        },
+        "generate-visual-by-competencia": {
+            "items": [{"competencia": "Álgebra", "valor": 4}, {"competencia": "Geometría", "valor": 2}],
+        },
+        "generate-geometry-visual": {
+            "question_text": "Un triángulo ABC tiene base 4 y altura 3.",
+        },
+    }
+
+
+@pytest.fixture(autouse=True)
+def _gemini_plan(api, monkeypatch):
+    # La figura geométrica pide el plan a Gemini; aquí se responde con uno fijo
+    monkeypatch.setattr(api.evaluator, "_make_gemini_request", lambda *args, **kwargs: GEOMETRY_PLAN)
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("endpoint", sorted(_requests()))
+def test_chart_endpoint_response_modes(client, endpoint, mode):
+    response = client.post(f"/{endpoint}", json={**_requests()[endpoint], "response_mode": mode})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.headers["ETag"]
+    if mode == "binary":
+        assert response.mimetype == "image/png"
+        assert response.data.startswith(b"\x89PNG")
+        image_url = response.headers["Content-Location"]
+    else:
+        body = response.get_json()
+        assert body["success"] is True
+        assert ("image" in body) == (mode == "base64")
+        image_url = body["image_url"]
+
+    image = client.get(image_url)
+    assert image.status_code == 200
+    assert image.data.startswith(b"\x89PNG")
+
+
+def test_chart_endpoint_not_modified(client):
+    payload = _requests()["generate-visual"]
+    first = client.post("/generate-visual", json={**payload, "response_mode": "url"})
+    again = client.post(
+        "/generate-visual", json={**payload, "response_mode": "url"},
+        headers={"If-None-Match": first.headers["ETag"]},
+    )
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize("analysis, forced, expected", [
+    ([{"es_correcta": True}, {"es_correcta": False}], None, False),  # conteos 1 y 1
+    ([{"es_correcta": True}] * 60 + [{"es_correcta": False}] * 40, None, False),  # conteos que suman 100
+    ([{"es_correcta": True}, {"es_correcta": False}], True, True),
+])
+def test_local_aggregation_is_not_percentage(api, client, monkeypatch, analysis, forced, expected):
+    specs = []
+    original = api._render_chart_cached
+    monkeypatch.setattr(api, "_render_chart_cached", lambda spec: specs.append(spec) or original(spec))
+    payload = {"chart_type": "bar", "analysis_data": {"analysis": analysis}, "response_mode": "url"}
+    if forced is not None:
+        payload["porcentaje"] = forced
+
+    response = client.post("/generate-visual", json=payload)
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.get_json()["data_source"] == "local"
+    assert specs[0]["params"]["valores_como_porcentaje"] is expected
+
+
+def test_etag_covers_mode_and_payload(client):
+    payload = _requests()["generate-visual"]
+    etags = {
+        mode: client.post("/generate-visual", json={**payload, "response_mode": mode}).headers["ETag"]
+        for mode in MODES
+    }
+    assert len(set(etags.values())) == 3  # una representación distinta por modo
+
+    # Misma imagen, distinto payload (generated_by_ai/data_source): no debe responder 304
+    changed = client.post(
+        "/generate-visual",
+        json={"chart_type": "bar", "analysis_data": {"analysis": [{"es_correcta": True}] * 7 + [{"es_correcta": False}] * 3},
+              "title": "Resultados", "xlabel": "Categorías", "ylabel": "Número de Preguntas", "response_mode": "url"},
+        headers={"If-None-Match": etags["url"]},
+    )
+    assert changed.status_code == 200
+    assert changed.get_json()["data_source"] == "local"
+    same_image = client.post("/generate-visual", json={**payload, "response_mode": "url"})
+    assert changed.get_json()["image_url"] == same_image.get_json()["image_url"]
+
+
+def test_binary_etag_matches_chart_url(client):
+    response = client.post("/generate-visual", json={**_requests()["generate-visual"], "response_mode": "binary"})
+    image = client.get(response.headers["Content-Location"], headers={"If-None-Match": response.headers["ETag"]})
+    assert image.status_code == 304
+
+
+def test_empty_local_aggregation_falls_back_to_gemini(api, client, monkeypatch):
+    prompts = []
+    plan = json.dumps({"labels": ["Álgebra", "Geometría"], "values": [3, 1], "title": "Temas"})
+    monkeypatch.setattr(
+        api.evaluator, "_make_gemini_request", lambda prompt, *args, **kwargs: prompts.append(prompt) or plan
+    )
+
+    response = client.post("/generate-visual", json={
+        "chart_type": "bar",
+        "analysis_data": {"analysis": [{"es_correcta": False, "pregunta": "2x + 1 = 5"}]},
+        "group_by": "concepto",
+        "response_mode": "url",
+    })
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    body = response.get_json()
+    assert body["data_source"] == "ai" and "grouped_by" not in body
+    assert '"es_correcta": false' in prompts[0]
@@ -0,0 +1,41 @@
+import matplotlib
+import pytest
+
+import charts
+
+
+def _rc_snapshot():
+    return {key: matplotlib.rcParams[key] for key in charts.EXAM_THEME.rc}
+
+
+def test_charts_do_not_touch_global_rcparams():
+    before = _rc_snapshot()
+
+    fig, _ = charts.bar_chart_exam(["A", "B", "C"], [3, 1, 2], titulo="Resultados")
+    charts.figure_bytes(fig)
+    fig, _ = charts.pie_chart_exam(["Sí", "No"], [70, 30], paleta_bw=True)
+    charts.figure_bytes(fig, fmt="svg")
+
+    assert _rc_snapshot() == before
+
+
+def test_theme_applies_only_inside_the_context():
+    font = matplotlib.rcParams["font.family"]
+    with charts.exam_theme(use_bw=True) as theme:
+        assert theme is charts.EXAM_THEME_BW
+        assert matplotlib.rcParams["axes.prop_cycle"].by_key()["color"] == list(theme.palette)
+    assert matplotlib.rcParams["font.family"] == font
+
+
+def test_prebuilt_themes_are_immutable():
+    with pytest.raises(TypeError):
+        charts.EXAM_THEME.rc["grid.alpha"] = 1.0
+    assert charts.EXAM_THEME.palette != charts.EXAM_THEME_BW.palette
+
+
+def test_bars_are_sorted_and_drawn_with_matplotlib_patches():
+    fig, ax = charts.bar_chart_exam(["A", "B", "C"], [1, 3, 2])
+
+    assert [p.get_height() for p in ax.patches] == [3, 2, 1]
+    assert [t.get_text() for t in ax.get_xticklabels()] == ["B", "C", "A"]
+    assert [t.get_text() for t in ax.texts] == ["3", "2", "1"]
@@ -0,0 +1,73 @@
+"""Transiciones del circuit breaker: cerrado → abierto → semiabierto → cerrado/abierto."""
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "time", lambda: now[0])
+    return now
+
+
+def test_opens_when_failure_rate_reached(clock):
+    breaker = CircuitBreaker(min_calls=4, failure_rate=0.5, open_seconds=30)
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED  # menos de min_calls
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN and breaker.is_open()
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == 30
+
+
+def test_opens_on_slow_calls(clock):
+    breaker = CircuitBreaker(min_calls=2, slow_call_seconds=5, slow_call_rate=0.8)
+    breaker.record_success(6)
+    breaker.record_success(7)
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_one_probe_and_closes_on_success(clock):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30)
+    breaker.record_failure()
+    clock[0] += 31
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # solo una llamada de prueba a la vez
+
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30)
+    breaker.record_failure()
+    clock[0] += 31
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN and breaker.times_opened == 2
+    assert breaker.retry_after() == pytest.approx(30)
+
+
+def test_release_frees_half_open_permit(clock):
+    breaker = CircuitBreaker(min_calls=1, open_seconds=30)
+    breaker.record_failure()
+    clock[0] += 31
+    breaker.before_call()
+
+    breaker.release()
+
+    breaker.before_call()  # el permiso liberado (p. ej. un 429) permite otra prueba
+    assert breaker.state == HALF_OPEN
@@ -0,0 +1,131 @@
+import concurrent.futures
+import os
+import time
+
+import pytest
+
+from document_jobs import JobQueue, JobStore, RetryJob
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "uploads"), max_attempts=2)
+
+
+def _run_queue(store, handler):
+    """Despacha una ronda de trabajos y espera a que terminen (sin hilo despachador)."""
+    queue = JobQueue(store, handler, workers=2)
+    queue._executor = concurrent.futures.ThreadPoolExecutor(max_workers=queue.workers)
+    try:
+        launched = queue.dispatch_once()
+    finally:
+        queue._executor.shutdown(wait=True)
+    return launched
+
+
+def test_job_lifecycle_from_queued_to_done(store):
+    job_id = store.create("examen.pdf", b"%PDF-1.4", {"mode": "full"})
+    job = store.get(job_id)
+    assert job["status"] == "queued" and job["progress"] == {"stage": "queued"}
+    assert os.path.exists(job["upload_path"])
+
+    claimed = store.claim("worker-a")
+    assert claimed["id"] == job_id and claimed["status"] == "running" and claimed["attempts"] == 1
+    assert store.claim("worker-b") is None
+
+    store.update_progress(job_id, {"stage": "running", "page": 3})
+    assert store.get(job_id)["progress"] == {"stage": "running", "page": 3}
+
+    store.finish(job_id, {"questions": []}, 200)
+    job = store.get(job_id)
+    assert job["status"] == "done" and job["http_status"] == 200 and job["result"] == {"questions": []}
+    assert job["progress"]["stage"] == "done"
+    assert job["upload_path"] is None and not os.path.exists(claimed["upload_path"])
+
+
+def test_finish_with_error_status(store):
+    job_id = store.create("examen.pdf", b"x")
+    store.claim("worker")
+    store.finish(job_id, {"error": "PDF ilegible"}, 422)
+    assert store.get(job_id)["status"] == "error"
+    assert store.stats() == {"queued": 0, "running": 0, "done": 0, "error": 1}
+
+
+def test_retry_delays_and_then_fails_after_max_attempts(store):
+    job_id = store.create("examen.pdf", b"x")
+    store.claim("worker")
+
+    store.retry(job_id, 60, "cuota agotada")
+    job = store.get(job_id)
+    assert job["status"] == "queued" and job["owner"] is None
+    assert job["progress"]["retry_after"] == 60
+    assert store.claim("worker") is None  # aún no disponible
+
+    store.retry(job_id, 0)  # mismo intento: solo adelanta la disponibilidad
+    assert store.claim("worker")["attempts"] == 2
+
+    store.retry(job_id, 0, "cuota agotada")
+    job = store.get(job_id)
+    assert job["status"] == "error" and job["http_status"] == 503
+    assert job["result"] == {"error": "cuota agotada", "attempts": 2}
+
+
+def test_requeue_stale_and_purge(store):
+    job_id = store.create("examen.pdf", b"x")
+    store.claim("worker")
+    assert store.requeue_stale(60) == 0
+
+    time.sleep(0.05)
+    assert store.requeue_stale(0.01) == 1
+    assert store.get(job_id)["status"] == "queued"
+
+    store.claim("worker")
+    store.finish(job_id, {}, 200)
+    assert store.purge(3600) == 0
+    time.sleep(0.05)
+    assert store.purge(0.01) == 1
+    assert store.get(job_id) is None
+
+
+def test_queue_runs_handler_and_reports_progress(store):
+    job_id = store.create("examen.pdf", b"x")
+    seen = []
+
+    def handler(job, report):
+        report(stage="extracting", pages=2)
+        seen.append(dict(store.get(job["id"])["progress"]))
+        return {"ok": True}, 200
+
+    assert _run_queue(store, handler) == 1
+    assert seen == [{"stage": "extracting", "pages": 2, "attempt": 1}]
+    job = store.get(job_id)
+    assert job["status"] == "done" and job["result"] == {"ok": True}
+
+
+def test_queue_requeues_on_retry_job_until_attempts_run_out(store):
+    job_id = store.create("examen.pdf", b"x")
+
+    def handler(job, report):
+        raise RetryJob(0, "cuota de Gemini agotada")
+
+    assert _run_queue(store, handler) == 1
+    job = store.get(job_id)
+    assert job["status"] == "queued" and job["attempts"] == 1
+
+    assert _run_queue(store, handler) == 1
+    job = store.get(job_id)
+    assert job["status"] == "error" and job["http_status"] == 503
+    assert job["result"]["error"] == "cuota de Gemini agotada"
+    assert _run_queue(store, handler) == 0
+
+
+def test_queue_records_unexpected_errors_as_500(store):
+    job_id = store.create("examen.pdf", b"x")
+
+    def handler(job, report):
+        raise ValueError("fallo inesperado")
+
+    _run_queue(store, handler)
+    job = store.get(job_id)
+    assert job["status"] == "error" and job["http_status"] == 500
+    assert job["result"]["type"] == "ValueError"
@@ -0,0 +1,137 @@
+"""document_text: PDF con el pool de procesos roto y presupuesto de caracteres en .docx."""
+import io
+import re
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import document_text
+
+
+def _pdf(pages):
+    """PDF mínimo con una línea de texto por página."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for n in range(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td (Pregunta {n + 1}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+    out, offsets = b"%PDF-1.4\n", []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+class BrokenPool:
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("un proceso terminó de forma abrupta")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_broken_pool_falls_back_to_serial_and_is_reset(monkeypatch):
+    pytest.importorskip("PyPDF2")
+    broken = BrokenPool()
+    monkeypatch.setattr(document_text, "_pool", broken)
+    monkeypatch.setattr(document_text, "_pool_pid", document_text.os.getpid())
+
+    extraction = document_text.extract_pdf_text(_pdf(4), workers=2, parallel_min_pages=2)
+
+    assert not extraction.parallel
+    assert [p.number for p in extraction.pages] == [1, 2, 3, 4]
+    assert "Pregunta 4" in extraction.text
+    assert broken.shut_down
+    assert document_text._pool is None
+
+
+def _docx(paragraphs):
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in paragraphs)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr(
+            "word/document.xml",
+            f'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>{body}</w:body></w:document>',
+        )
+    return buf.getvalue()
+
+
+def test_docx_stops_after_budget():
+    content = _docx([f"Pregunta {n}: enunciado de prueba" for n in range(1, 1001)])
+
+    full = document_text.extract_docx_text(content)
+    partial = document_text.extract_docx_text(content, max_chars=200)
+
+    assert 200 < len(partial) < 250
+    assert full.startswith(partial)
+    assert document_text.extract_docx_text(content, max_chars=len(full) + 1) == full
+
+
+def test_warm_pool_starts_processes_with_pypdf2(monkeypatch, tmp_path):
+    pytest.importorskip("PyPDF2")
+    path = tmp_path / "examen.pdf"
+    path.write_bytes(_pdf(2))
+    monkeypatch.setattr(document_text, "_pool", None)
+    document_text.warm_pool(1)
+    pool = document_text._pool
+    try:
+        assert pool is not None and len(pool._processes) == 1
+        pages = pool.submit(document_text._extract_pages, str(path), 0, 2).result(30)
+        assert [p.text for p in pages] == ["Pregunta 1", "Pregunta 2"]
+    finally:
+        pool.shutdown()
+
+
+def _questions(count, body="Texto del enunciado con sus opciones a) b) c) d)."):
+    return "\n".join(f"{n}. {body} ({n})" for n in range(1, count + 1))
+
+
+def test_split_keeps_each_question_whole():
+    text = _questions(40)
+    questions = [m.group(0) for m in re.finditer(r"^\d+\. .*$", text, re.MULTILINE)]
+
+    chunks = document_text.split_on_questions(text, max_chars=300)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    for question in questions:
+        assert sum(question in chunk for chunk in chunks) == 1
+    assert "\n".join(chunks) == text
+
+
+def test_split_recognizes_question_headers():
+    text = "Pregunta 1: ¿Cuánto es 2+2?\na) 3\nb) 4\n\nPregunta 2: ¿Capital de Colombia?\na) Bogotá\nb) Cali"
+
+    chunks = document_text.split_on_questions(text, max_chars=60)
+
+    assert [chunk.splitlines()[0] for chunk in chunks] == ["Pregunta 1: ¿Cuánto es 2+2?", "Pregunta 2: ¿Capital de Colombia?"]
+
+
+def test_split_cuts_inside_a_question_only_when_it_exceeds_the_limit():
+    long_question = "1. " + "\n".join(f"línea {n} del enunciado" for n in range(30))
+    text = long_question + "\n2. Pregunta corta"
+
+    chunks = document_text.split_on_questions(text, max_chars=100)
+
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert chunks[-1].endswith("2. Pregunta corta")
+    assert len(chunks) > 2
+
+
+def test_split_short_or_empty_text():
+    assert document_text.split_on_questions("  1. Única pregunta  ", max_chars=100) == ["1. Única pregunta"]
+    assert document_text.split_on_questions("   ", max_chars=100) == []
@@ -0,0 +1,49 @@
+"""La caché de respuestas de Gemini solo guarda respuestas que el llamador valida."""
+import pytest
+
+
+@pytest.fixture
+def gemini(api, monkeypatch):
+    """Sustituye la llamada real a Gemini por respuestas en cola y cuenta las llamadas."""
+    replies, calls = [], []
+
+    async def fake_request(prompt, temperature, max_tokens, max_retries):
+        calls.append(prompt)
+        return replies.pop(0)
+
+    monkeypatch.setattr(api.evaluator, "_request_gemini_uncached", fake_request)
+    api.evaluator.cache.clear()
+    return replies, calls
+
+
+def test_invalid_response_is_not_cached(api, gemini):
+    replies, calls = gemini
+    replies.extend(['{"labels": [', '{"labels": ["A"], "values": [1]}'])
+
+    first = api.evaluator._make_gemini_request("p-invalid", temperature=0.3, validate=api.is_json_response)
+    second = api.evaluator._make_gemini_request("p-invalid", temperature=0.3, validate=api.is_json_response)
+    third = api.evaluator._make_gemini_request("p-invalid", temperature=0.3, validate=api.is_json_response)
+
+    assert first == '{"labels": ['
+    assert second == third == '{"labels": ["A"], "values": [1]}'
+    assert len(calls) == 2
+
+
+def test_invalid_cached_entry_is_discarded(api, gemini):
+    replies, calls = gemini
+    key = api.evaluator.cache.make_key(api.evaluator.default_model, "p-stale", 0.3, 2000)
+    api.evaluator.cache.set(key, "no es json")
+    replies.append('{"ok": true}')
+
+    assert api.evaluator._make_gemini_request("p-stale", temperature=0.3, validate=api.is_json_response) == '{"ok": true}'
+    assert api.evaluator.cache.get(key) == '{"ok": true}'
+    assert len(calls) == 1
+
+
+def test_use_cache_false_skips_cache(api, gemini):
+    replies, calls = gemini
+    replies.extend(["uno", "dos"])
+
+    api.evaluator._make_gemini_request("p-nocache", temperature=0.3)
+    assert api.evaluator._make_gemini_request("p-nocache", temperature=0.3, use_cache=False) == "dos"
+    assert len(calls) == 2
@@ -0,0 +1,72 @@
+"""Cuota de Gemini: un 429 responde 503 + Retry-After sin bloquear el bucle compartido."""
+import threading
+import time
+
+import pytest
+
+from gemini_quota import QuotaTracker
+
+
+@pytest.fixture
+def quota(api, monkeypatch, tmp_path):
+    """QuotaTracker propio (en tmp_path) que anota en qué hilo se consulta SQLite."""
+    tracker = QuotaTracker(str(tmp_path / "quota.sqlite3"))
+    threads = []
+    for name in ("record_rate_limit", "retry_after"):
+        original = getattr(tracker, name)
+
+        def traced(*args, _original=original, **kwargs):
+            threads.append(threading.current_thread().name)
+            return _original(*args, **kwargs)
+
+        monkeypatch.setattr(tracker, name, traced)
+    monkeypatch.setattr(api.evaluator, "quota", tracker)
+    api.evaluator.cache.clear()
+    return tracker, threads
+
+
+@pytest.fixture
+def rate_limited(api, monkeypatch):
+    calls = []
+
+    async def generate(prompt, generation_config, on_latency=None):
+        calls.append(prompt)
+        raise Exception("429 Resource has been exhausted (e.g. check quota).")
+
+    monkeypatch.setattr(api.evaluator.async_client, "generate", generate)
+    return calls
+
+
+def test_rate_limit_returns_503_with_retry_after(client, quota, rate_limited):
+    tracker, threads = quota
+
+    started = time.perf_counter()
+    response = client.post("/api/chat", json={"message": "¿Qué es una función lineal?"})
+
+    assert time.perf_counter() - started < 2
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) == 10
+    assert response.get_json()["retry_after"] == 10
+    assert len(rate_limited) == 1  # un 429 no se reintenta en la misma petición
+    assert threads and "gemini-async-loop" not in threads
+
+
+def test_blocked_quota_fails_fast_without_calling_gemini(client, quota, rate_limited):
+    tracker, _ = quota
+    tracker.record_rate_limit(30)
+
+    response = client.post("/api/chat", json={"message": "hola"})
+
+    assert response.status_code == 503
+    assert 0 < float(response.headers["Retry-After"]) <= 30
+    assert rate_limited == []
+
+
+def test_backoff_grows_and_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "quota.sqlite3")
+    first, second = QuotaTracker(path), QuotaTracker(path)
+
+    assert first.record_rate_limit() == pytest.approx(10, abs=0.5)
+    assert second.record_rate_limit() == pytest.approx(20, abs=0.5)
+    assert QuotaTracker(path).retry_after() == pytest.approx(20, abs=1.5)  # un worker nuevo ve el bloqueo
+    assert second.stats()["recent_rate_limits"] == 2
@@ -0,0 +1,90 @@
+"""/generate-question con Gemini caído o incompleto: se completa con el banco de preguntas."""
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from question_bank import QuestionBank
+
+REQUEST = {"competencia": "Matemáticas", "dificultad": "medio", "num_questions": 3, "session_id": "s1"}
+
+
+def _block(n):
+    return (
+        f"Pregunta: ¿Cuál es el resultado de {n} + {n}?\n"
+        f"a) {n}\nb) {2 * n}\nc) {3 * n}\nd) {4 * n}\n"
+        "Respuesta correcta: b\n"
+        f"Explicación: {n} + {n} = {2 * n}."
+    )
+
+
+@pytest.fixture
+def bank(api, monkeypatch):
+    """Banco habilitado, sin hilo de recarga, con dos preguntas guardadas para REQUEST."""
+    bank = QuestionBank(lambda *args: [])
+    monkeypatch.setattr(bank, "start", lambda: None)
+    monkeypatch.setattr(api, "question_bank", bank)
+    monkeypatch.setattr(api, "QUESTION_BANK_ENABLED", True)
+    key = api._register_question_bucket(REQUEST["competencia"], REQUEST["dificultad"], True)
+    bank.add(key, [_block(100), _block(200)])
+    return bank
+
+
+@pytest.fixture
+def breaker(api, monkeypatch):
+    breaker = CircuitBreaker(min_calls=1, failure_rate=0.5, open_seconds=30)
+    monkeypatch.setattr(api.evaluator, "breaker", breaker)
+    return breaker
+
+
+def test_open_breaker_serves_banked_questions(client, bank, breaker):
+    breaker.record_failure()
+    assert breaker.is_open()
+
+    response = client.post("/generate-question", json=REQUEST)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body["items"]) == 2
+    assert body["from_bank"] is True and body["degraded"] is True
+
+
+def test_breaker_tripping_mid_generation_tops_up_from_bank(api, client, monkeypatch, bank, breaker):
+    calls = []
+
+    def fake_request(prompt, temperature=0.3, max_tokens=2000, **kwargs):
+        calls.append(prompt)
+        if len(calls) == 1:
+            return _block(1)  # 1 de 3: el reintento pide las 2 que faltan
+        breaker.record_failure()
+        raise CircuitOpenError(breaker.retry_after())
+
+    monkeypatch.setattr(api.evaluator, "_make_gemini_request", fake_request)
+
+    response = client.post("/generate-question", json=REQUEST)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [item["stem"] for item in body["items"]] == [
+        "¿Cuál es el resultado de 1 + 1?", "¿Cuál es el resultado de 100 + 100?", "¿Cuál es el resultado de 200 + 200?"
+    ]
+    assert body["from_bank"] is True
+    assert len(calls) == 2
+
+
+def test_incomplete_generation_is_served_partially(api, client, monkeypatch, breaker):
+    monkeypatch.setattr(api.evaluator, "_make_gemini_request", lambda *args, **kwargs: _block(7))
+
+    response = client.post("/generate-question", json=REQUEST)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body["items"]) == 1
+    assert body["degraded"] is True and body["from_bank"] is False
+
+
+def test_open_breaker_without_bank_returns_503(client, breaker):
+    breaker.record_failure()
+
+    response = client.post("/generate-question", json=REQUEST)
+
+    assert response.status_code == 503
+    assert 1 <= int(response.headers["Retry-After"]) <= 30
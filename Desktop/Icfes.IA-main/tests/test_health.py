@@ -0,0 +1,82 @@
+"""/health (liveness) frente a /ready (readiness con el estado de Gemini en caché)."""
+import pytest
+
+from circuit_breaker import CircuitBreaker
+from gemini_quota import QuotaTracker
+from upstream_health import UpstreamHealth
+
+
+@pytest.fixture
+def upstream(api, monkeypatch, tmp_path):
+    """Estado de Gemini, breaker y cuota propios; el sondeo cuenta sus llamadas."""
+    probes = []
+    health = UpstreamHealth(lambda: probes.append(1), interval=60, down_after=2)
+    monkeypatch.setattr(api.evaluator, "health", health)
+    monkeypatch.setattr(api.evaluator, "breaker", CircuitBreaker(min_calls=1, open_seconds=30))
+    monkeypatch.setattr(api.evaluator, "quota", QuotaTracker(str(tmp_path / "quota.sqlite3")))
+    return health, probes
+
+
+def test_health_never_touches_gemini(api, client, upstream, monkeypatch):
+    health, probes = upstream
+    health.record_failure("caído")
+    health.record_failure("caído")
+    api.evaluator.breaker.record_failure()
+    monkeypatch.setattr(api.evaluator, "_make_gemini_request", pytest.fail)
+
+    response = client.get("/health")
+
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "healthy"
+    assert probes == []
+
+
+def test_ready_reports_cached_upstream_state_without_probing(client, upstream):
+    health, probes = upstream
+    health.record_success()
+
+    body = client.get("/ready").get_json()
+
+    assert body["status"] == "ready" and body["ai_api"] == "connected"
+    assert probes == []
+
+
+@pytest.mark.parametrize("cause", ["down", "circuit", "quota"])
+def test_ready_is_degraded_but_200_by_default(api, client, upstream, cause):
+    health, _ = upstream
+    health.record_success()
+    if cause == "down":
+        health.record_failure("timeout")
+        health.record_failure("timeout")
+    elif cause == "circuit":
+        api.evaluator.breaker.record_failure()
+    else:
+        api.evaluator.quota.record_rate_limit(20)
+
+    response = client.get("/ready")
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["status"] == "degraded"
+    assert (body["circuit_state"] == "open") == (cause == "circuit")
+    assert (body["quota_retry_after"] > 0) == (cause == "quota")
+
+
+def test_ready_fails_when_degraded_in_strict_mode(api, client, upstream, monkeypatch):
+    health, _ = upstream
+    monkeypatch.setattr(api, "READINESS_FAIL_WHEN_DEGRADED", True)
+    health.record_failure("timeout")
+    health.record_failure("timeout")
+
+    assert client.get("/ready").status_code == 503
+    health.record_success()
+    assert client.get("/ready").status_code == 200
+
+
+def test_probe_skips_when_traffic_is_recent(upstream):
+    health, probes = upstream
+    health.probe_once()
+    assert probes == [1]
+    health.record_success()
+    health.probe_once()
+    assert probes == [1]
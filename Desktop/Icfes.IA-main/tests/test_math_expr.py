@@ -0,0 +1,65 @@
+"""math_expr: lista blanca del AST y NaN en asíntotas y fuera del dominio."""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sympy")
+
+from math_expr import MAX_EXPRESSION_LENGTH, UnsafeExpressionError, evaluate_samples, parse_expression  # noqa: E402
+
+
+@pytest.mark.parametrize("expr", [
+    "__import__('os').system('ls')",
+    "x.__class__",
+    "open('/etc/passwd')",
+    "[x for x in ()]",
+    "lambda: 1",
+    "x if x else 1",
+    "x < 1",
+    "y + 1",
+    "sin(x, 2)",
+    "sin(x=1)",
+    "'texto'",
+    "True",
+    "x % 2",
+    "x " + "+ x " * MAX_EXPRESSION_LENGTH,
+    "",
+])
+def test_non_whitelisted_expressions_are_rejected(expr):
+    with pytest.raises(UnsafeExpressionError):
+        parse_expression(expr)
+
+
+def test_syntax_error_is_value_error():
+    with pytest.raises(ValueError):
+        parse_expression("x +* 2")
+
+
+def test_whitelisted_expression_and_caret_power():
+    assert str(parse_expression("2*x^2 + sin(pi*x) - ln(e)")) == str(parse_expression("2*x**2 + sin(pi*x) - log(e)"))
+
+
+def test_tan_asymptotes_become_nan_instead_of_vertical_lines():
+    xs = np.linspace(-np.pi, np.pi, 501)
+    ys = evaluate_samples("tan(x)", xs)
+
+    for asymptote in (-np.pi / 2, np.pi / 2):
+        near = np.abs(xs - asymptote) < 0.02
+        assert np.isnan(ys[near]).any()
+    # Ningún par de muestras consecutivas une dos ramas (salto de +∞ a -∞)
+    both = np.isfinite(ys[:-1]) & np.isfinite(ys[1:])
+    crossing = both & (np.sign(ys[:-1]) != np.sign(ys[1:]))
+    assert (np.abs(np.diff(ys))[crossing] < 1).all()
+    assert np.isfinite(ys[np.abs(xs) < 1]).all()
+
+
+def test_values_outside_domain_are_nan():
+    xs = np.array([-4.0, -1.0, 0.0, 1.0, 4.0])
+    assert np.isnan(evaluate_samples("sqrt(x)", xs)[:2]).all()
+    assert evaluate_samples("sqrt(x)", xs)[-1] == pytest.approx(2)
+    assert np.isnan(evaluate_samples("1/x", xs)[2])
+    assert np.isnan(evaluate_samples("log(x)", xs)[:3]).all()
+
+
+def test_constant_expression_broadcasts():
+    xs = np.linspace(0, 1, 5)
+    assert evaluate_samples("3", xs).tolist() == [3.0] * 5
@@ -0,0 +1,73 @@
+"""Banco de preguntas: caducidad de buckets, historial de entregadas y métricas de recarga."""
+import time
+
+from question_bank import QuestionBank
+
+
+def _bank(**kwargs):
+    generated = []
+
+    def generate(competencia, dificultad, use_custom_knowledge, count):
+        generated.append(competencia)
+        return [f"{competencia} pregunta {time.perf_counter_ns()} {i}" for i in range(count)]
+
+    return QuestionBank(generate, low_water=1, target=2, batch_size=2, **kwargs), generated
+
+
+def test_idle_buckets_are_evicted_before_refill():
+    bank, generated = _bank(bucket_ttl=60)
+    idle = bank.register("Competencia inventada", "medio", None, False)
+    bank._buckets[idle].last_requested -= 120
+
+    assert bank.refill_once() is False
+    assert generated == []
+    assert bank.snapshot()["buckets"] == []
+    assert bank.stats["buckets_evicted"] == 1
+
+
+def test_pinned_buckets_never_expire():
+    bank, generated = _bank(bucket_ttl=60)
+    key = bank.register("Matemáticas", "medio", None, False, pinned=True)
+    bank._buckets[key].last_requested -= 120
+
+    assert bank.refill_once() is True
+    assert generated == ["Matemáticas"]
+
+
+def test_least_recently_used_buckets_over_limit_are_evicted():
+    bank, _ = _bank(bucket_ttl=3600, max_buckets=2)
+    for offset, competencia in enumerate(["A", "B", "C"]):
+        key = bank.register(competencia, "medio", None, False)
+        bank._buckets[key].last_requested -= 100 - offset
+
+    bank.refill_once()
+    assert sorted(b["competencia"] for b in bank.snapshot()["buckets"]) == ["B", "C"]
+
+
+def test_served_history_is_bounded_and_allows_old_questions_back():
+    bank, _ = _bank(served_history=2)
+    key = bank.register("Matemáticas", "medio", None, False)
+    blocks = [f"Pregunta {n}" for n in range(4)]
+
+    assert bank.add(key, blocks[:2]) == 2
+    assert bank.add(key, blocks[:1]) == 0  # ya está en el bucket
+    bank.take(key, 2)
+    assert bank.add(key, blocks[:2]) == 0  # entregadas hace poco
+    bank.add(key, blocks[2:])
+    bank.take(key, 2)
+
+    assert len(bank._buckets[key].served) == 2
+    assert bank.add(key, blocks[:1]) == 1  # salió del historial: puede volver a guardarse
+
+
+def test_refill_generations_are_tagged_in_metrics(api, client, monkeypatch):
+    block = "Pregunta: ¿2 + 2?\na) 3\nb) 4\nc) 5\nd) 6\nRespuesta correcta: b\nExplicación: Suma."
+    monkeypatch.setattr(api.evaluator, "_make_gemini_request", lambda *args, **kwargs: block)
+    monkeypatch.setattr(api, "_generation_metrics", {})
+
+    api._generate_question_blocks("Matemáticas", "medio", False, 1)
+    client.post("/generate-question", json={"competencia": "Matemáticas", "dificultad": "medio", "num_questions": 1})
+
+    metrics = {m["source"]: m for m in client.get("/generation-metrics").get_json()["metrics"]}
+    assert set(metrics) == {"user", "refill"}
+    assert metrics["user"]["generations"] == metrics["refill"]["generations"] == 1
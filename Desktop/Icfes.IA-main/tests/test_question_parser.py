@@ -0,0 +1,52 @@
+"""Parser de preguntas: bloques válidos, bloques mal formados y streaming cortado a mitad de pregunta."""
+from question_parser import ICFESQuestion, QuestionStreamParser, iter_streamed_questions, parse_question_block, parse_questions
+
+
+def _block(n, explanation=True):
+    text = (
+        f"Pregunta {n}: Si f(x) = {n}x + 1, ¿cuánto vale f(1)?\n"
+        f"a) {n}\nb) {n + 1}\nc) {n + 2}\nd) {n + 3}\n"
+        "Respuesta correcta: b\n"
+    )
+    return text + (f"Explicación: f(1) = {n} + 1 = {n + 1}.\n\n" if explanation else "")
+
+
+def test_block_is_parsed_into_a_typed_question():
+    question = parse_question_block("**Pregunta 1:** Texto previo\n" + _block(2).split("\n", 1)[1])
+
+    assert question == ICFESQuestion(
+        stem="Texto previo", options=("2", "3", "4", "5"), answer="b", explanation="f(1) = 2 + 1 = 3."
+    )
+    assert parse_question_block(question.to_text()) == question
+    assert question.to_dict()["options"] == {"a": "2", "b": "3", "c": "4", "d": "5"}
+
+
+def test_malformed_blocks_are_rejected_individually():
+    missing_option = _block(2).replace("c) 4\n", "")
+    repeated_option = _block(3).replace("c) 5", "b) 5")
+    questions, rejected = parse_questions(_block(1) + missing_option + repeated_option + _block(4, explanation=False))
+
+    assert [q.options[0] for q in questions] == ["1"]
+    assert rejected == 3
+
+
+def test_stream_cut_mid_question_only_yields_complete_blocks():
+    text = _block(1) + _block(2) + _block(3)
+    cut = text.index("c) 5")  # la tercera pregunta se corta en las opciones
+    chunks = [text[i:i + 7] for i in range(0, cut, 7)]
+    parser = QuestionStreamParser()
+
+    questions = list(iter_streamed_questions(chunks, parser))
+
+    assert [q.options[1] for q in questions] == ["2", "3"]
+    assert parser.rejected == 1
+
+
+def test_stream_emits_each_question_as_soon_as_it_is_complete():
+    parser = QuestionStreamParser()
+
+    assert parser.feed(_block(1)[:-2]) == []  # la explicación aún puede continuar
+    assert [q.options[0] for q in parser.feed("\n\n")] == ["1"]
+    assert parser.feed(_block(2)[:40]) == []
+    assert [q.options[0] for q in parser.feed(_block(2)[40:])] == ["2"]
+    assert parser.close() == []
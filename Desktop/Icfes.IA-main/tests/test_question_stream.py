@@ -0,0 +1,71 @@
+"""/generate-question/stream: eventos SSE cuando el streaming de Gemini se corta a mitad de pregunta."""
+import json
+
+import pytest
+
+REQUEST = {"competencia": "Matemáticas", "dificultad": "medio", "num_questions": 3}
+
+
+def _block(n):
+    return (
+        f"Pregunta: ¿Cuánto es {n} por 2?\n"
+        f"a) {n}\nb) {2 * n}\nc) {3 * n}\nd) {4 * n}\n"
+        "Respuesta correcta: b\n"
+        f"Explicación: {n} por 2 es {2 * n}.\n\n"
+    )
+
+
+def _events(response):
+    events = []
+    for raw in response.get_data(as_text=True).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in raw.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def gemini(api, monkeypatch):
+    topups = []
+    text = _block(1) + _block(2) + _block(3)
+    cut = text.index("c) 9")  # la tercera pregunta llega incompleta
+
+    def fake_stream(prompt, temperature=0.7, max_tokens=4096):
+        for i in range(0, cut, 11):
+            yield text[i:min(i + 11, cut)]
+
+    def fake_request(prompt, *args, **kwargs):
+        topups.append(prompt)
+        return _block(30)
+
+    monkeypatch.setattr(api.evaluator, "_stream_gemini_request", fake_stream)
+    monkeypatch.setattr(api.evaluator, "_make_gemini_request", fake_request)
+    return topups
+
+
+def test_cut_stream_emits_complete_questions_then_tops_up(client, gemini):
+    response = client.post("/generate-question/stream", json=REQUEST)
+
+    assert response.mimetype == "text/event-stream"
+    events = _events(response)
+    questions = [data for event, data in events if event == "question"]
+    assert [q["index"] for q in questions] == [0, 1, 2]
+    assert [q["item"]["options"]["b"] for q in questions] == ["2", "4", "60"]
+    assert len(gemini) == 1 and "EXACTAMENTE 1" in gemini[0]  # solo se pide la que falta
+
+    event, done = events[-1]
+    assert event == "done"
+    assert done["complete"] is True and done["count"] == 3 and done["rejected"] == 1
+
+
+def test_stream_error_is_reported_as_event(api, client, monkeypatch, gemini):
+    def broken_stream(prompt, temperature=0.7, max_tokens=4096):
+        yield _block(1)
+        raise RuntimeError("conexión cerrada")
+
+    monkeypatch.setattr(api.evaluator, "_stream_gemini_request", broken_stream)
+
+    events = _events(client.post("/generate-question/stream", json=REQUEST))
+
+    assert [event for event, _ in events] == ["question", "error", "question", "done"]
+    assert "conexión cerrada" in events[1][1]["error"]
+    assert events[-1][1]["complete"] is False  # la recarga pidió 2 y Gemini devolvió 1
@@ -0,0 +1,58 @@
+"""Perfiles de salida de los gráficos: resolve_output y validación en los endpoints."""
+import pytest
+
+from render_pool import MAX_DPI, MIN_DPI, figure_width_in, resolve_output
+
+
+@pytest.mark.parametrize("profile, expected", [
+    ("preview", ("png", 100)),
+    ("print", ("png", 300)),
+    ("PRINT", ("png", 300)),
+    ("svg", ("svg", 72)),
+    (None, ("png", 100)),
+])
+def test_profiles(profile, expected):
+    assert resolve_output("bar", profile=profile) == expected
+
+
+def test_width_px_is_converted_to_dpi():
+    fmt, dpi = resolve_output("geometry", {"figsize": [6, 6]}, width_px=1200)
+    assert (fmt, dpi) == ("png", 200)
+    assert resolve_output("bar", width_px=round(figure_width_in("bar") * 150))[1] == 150
+
+
+def test_dpi_is_clamped_and_svg_ignores_it():
+    assert resolve_output("bar", dpi=5)[1] == MIN_DPI
+    assert resolve_output("bar", dpi=5000)[1] == MAX_DPI
+    assert resolve_output("pie", fmt="svg", dpi=300) == ("svg", 72)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"profile": "poster"},
+    {"fmt": "jpg"},
+    {"dpi": "alto"},
+    {"width_px": "ancho"},
+])
+def test_invalid_output_raises(kwargs):
+    with pytest.raises(ValueError):
+        resolve_output("bar", **kwargs)
+
+
+@pytest.mark.parametrize("options", [{"profile": "poster"}, {"format": "gif"}, {"dpi": "alto"}, {"width_px": "ancho"}])
+def test_invalid_output_returns_400(client, options):
+    response = client.post("/generate-visual", json={"labels": ["A"], "values": [1], **options})
+
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_default_profile_and_print_profile(api, client, monkeypatch):
+    specs = []
+    original = api._render_chart_cached
+    monkeypatch.setattr(api, "_render_chart_cached", lambda spec: specs.append(spec) or original(spec))
+    payload = {"labels": ["A", "B"], "values": [3, 4], "response_mode": "url"}
+
+    client.post("/generate-visual", json=payload)
+    client.post("/generate-visual", json={**payload, "profile": "print"})
+
+    assert [spec["dpi"] for spec in specs] == [100, 300]
@@ -0,0 +1,118 @@
+"""
+upstream_health.py
+Estado en caché de la disponibilidad de Gemini para los endpoints de salud.
+
+El estado se alimenta de dos fuentes: el resultado de las peticiones reales
+(record_success / record_failure) y un sondeo ligero en segundo plano que solo
+se ejecuta cuando no ha habido tráfico reciente. Así /ready responde sin llamar
+a Gemini y sin gastar cuota de generación.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = "unknown"
+UP = "up"
+DOWN = "down"
+
+
+class UpstreamHealth:
+    """Último estado conocido del backend de IA, seguro entre hilos."""
+
+    def __init__(self, probe_fn: Optional[Callable[[], None]] = None, *, interval: float = 60.0, down_after: int = 3) -> None:
+        self.probe_fn = probe_fn  # lanza excepción si el backend no responde
+        self.interval = interval
+        self.down_after = max(1, int(down_after))
+        self.last_success: Optional[float] = None
+        self.last_failure: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_source: Optional[str] = None
+        self.consecutive_failures = 0
+        self.probes = 0
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    # ----------------------------
+    # Registro de resultados
+    # ----------------------------
+
+    def record_success(self, source: str = "traffic") -> None:
+        with self._lock:
+            self.last_success = time.time()
+            self.last_source = source
+            self.consecutive_failures = 0
+
+    def record_failure(self, error: object, source: str = "traffic") -> None:
+        with self._lock:
+            self.last_failure = time.time()
+            self.last_error = str(error)[:300]
+            self.last_source = source
+            self.consecutive_failures += 1
+
+    def last_checked(self) -> Optional[float]:
+        with self._lock:
+            return max(filter(None, (self.last_success, self.last_failure)), default=None)
+
+    def state(self) -> str:
+        with self._lock:
+            if self.last_success is None and self.last_failure is None:
+                return UNKNOWN
+            return DOWN if self.consecutive_failures >= self.down_after else UP
+
+    def snapshot(self) -> Dict[str, object]:
+        state = self.state()
+        with self._lock:
+            return {
+                "state": state,
+                "last_success": self.last_success,
+                "last_failure": self.last_failure,
+                "last_error": self.last_error,
+                "last_source": self.last_source,
+                "consecutive_failures": self.consecutive_failures,
+                "probe_interval_seconds": self.interval,
+                "probes": self.probes,
+            }
+
+    # ----------------------------
+    # Sondeo en segundo plano
+    # ----------------------------
+
+    def probe_once(self) -> None:
+        """Sondea el backend salvo que el tráfico real ya haya dado un resultado reciente."""
+        if self.probe_fn is None:
+            return
+        checked = self.last_checked()
+        if checked is not None and time.time() - checked < self.interval:
+            return
+        with self._lock:
+            self.probes += 1
+        try:
+            self.probe_fn()
+        except Exception as e:
+            logger.warning(f"Sondeo de Gemini fallido: {str(e)}")
+            self.record_failure(e, source="probe")
+        else:
+            self.record_success(source="probe")
+
+    def start(self) -> None:
+        """Arranca el hilo de sondeo (idempotente; desactivado con interval <= 0)."""
+        if self.probe_fn is None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name="upstream-health-probe", daemon=True)
+            self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.probe_once()
+            except Exception as e:  # pragma: no cover - el hilo nunca debe morir
+                logger.error(f"Error en hilo de sondeo de Gemini: {str(e)}")
+            time.sleep(self.interval)